@@ -0,0 +1,40 @@
+"""Add active_calls table for the shared session registry
+
+Revision ID: 7c3f9a1e2b4d
+Revises: 0b5e2a3d4c1f
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '7c3f9a1e2b4d'
+down_revision = '0b5e2a3d4c1f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Таблицу могла уже создать Base.metadata.create_all при импорте моделей
+    if sa.inspect(op.get_bind()).has_table('active_calls'):
+        return
+    # Аренды активных звонков: строка живёт, пока воркер обновляет heartbeat_at
+    op.create_table(
+        'active_calls',
+        sa.Column('call_id', sa.String(), primary_key=True),
+        sa.Column('assistant_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('worker_id', sa.String(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('heartbeat_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('ix_active_calls_user_heartbeat', 'active_calls', ['user_id', 'heartbeat_at'])
+    op.create_index('ix_active_calls_heartbeat', 'active_calls', ['heartbeat_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_active_calls_heartbeat', table_name='active_calls')
+    op.drop_index('ix_active_calls_user_heartbeat', table_name='active_calls')
+    op.drop_table('active_calls')
@@ -0,0 +1,44 @@
+"""Add call recording flag to assistants and recording link to conversations
+
+Revision ID: 9d4e2b7a1c6f
+Revises: 7c3f9a1e2b4d
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '9d4e2b7a1c6f'
+down_revision = '7c3f9a1e2b4d'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # Колонка уже есть, если таблицу создала Base.metadata.create_all по текущей модели
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column('assistant_configs', 'record_calls'):
+        op.add_column(
+            'assistant_configs',
+            sa.Column('record_calls', sa.Boolean(), server_default=sa.text('false'), nullable=False)
+        )
+    if not _has_column('conversations', 'recording_file_id'):
+        op.add_column(
+            'conversations',
+            sa.Column('recording_file_id', postgresql.UUID(as_uuid=True), nullable=True)
+        )
+        op.create_foreign_key(
+            'fk_conversations_recording_file_id', 'conversations', 'files',
+            ['recording_file_id'], ['id'], ondelete='SET NULL'
+        )
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_conversations_recording_file_id', 'conversations', type_='foreignkey')
+    op.drop_column('conversations', 'recording_file_id')
+    op.drop_column('assistant_configs', 'record_calls')
@@ -0,0 +1,37 @@
+"""Add embedding_cache table for the persistent embedding cache tier
+
+Revision ID: e3a7c5d19b08
+Revises: b6d2e9f4c713
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c5d19b08'
+down_revision = 'b6d2e9f4c713'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Таблицу могла уже создать Base.metadata.create_all при импорте моделей
+    if sa.inspect(op.get_bind()).has_table('embedding_cache'):
+        return
+    # Эмбеддинги по (модель, хэш нормализованного текста), общие для всех воркеров
+    op.create_table(
+        'embedding_cache',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('model', sa.String(100), nullable=False),
+        sa.Column('dimensions', sa.Integer(), nullable=False),
+        sa.Column('vector', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('used_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('ix_embedding_cache_used_at', 'embedding_cache', ['used_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_embedding_cache_used_at', table_name='embedding_cache')
+    op.drop_table('embedding_cache')
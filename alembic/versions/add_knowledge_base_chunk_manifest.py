@@ -0,0 +1,45 @@
+"""Add chunk manifest to pinecone_configs and diff counters to knowledge_base_jobs
+
+Revision ID: b6d2e9f4c713
+Revises: 4f8b1d6e3a92
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2e9f4c713'
+down_revision = '4f8b1d6e3a92'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # Колонка уже есть, если таблицу создала Base.metadata.create_all по текущей модели
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Хеши фрагментов, записанных в namespace: обновление пересчитывает только разницу
+    if not _has_column('pinecone_configs', 'chunk_manifest'):
+        op.add_column('pinecone_configs', sa.Column('chunk_manifest', sa.JSON(), nullable=True))
+    if not _has_column('knowledge_base_jobs', 'kept_chunks'):
+        op.add_column(
+            'knowledge_base_jobs',
+            sa.Column('kept_chunks', sa.Integer(), nullable=False, server_default='0')
+        )
+    if not _has_column('knowledge_base_jobs', 'deleted_chunks'):
+        op.add_column(
+            'knowledge_base_jobs',
+            sa.Column('deleted_chunks', sa.Integer(), nullable=False, server_default='0')
+        )
+    if not _has_column('knowledge_base_jobs', 'failed_chunk_ids'):
+        op.add_column('knowledge_base_jobs', sa.Column('failed_chunk_ids', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('knowledge_base_jobs', 'failed_chunk_ids')
+    op.drop_column('knowledge_base_jobs', 'deleted_chunks')
+    op.drop_column('knowledge_base_jobs', 'kept_chunks')
+    op.drop_column('pinecone_configs', 'chunk_manifest')
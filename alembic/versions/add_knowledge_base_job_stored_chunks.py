@@ -0,0 +1,30 @@
+"""Add stored_chunk_ids to knowledge_base_jobs
+
+Revision ID: c5f1a8e2d4b7
+Revises: e3a7c5d19b08
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c5f1a8e2d4b7'
+down_revision = 'e3a7c5d19b08'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # Колонка уже есть, если таблицу создала Base.metadata.create_all по текущей модели
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Фрагменты namespace на момент первого запуска задания: повторы считают ту же разницу
+    if not _has_column('knowledge_base_jobs', 'stored_chunk_ids'):
+        op.add_column('knowledge_base_jobs', sa.Column('stored_chunk_ids', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('knowledge_base_jobs', 'stored_chunk_ids')
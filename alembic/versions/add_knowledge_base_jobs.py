@@ -0,0 +1,57 @@
+"""Add knowledge_base_jobs table for background knowledge base builds
+
+Revision ID: 4f8b1d6e3a92
+Revises: 9d4e2b7a1c6f
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '4f8b1d6e3a92'
+down_revision = '9d4e2b7a1c6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Таблицу могла уже создать Base.metadata.create_all при импорте моделей
+    if sa.inspect(op.get_bind()).has_table('knowledge_base_jobs'):
+        return
+    # Очередь сборок баз знаний: задание в работе — аренда, продлеваемая heartbeat_at
+    op.create_table(
+        'knowledge_base_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('assistant_id', postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('assistant_configs.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('config_id', postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('pinecone_configs.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('namespace', sa.String(), nullable=False),
+        sa.Column('name', sa.String(100), nullable=True),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('total_chunks', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('processed_chunks', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('upserted_chunks', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed_chunks', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('worker_id', sa.String(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('retry_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_knowledge_base_jobs_status_created', 'knowledge_base_jobs', ['status', 'created_at'])
+    op.create_index('ix_knowledge_base_jobs_namespace', 'knowledge_base_jobs', ['namespace'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_knowledge_base_jobs_namespace', table_name='knowledge_base_jobs')
+    op.drop_index('ix_knowledge_base_jobs_status_created', table_name='knowledge_base_jobs')
+    op.drop_table('knowledge_base_jobs')
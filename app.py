@@ -96,6 +96,22 @@ async def startup_event():
     # Запустить подписочный фоновый процесс
     asyncio.create_task(start_subscription_checker())
     logger.info("Subscription checker started")
+
+    # Запустить пакетную запись диалогов (и дописать отложенное при недоступности БД)
+    from backend.services.conversation_writer import conversation_writer
+    conversation_writer.start()
+
+    # Запустить фоновую сборку баз знаний (и продолжить прерванные)
+    from backend.services.knowledge_base_jobs import knowledge_base_jobs
+    knowledge_base_jobs.start()
+
+    # Пул соединений эмбеддингов создаётся до звонков: загрузка TLS-контекста блокирует цикл
+    from backend.services.embedding_service import embedding_service
+    embedding_service.http_client()
+
+    # Слушать инвалидации кэша ассистентов от других воркеров
+    from backend.services.assistant_cache import assistant_cache
+    assistant_cache.start()
     logger.info("Application started successfully")
 
 # Главная страница (редирект на frontend)
@@ -107,4 +123,30 @@ async def root():
 # При выключении приложения
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Закрываем прогретые сессии OpenAI
+    from backend.websockets.session_pool import session_pool
+    await session_pool.close()
+    from backend.services.assistant_cache import assistant_cache
+    assistant_cache.close()
+    # Освобождаем аренды звонков этого воркера
+    from backend.websockets.session_registry import session_registry
+    await session_registry.close()
+    # Возвращаем незаконченные сборки баз знаний в очередь
+    from backend.services.knowledge_base_jobs import knowledge_base_jobs
+    await knowledge_base_jobs.close()
+    # Закрываем соединения клиентов эмбеддингов
+    from backend.services.embedding_service import embedding_service
+    await embedding_service.close()
+    # Закрываем пул соединений поиска по базам знаний
+    from backend.services.pinecone_query import pinecone_query
+    await pinecone_query.close()
+    # Дописываем кэш эмбеддингов в БД
+    from backend.services.embedding_cache import embedding_cache
+    await embedding_cache.close()
+    # Записываем накопленные диалоги до остановки пула потоков БД
+    from backend.services.conversation_writer import conversation_writer
+    await conversation_writer.close()
+    # Дожидаемся записей в БД, которые ещё в очереди
+    from backend.db.executor import shutdown_db_executor
+    shutdown_db_executor()
     logger.info("Application stopped")
@@ -15,6 +15,7 @@ from backend.models.user import User
 from backend.models.assistant import AssistantConfig
 from backend.services.user_service import UserService
 from backend.services.subscription_service import SubscriptionService
+from backend.services.assistant_cache import assistant_cache
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -273,6 +274,8 @@ async def update_user_subscription(
         user.is_trial = is_trial
         
         db.commit()
+        # Лимит одновременных звонков кэшируется вместе с конфигом ассистентов
+        assistant_cache.invalidate_user(user.id)
         
         # Log subscription change
         await SubscriptionService.log_subscription_event(
@@ -392,3 +395,156 @@ async def get_admin_statistics(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve admin statistics"
         )
+
+@router.get("/realtime/queues", response_model=Dict[str, Any])
+async def get_realtime_queue_metrics(
+    current_user: User = Depends(check_admin_access)
+):
+    """
+    Get send queue depth and counters for live realtime connections of this worker.
+    Admin only endpoint.
+    
+    Args:
+        current_user: Current authenticated admin user
+    
+    Returns:
+        Queue metrics per connection and direction
+    """
+    from backend.websockets.send_queue import get_queue_metrics
+    
+    queues = get_queue_metrics()
+    return {
+        "queues": queues,
+        "total": len(queues),
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+@router.get("/realtime/pool", response_model=Dict[str, Any])
+async def get_realtime_pool_metrics(
+    current_user: User = Depends(check_admin_access)
+):
+    """
+    Get warm realtime session pool size and hit/miss counters for this worker.
+    Admin only endpoint.
+    
+    Args:
+        current_user: Current authenticated admin user
+    
+    Returns:
+        Session pool metrics
+    """
+    from backend.websockets.session_pool import session_pool
+    
+    return {
+        "pool": session_pool.stats(),
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+
+@router.get("/realtime/assistant-cache", response_model=Dict[str, Any])
+async def get_assistant_cache_metrics(
+    current_user: User = Depends(check_admin_access)
+):
+    """
+    Get assistant config and compiled session cache counters for this worker.
+    Admin only endpoint.
+    
+    Args:
+        current_user: Current authenticated admin user
+    
+    Returns:
+        Assistant cache metrics
+    """
+    from backend.services.assistant_cache import assistant_cache
+    from backend.websockets.session_compiler import compiled_session_stats
+    
+    return {
+        "cache": assistant_cache.stats(),
+        "compiled_sessions": compiled_session_stats(),
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+
+@router.get("/embedding-cache", response_model=Dict[str, Any])
+async def get_embedding_cache_metrics(
+    current_user: User = Depends(check_admin_access)
+):
+    """
+    Get embedding cache hit rates, embedding API and knowledge base search
+    counters for this worker.
+    Admin only endpoint.
+    
+    Args:
+        current_user: Current authenticated admin user
+    
+    Returns:
+        Embedding cache metrics
+    """
+    from backend.services.embedding_cache import embedding_cache
+    from backend.services.embedding_service import embedding_service
+    from backend.services.pinecone_query import pinecone_query
+    
+    return {
+        "cache": embedding_cache.stats(),
+        "embeddings": embedding_service.stats(),
+        "pinecone_query": pinecone_query.stats(),
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+
+@router.get("/realtime/calls", response_model=Dict[str, Any])
+async def get_realtime_call_counts(
+    current_user: User = Depends(check_admin_access)
+):
+    """
+    Get live call counts per assistant and per user.
+    Covers the whole fleet with the postgres registry backend, this worker otherwise.
+    Admin only endpoint.
+    
+    Args:
+        current_user: Current authenticated admin user
+    
+    Returns:
+        Live call counts and registry counters
+    """
+    from backend.websockets.session_registry import session_registry
+    
+    try:
+        counts = await session_registry.counts()
+    except Exception as e:
+        logger.error(f"Error getting live call counts: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Session registry unavailable"
+        )
+    
+    return {
+        "calls": counts,
+        "registry": session_registry.stats(),
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+
+@router.get("/realtime/latency", response_model=Dict[str, Any])
+async def get_realtime_latency(
+    assistant_id: Optional[str] = Query(None, description="Only this assistant"),
+    current_user: User = Depends(check_admin_access)
+):
+    """
+    Get p50/p95/p99 of voice pipeline stages per assistant for this worker.
+    The "*" key aggregates all assistants.
+    Admin only endpoint.
+    
+    Args:
+        assistant_id: Optional assistant filter
+        current_user: Current authenticated admin user
+    
+    Returns:
+        Stage latency percentiles in milliseconds
+    """
+    from backend.websockets.latency import latency_stats
+    
+    return {
+        "latency": latency_stats.snapshot(assistant_id),
+        "timestamp": datetime.now(timezone.utc)
+    }
@@ -6,7 +6,6 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from sqlalchemy.sql import func
 
 from backend.core.logging import get_logger
 from backend.core.dependencies import get_current_user, check_subscription_active, check_assistant_limit
@@ -128,7 +127,8 @@ async def get_assistant(
             updated_at=assistant.updated_at,
             total_conversations=assistant.total_conversations,
             temperature=assistant.temperature,
-            max_tokens=assistant.max_tokens
+            max_tokens=assistant.max_tokens,
+            record_calls=assistant.record_calls
         )
     except HTTPException:
         raise
@@ -341,7 +341,7 @@ async def verify_google_sheet(
 
 # New endpoints for knowledge base management
 
-@router.post("/{assistant_id}/knowledge-base", response_model=Dict[str, Any])
+@router.post("/{assistant_id}/knowledge-base", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def create_or_update_knowledge_base(
     content_data: Dict[str, str],
     assistant_id: str = Path(..., description="Assistant ID"),
@@ -358,15 +358,14 @@ async def create_or_update_knowledge_base(
         db: Database session dependency
     
     Returns:
-        Status information including namespace
+        Queued build job with the namespace it builds
     """
     try:
         # Get assistant and verify ownership
         assistant = await AssistantService.get_assistant_by_id(db, assistant_id, str(current_user.id))
         
         # Check for API key
-        api_key = current_user.openai_api_key
-        if not api_key:
+        if not current_user.openai_api_key:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="OpenAI API key is required for knowledge base creation"
@@ -379,31 +378,20 @@ async def create_or_update_knowledge_base(
             PineconeConfig.assistant_id == assistant.id
         ).first()
         
-        existing_namespace = existing_config.namespace if existing_config else None
-        
-        # Create or update knowledge base in Pinecone
+        # Сборка идёт в фоне через общую очередь: одна база не собирается дважды одновременно
         from backend.services.pinecone_service import PineconeService
-        namespace, char_count = await PineconeService.create_or_update_knowledge_base(
-            content=content, 
-            api_key=api_key,
-            namespace=existing_namespace
+        from backend.services.knowledge_base_jobs import knowledge_base_jobs
+        PineconeService.check_content(content)
+        namespace = existing_config.namespace if existing_config else PineconeService.new_namespace()
+        job = await knowledge_base_jobs.enqueue(
+            user_id=current_user.id,
+            assistant_id=assistant.id,
+            namespace=namespace,
+            name=(existing_config.name if existing_config else None) or "Knowledge Base",
+            content=content,
+            config_id=existing_config.id if existing_config else None
         )
         
-        # Create or update PineconeConfig
-        if existing_config:
-            existing_config.namespace = namespace
-            existing_config.char_count = char_count
-            existing_config.content_preview = content[:200] + "..." if len(content) > 200 else content
-            existing_config.updated_at = func.now()
-        else:
-            new_config = PineconeConfig(
-                assistant_id=assistant.id,
-                namespace=namespace,
-                char_count=char_count,
-                content_preview=content[:200] + "..." if len(content) > 200 else content
-            )
-            db.add(new_config)
-        
         # Update system prompt to include knowledge base usage instruction
         system_prompt = assistant.system_prompt or ""
         kb_instruction = f"\nYou have access to a knowledge base with relevant information. When responding to questions, please utilize this additional context from the knowledge base (namespace: {namespace})."
@@ -411,14 +399,18 @@ async def create_or_update_knowledge_base(
         if "knowledge base" not in system_prompt.lower():
             system_prompt += kb_instruction
             assistant.system_prompt = system_prompt
-        
-        db.commit()
+            db.commit()
+            # Namespace берётся из промпта при сборке сессии — кэшированный конфиг устарел
+            from backend.services.assistant_cache import assistant_cache
+            assistant_cache.invalidate(assistant.id)
         
         return {
             "success": True,
             "namespace": namespace,
-            "char_count": char_count,
-            "message": "Knowledge base created/updated successfully"
+            "char_count": len(content),
+            "message": "Knowledge base build queued",
+            "job_id": job["id"],
+            "status": job["status"]
         }
         
     except HTTPException:
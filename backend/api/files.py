@@ -6,7 +6,7 @@ File API endpoints for WellcomeAI application.
 File API endpoints for WellcomeAI application.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Path, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -137,32 +137,48 @@ async def get_file(
 
 @router.get("/{file_id}/download")
 async def download_file(
+    request: Request,
     file_id: str = Path(..., description="The ID of the file to download"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Download a file.
+    Download a file. Supports single HTTP byte ranges (e.g. seeking in call recordings).
     
     Args:
+        request: Incoming request (for the Range header)
         file_id: File ID
         current_user: Current authenticated user
         db: Database session dependency
     
     Returns:
-        StreamingResponse with the file content
+        StreamingResponse with the file content (206 with Content-Range for range requests)
     """
     try:
         file_path, filename, content_type = await FileService.download_file(db, file_id, str(current_user.id))
+        file_size = os.path.getsize(file_path)
+        byte_range = FileService.parse_range(request.headers.get("range"), file_size)
         
-        def iterfile():
-            with open(file_path, mode="rb") as file_like:
-                yield from file_like
+        headers = {
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Accept-Ranges": "bytes"
+        }
+        if byte_range is None:
+            headers["Content-Length"] = str(file_size)
+            return StreamingResponse(
+                FileService.iter_file(file_path),
+                media_type=content_type,
+                headers=headers
+            )
         
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
         return StreamingResponse(
-            iterfile(),
+            FileService.iter_file(file_path, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
             media_type=content_type,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            headers=headers
         )
     except HTTPException:
         raise
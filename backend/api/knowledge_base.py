@@ -12,7 +12,6 @@ from backend.db.session import get_db
 from backend.models.user import User
 from backend.models.assistant import AssistantConfig
 from backend.models.pinecone_config import PineconeConfig
-from sqlalchemy.sql import func
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -124,7 +123,7 @@ async def get_all_knowledge_bases(
             detail=f"Failed to get knowledge bases: {str(e)}"
         )
 
-@router.post("/", response_model=Dict[str, Any])
+@router.post("/", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def create_or_update_knowledge_base(
     content_data: Dict[str, str],
     current_user: User = Depends(get_current_user),
@@ -139,7 +138,7 @@ async def create_or_update_knowledge_base(
         db: Database session dependency
     
     Returns:
-        Status information including namespace
+        Queued build job with the namespace it builds
     """
     try:
         # Check for API key
@@ -173,60 +172,40 @@ async def create_or_update_knowledge_base(
                 PineconeConfig.assistant_id.in_(assistant_ids)
             ).first()
         
-        existing_namespace = existing_config.namespace if existing_config else None
-        
-        # Create or update knowledge base in Pinecone
+        # Сборка идёт в фоне; запись базы знаний создаётся или обновляется по её завершении
         from backend.services.pinecone_service import PineconeService
-        namespace, char_count = await PineconeService.create_or_update_knowledge_base(
-            content=content, 
-            api_key=api_key,
-            namespace=existing_namespace
+        from backend.services.knowledge_base_jobs import knowledge_base_jobs
+        PineconeService.check_content(content)
+        job = await knowledge_base_jobs.enqueue(
+            user_id=current_user.id,
+            assistant_id=existing_config.assistant_id if existing_config else assistant_ids[0],
+            namespace=existing_config.namespace if existing_config else PineconeService.new_namespace(),
+            name=name,
+            content=content,
+            config_id=existing_config.id if existing_config else None
         )
         
-        # Create or update PineconeConfig
-        if existing_config:
-            existing_config.namespace = namespace
-            existing_config.char_count = char_count
-            existing_config.content_preview = content[:200] + "..." if len(content) > 200 else content
-            existing_config.full_content = content
-            existing_config.name = name
-            existing_config.updated_at = func.now()
-        else:
-            # Берем первого ассистента пользователя для привязки
-            assistant_id = assistant_ids[0]
-            
-            new_config = PineconeConfig(
-                assistant_id=assistant_id,
-                namespace=namespace,
-                char_count=char_count,
-                content_preview=content[:200] + "..." if len(content) > 200 else content,
-                full_content=content,
-                name=name
-            )
-            db.add(new_config)
-        
-        db.commit()
-        
         return {
             "success": True,
-            "namespace": namespace,
-            "char_count": char_count,
-            "message": "Knowledge base created/updated successfully",
-            "id": str(existing_config.id) if existing_config else str(new_config.id),
-            "name": name
+            "namespace": job["namespace"],
+            "char_count": len(content),
+            "message": "Knowledge base build queued",
+            "id": str(existing_config.id) if existing_config else None,
+            "name": name,
+            "job_id": job["id"],
+            "status": job["status"]
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         logger.error(f"Error creating/updating knowledge base: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create/update knowledge base: {str(e)}"
         )
 
-@router.post("/new", response_model=Dict[str, Any])
+@router.post("/new", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def create_new_knowledge_base(
     content_data: Dict[str, str],
     current_user: User = Depends(get_current_user),
@@ -241,7 +220,7 @@ async def create_new_knowledge_base(
         db: Database session dependency
     
     Returns:
-        Status information including namespace
+        Queued build job with the namespace it builds
     """
     try:
         # Check for API key
@@ -268,42 +247,32 @@ async def create_new_knowledge_base(
                 detail="Необходимо сначала создать ассистента"
             )
         
-        # Create new knowledge base in Pinecone with fresh namespace
+        # Новая база знаний со свежим namespace; запись появится по завершении сборки
         from backend.services.pinecone_service import PineconeService
-        namespace, char_count = await PineconeService.create_or_update_knowledge_base(
-            content=content, 
-            api_key=api_key,
-            namespace=None  # Всегда передаем None, чтобы создать новую БЗ
+        from backend.services.knowledge_base_jobs import knowledge_base_jobs
+        PineconeService.check_content(content)
+        job = await knowledge_base_jobs.enqueue(
+            user_id=current_user.id,
+            assistant_id=assistant_ids[0],  # Берем первого ассистента пользователя для привязки
+            namespace=PineconeService.new_namespace(),
+            name=name,
+            content=content
         )
         
-        # Берем первого ассистента пользователя для привязки
-        assistant_id = assistant_ids[0]
-        
-        # Create new PineconeConfig
-        new_config = PineconeConfig(
-            assistant_id=assistant_id,
-            namespace=namespace,
-            char_count=char_count,
-            content_preview=content[:200] + "..." if len(content) > 200 else content,
-            full_content=content,
-            name=name
-        )
-        db.add(new_config)
-        db.commit()
-        
         return {
             "success": True,
-            "namespace": namespace,
-            "char_count": char_count,
-            "message": "New knowledge base created successfully",
-            "id": str(new_config.id),
-            "name": name
+            "namespace": job["namespace"],
+            "char_count": len(content),
+            "message": "Knowledge base build queued",
+            "id": None,
+            "name": name,
+            "job_id": job["id"],
+            "status": job["status"]
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         logger.error(f"Error creating new knowledge base: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -345,7 +314,9 @@ async def delete_knowledge_base(
                 "message": "No knowledge base found for this user"
             }
         
-        # Delete from Pinecone
+        # Stop pending builds, then delete from Pinecone
+        from backend.services.knowledge_base_jobs import knowledge_base_jobs
+        await knowledge_base_jobs.cancel(config.namespace)
         from backend.services.pinecone_service import PineconeService
         await PineconeService.delete_knowledge_base(config.namespace)
         
@@ -366,6 +337,30 @@ async def delete_knowledge_base(
             detail=f"Failed to delete knowledge base: {str(e)}"
         )
 
+@router.get("/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_knowledge_base_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get state and chunk progress of a knowledge base build
+    
+    Args:
+        job_id: Build job ID returned by the create/update endpoints
+        current_user: Current authenticated user
+    
+    Returns:
+        Job status: queued, running, failed or done, with chunk counters
+    """
+    from backend.services.knowledge_base_jobs import job_status, knowledge_base_jobs
+    job = await knowledge_base_jobs.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Knowledge base job not found"
+        )
+    return job_status(job)
+
 @router.get("/{kb_id}/content", response_model=Dict[str, Any])
 async def get_knowledge_base_content(
     kb_id: str,
@@ -419,7 +414,7 @@ async def get_knowledge_base_content(
             detail=f"Failed to get knowledge base content: {str(e)}"
         )
 
-@router.put("/{kb_id}", response_model=Dict[str, Any])
+@router.put("/{kb_id}", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def update_knowledge_base(
     kb_id: str,
     content_data: Dict[str, str],
@@ -436,7 +431,7 @@ async def update_knowledge_base(
         db: Database session dependency
     
     Returns:
-        Status information
+        Queued build job
     """
     try:
         config = db.query(PineconeConfig).filter(PineconeConfig.id == kb_id).first()
@@ -470,36 +465,32 @@ async def update_knowledge_base(
                 detail="OpenAI API key is required for knowledge base creation"
             )
         
-        # Update embeddings in Pinecone
+        # Пересборка в фоне; запись обновится по её завершении
         from backend.services.pinecone_service import PineconeService
-        namespace, char_count = await PineconeService.create_or_update_knowledge_base(
-            content=content, 
-            api_key=api_key,
-            namespace=config.namespace
+        from backend.services.knowledge_base_jobs import knowledge_base_jobs
+        PineconeService.check_content(content)
+        job = await knowledge_base_jobs.enqueue(
+            user_id=current_user.id,
+            assistant_id=config.assistant_id,
+            namespace=config.namespace,
+            name=name,
+            content=content,
+            config_id=config.id
         )
         
-        # Update database record
-        config.namespace = namespace
-        config.char_count = char_count
-        config.content_preview = content[:200] + "..." if len(content) > 200 else content
-        config.full_content = content
-        config.name = name
-        config.updated_at = func.now()
-        
-        db.commit()
-        
         return {
             "success": True,
-            "namespace": namespace,
-            "char_count": char_count,
-            "message": "Knowledge base updated successfully",
+            "namespace": config.namespace,
+            "char_count": len(content),
+            "message": "Knowledge base build queued",
             "id": str(config.id),
-            "name": name
+            "name": name,
+            "job_id": job["id"],
+            "status": job["status"]
         }
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         logger.error(f"Error updating knowledge base: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -544,7 +535,9 @@ async def delete_specific_knowledge_base(
                 detail="Not authorized to delete this knowledge base"
             )
             
-        # Delete from Pinecone
+        # Stop pending builds, then delete from Pinecone
+        from backend.services.knowledge_base_jobs import knowledge_base_jobs
+        await knowledge_base_jobs.cancel(config.namespace)
         from backend.services.pinecone_service import PineconeService
         await PineconeService.delete_knowledge_base(config.namespace)
         
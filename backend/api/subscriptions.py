@@ -15,6 +15,7 @@ from backend.models.user import User
 from backend.models.assistant import AssistantConfig
 from backend.models.subscription import SubscriptionPlan
 from backend.schemas.subscription import UserSubscriptionInfo
+from backend.services.assistant_cache import assistant_cache
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -351,6 +352,8 @@ async def subscribe_to_plan(
             current_user.subscription_plan_id = plan.id
         
         db.commit()
+        # Лимит одновременных звонков кэшируется вместе с конфигом ассистентов
+        assistant_cache.invalidate_user(current_user.id)
         
         # Log subscription change
         from backend.services.subscription_service import SubscriptionService
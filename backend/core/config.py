@@ -27,6 +27,10 @@ class Settings(BaseSettings):
     
     # Database settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))  # threads for blocking DB calls
+    CONVERSATION_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("CONVERSATION_FLUSH_INTERVAL_SECONDS", "2"))
+    CONVERSATION_FLUSH_BATCH_SIZE: int = int(os.getenv("CONVERSATION_FLUSH_BATCH_SIZE", "200"))
+    CONVERSATION_SPOOL_PATH: str = os.getenv("CONVERSATION_SPOOL_PATH", os.path.join(os.getcwd(), "data", "conversation_spool.jsonl"))
     
     # Authentication and security
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "change-this-in-production")
@@ -45,11 +49,94 @@ class Settings(BaseSettings):
     WS_PING_TIMEOUT: int = 60   # seconds
     WS_CLOSE_TIMEOUT: int = 30  # seconds
     WS_MAX_MSG_SIZE: int = 15 * 1024 * 1024  # 15MB
-    MAX_RECONNECT_ATTEMPTS: int = 5
+    MAX_RECONNECT_ATTEMPTS: int = int(os.getenv("MAX_RECONNECT_ATTEMPTS", "5"))
+    REALTIME_RECONNECT_BASE_MS: int = int(os.getenv("REALTIME_RECONNECT_BASE_MS", "250"))  # backoff base
+    REALTIME_RECONNECT_MAX_MS: int = int(os.getenv("REALTIME_RECONNECT_MAX_MS", "4000"))  # backoff cap
+    REALTIME_RESUME_MAX_ITEMS: int = int(os.getenv("REALTIME_RESUME_MAX_ITEMS", "40"))  # messages replayed on reconnect
+    REALTIME_RESUME_MAX_CHARS: int = int(os.getenv("REALTIME_RESUME_MAX_CHARS", "2000"))  # per replayed message
+    WS_AUDIO_FRAME_MS: int = int(os.getenv("WS_AUDIO_FRAME_MS", "20"))  # PCM frame size in binary transport
+    WS_ACK_INTERVAL_MS: int = int(os.getenv("WS_ACK_INTERVAL_MS", "500"))  # window for cumulative acks
+    WS_ACK_INTERVAL_BYTES: int = int(os.getenv("WS_ACK_INTERVAL_BYTES", "48000"))  # ~1s of 24kHz PCM16
+    WS_SEND_QUEUE_AUDIO_MAX: int = int(os.getenv("WS_SEND_QUEUE_AUDIO_MAX", "200"))  # ~4s of 20ms frames
+    WS_SEND_QUEUE_CONTROL_MAX: int = int(os.getenv("WS_SEND_QUEUE_CONTROL_MAX", "500"))
     
+    # Realtime session pool settings
+    REALTIME_POOL_ENABLED: bool = os.getenv("REALTIME_POOL_ENABLED", "False") == "True"
+    REALTIME_POOL_TTL_SECONDS: int = int(os.getenv("REALTIME_POOL_TTL_SECONDS", "120"))
+    REALTIME_POOL_MAX_PER_KEY: int = int(os.getenv("REALTIME_POOL_MAX_PER_KEY", "4"))
+    REALTIME_POOL_SIZE_PER_ASSISTANT: int = int(os.getenv("REALTIME_POOL_SIZE_PER_ASSISTANT", "1"))
+
+    # Assistant config cache settings
+    ASSISTANT_CACHE_TTL_SECONDS: int = int(os.getenv("ASSISTANT_CACHE_TTL_SECONDS", "300"))
+    ASSISTANT_CACHE_MAX_SIZE: int = int(os.getenv("ASSISTANT_CACHE_MAX_SIZE", "1000"))
+    ASSISTANT_CACHE_CHANNEL: str = os.getenv("ASSISTANT_CACHE_CHANNEL", "local")  # local | postgres (multi-worker)
+
+    # Live call registry and concurrent-call limits per plan (0 = unlimited)
+    SESSION_REGISTRY_BACKEND: str = os.getenv("SESSION_REGISTRY_BACKEND", "memory")  # memory | postgres (multi-worker)
+    SESSION_REGISTRY_TTL_SECONDS: int = int(os.getenv("SESSION_REGISTRY_TTL_SECONDS", "60"))  # lease of a call without heartbeat
+    CONCURRENT_CALLS_FREE: int = int(os.getenv("CONCURRENT_CALLS_FREE", "2"))
+    CONCURRENT_CALLS_PAID: int = int(os.getenv("CONCURRENT_CALLS_PAID", "10"))
+    CONCURRENT_CALLS_ADMIN: int = int(os.getenv("CONCURRENT_CALLS_ADMIN", "0"))
+
+    # Latency tracing
+    LATENCY_HISTOGRAM_SIZE: int = int(os.getenv("LATENCY_HISTOGRAM_SIZE", "2048"))  # samples kept per stage and assistant
+    LATENCY_AUDIO_SAMPLE_EVERY: int = int(os.getenv("LATENCY_AUDIO_SAMPLE_EVERY", "10"))  # sample every Nth audio frame
+    LATENCY_MAX_ASSISTANTS: int = int(os.getenv("LATENCY_MAX_ASSISTANTS", "100"))  # assistants with histograms, least recently active dropped first
+
     # Audio settings
     DEFAULT_VOICE: str = "alloy"
     AVAILABLE_VOICES: list = ["alloy", "ash", "ballad", "coral", "echo", "sage", "shimmer", "verse"]
+
+    # Server-side VAD before forwarding client audio to OpenAI
+    AUDIO_VAD_ENABLED: bool = os.getenv("AUDIO_VAD_ENABLED", "True") == "True"
+    AUDIO_VAD_THRESHOLD_DBFS: float = float(os.getenv("AUDIO_VAD_THRESHOLD_DBFS", "-45"))  # frame RMS counted as speech
+    AUDIO_VAD_FRAME_MS: int = int(os.getenv("AUDIO_VAD_FRAME_MS", "10"))
+    AUDIO_VAD_MIN_SPEECH_MS: int = int(os.getenv("AUDIO_VAD_MIN_SPEECH_MS", "30"))  # shorter bursts (clicks) are ignored
+    AUDIO_VAD_HANGOVER_MS: int = int(os.getenv("AUDIO_VAD_HANGOVER_MS", "600"))  # must exceed server VAD silence_duration_ms
+    AUDIO_VAD_PREFIX_MS: int = int(os.getenv("AUDIO_VAD_PREFIX_MS", "300"))  # held audio released before speech
+    BARGE_IN_ENABLED: bool = os.getenv("BARGE_IN_ENABLED", "True") == "True"  # stop playback when the caller talks over it
+    AUDIO_RESAMPLER_TAPS: int = int(os.getenv("AUDIO_RESAMPLER_TAPS", "32"))  # FIR taps per polyphase branch
+
+    # Function calls during a live call
+    FUNCTION_CALL_TIMEOUT_SECONDS: float = float(os.getenv("FUNCTION_CALL_TIMEOUT_SECONDS", "15"))  # default per function
+    FUNCTION_CALL_MAX_CONCURRENCY: int = int(os.getenv("FUNCTION_CALL_MAX_CONCURRENCY", "0"))  # per function and worker, 0 = unlimited
+    FUNCTION_CALLS_PER_SESSION: int = int(os.getenv("FUNCTION_CALLS_PER_SESSION", "4"))  # running at once in one call
+
+    # Knowledge base embeddings
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_API_BASE: Optional[str] = os.getenv("EMBEDDING_API_BASE")  # OpenAI-compatible endpoint, default api.openai.com
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # inputs per request
+    EMBEDDING_BATCH_MAX_CHARS: int = int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", "100000"))  # keeps requests under the token limit
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))  # requests in flight per API key
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+    EMBEDDING_REQUEST_TIMEOUT_SECONDS: float = float(os.getenv("EMBEDDING_REQUEST_TIMEOUT_SECONDS", "60"))
+    PINECONE_UPSERT_BATCH_SIZE: int = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", "100"))
+
+    # Embedding cache: (model, normalized text hash) -> float32 vector
+    EMBEDDING_CACHE_MEMORY_MB: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64"))  # in-process LRU tier, 0 = off
+    EMBEDDING_CACHE_DB_ENABLED: bool = os.getenv("EMBEDDING_CACHE_DB_ENABLED", "True") == "True"  # embedding_cache table shared by workers
+    EMBEDDING_CACHE_DB_MAX_ROWS: int = int(os.getenv("EMBEDDING_CACHE_DB_MAX_ROWS", "200000"))  # least recently used rows above this are pruned
+    EMBEDDING_CACHE_PRUNE_SECONDS: int = int(os.getenv("EMBEDDING_CACHE_PRUNE_SECONDS", "600"))
+
+    # Knowledge base search during calls (search_pinecone)
+    PINECONE_INDEX_HOST: str = os.getenv("PINECONE_INDEX_HOST", "https://voicufi-gpr1sqd.svc.aped-4627-b74a.pinecone.io")
+    PINECONE_HTTP_POOL_SIZE: int = int(os.getenv("PINECONE_HTTP_POOL_SIZE", "32"))  # keep-alive connections per worker
+    PINECONE_QUERY_TIMEOUT_SECONDS: float = float(os.getenv("PINECONE_QUERY_TIMEOUT_SECONDS", "3"))
+    PINECONE_SEARCH_BUDGET_SECONDS: float = float(os.getenv("PINECONE_SEARCH_BUDGET_SECONDS", "5"))  # query embedding + Pinecone query
+
+    # Knowledge base build jobs
+    KB_JOB_WORKERS: int = int(os.getenv("KB_JOB_WORKERS", "2"))  # jobs built at once by one worker process
+    KB_JOB_EMBEDDING_CONCURRENCY: int = int(os.getenv("KB_JOB_EMBEDDING_CONCURRENCY", "8"))  # embedding requests in flight across all jobs of a worker
+    KB_JOB_CHECKPOINT_CHUNKS: int = int(os.getenv("KB_JOB_CHECKPOINT_CHUNKS", "200"))  # chunks between durable checkpoints
+    KB_JOB_LEASE_SECONDS: int = int(os.getenv("KB_JOB_LEASE_SECONDS", "30"))  # running job without heartbeat is taken over
+    KB_JOB_POLL_SECONDS: float = float(os.getenv("KB_JOB_POLL_SECONDS", "5"))
+    KB_JOB_MAX_ATTEMPTS: int = int(os.getenv("KB_JOB_MAX_ATTEMPTS", "3"))
+    KB_JOB_RETRY_SECONDS: int = int(os.getenv("KB_JOB_RETRY_SECONDS", "30"))  # doubled after every failed attempt
+
+    # Call recording (enabled per assistant)
+    CALL_RECORDING_LAYOUT: str = os.getenv("CALL_RECORDING_LAYOUT", "stereo")  # stereo (caller left, assistant right) | mono
+    CALL_RECORDING_BLOCK_MS: int = int(os.getenv("CALL_RECORDING_BLOCK_MS", "250"))  # interval between disk writes
+    CALL_RECORDING_MAX_BACKLOG_SECONDS: int = int(os.getenv("CALL_RECORDING_MAX_BACKLOG_SECONDS", "30"))  # per direction
     
     # Path settings
     STATIC_DIR: str = os.path.join(os.getcwd(), "static")
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from backend.db.session import SessionLocal
 from backend.models.user import User
+from backend.services.assistant_cache import assistant_cache
 from backend.core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -64,6 +65,9 @@ async def check_expired_subscriptions():
             logger.info(f"Subscription expired for user {user.id}, email: {user.email}")
             
         db.commit()
+        # Лимит одновременных звонков кэшируется вместе с конфигом ассистентов
+        for user in actual_expired:
+            assistant_cache.invalidate_user(user.id)
         logger.info(f"Updated {len(actual_expired)} expired subscriptions")
         
         # Check for subscriptions that are about to expire and send notifications
@@ -0,0 +1,97 @@
+"""
+Dedicated thread pool for blocking database work.
+Keeps synchronous SQLAlchemy calls off the event loop in the realtime path.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide DB executor, creating it on first use
+
+    Returns:
+        ThreadPoolExecutor reserved for database calls
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.DB_EXECUTOR_WORKERS,
+            thread_name_prefix="db-executor"
+        )
+        logger.info(f"DB executor started with {settings.DB_EXECUTOR_WORKERS} workers")
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking callable in the DB executor
+
+    Args:
+        fn: Callable to run
+        *args: Positional arguments for fn
+        **kwargs: Keyword arguments for fn
+
+    Returns:
+        Result of fn
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def _call_with_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # Импорт здесь: сессия создаётся в потоке исполнителя и только в нём используется
+    from backend.db.session import SessionLocal
+
+    db: Session = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_in_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run fn(db, *args, **kwargs) in the DB executor with its own short-lived session.
+    The callable is responsible for committing; the session is rolled back on error and always closed.
+
+    Args:
+        fn: Callable taking a Session as first argument
+        *args: Positional arguments for fn
+        **kwargs: Keyword arguments for fn
+
+    Returns:
+        Result of fn
+    """
+    return await run_blocking(_call_with_session, fn, *args, **kwargs)
+
+
+def shutdown_db_executor(wait: bool = True) -> None:
+    """
+    Stop the DB executor, waiting for queued work by default
+
+    Args:
+        wait: Block until pending calls complete
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+        logger.info("DB executor stopped")
@@ -9,6 +9,7 @@ from backend.functions.registry import (
     get_function_definitions,
     get_enabled_functions,
     execute_function,
+    get_function_limits,
     discover_functions
 )
 
@@ -22,5 +23,6 @@ __all__ = [
     "get_function_definitions",
     "get_enabled_functions", 
     "execute_function",
+    "get_function_limits",
     "discover_functions"
 ]
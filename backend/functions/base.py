@@ -4,6 +4,8 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, List
 
+from backend.core.config import settings
+
 class FunctionBase(ABC):
     """Базовый класс для всех функций"""
     
@@ -34,6 +36,16 @@ class FunctionBase(ABC):
             "parameters": cls.get_parameters()
         }
         
+    @classmethod
+    def get_timeout(cls) -> float:
+        """Возвращает максимальное время выполнения функции в секундах"""
+        return settings.FUNCTION_CALL_TIMEOUT_SECONDS
+        
+    @classmethod
+    def get_max_concurrency(cls) -> int:
+        """Возвращает максимум одновременных вызовов функции в процессе (0 — без ограничений)"""
+        return settings.FUNCTION_CALL_MAX_CONCURRENCY
+        
     @staticmethod
     @abstractmethod
     async def execute(arguments: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -6,7 +6,7 @@ import inspect
 import os
 import pkgutil
 import re
-from typing import Dict, Any, List, Type, Optional
+from typing import Dict, Any, List, Type, Optional, Tuple
 
 from backend.core.logging import get_logger
 from backend.functions.base import FunctionBase
@@ -63,6 +63,13 @@ class FunctionRegistry:
                 
         return result
         
+    def get_limits(self, name: str) -> Tuple[float, int]:
+        """Возвращает таймаут и лимит одновременных вызовов функции"""
+        function_class = self.get_function(name)
+        if not function_class:
+            return FunctionBase.get_timeout(), FunctionBase.get_max_concurrency()
+        return function_class.get_timeout(), function_class.get_max_concurrency()
+        
     async def execute_function(
         self, 
         name: str, 
@@ -166,6 +173,10 @@ async def execute_function(
     """Выполняет функцию с заданными аргументами"""
     return await registry.execute_function(name, arguments, context)
     
+def get_function_limits(name: str) -> Tuple[float, int]:
+    """Возвращает таймаут и лимит одновременных вызовов функции"""
+    return registry.get_limits(name)
+    
 def discover_functions():
     """Обнаруживает и загружает все функции в пакете backend.functions"""
     registry.discover_functions()
@@ -1,15 +1,24 @@
 """
 Функция для поиска в векторной базе данных Pinecone.
+Все сетевые вызовы асинхронные и укладываются в общий бюджет времени,
+чтобы поиск во время звонка не блокировал event loop.
 """
+import asyncio
 import os
-import json
 import re
-import requests
-from typing import Dict, Any, Optional, List
+import time
+from typing import Dict, Any, Optional
 
+import openai
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
 from backend.core.logging import get_logger
+from backend.db.executor import run_in_session
 from backend.functions.base import FunctionBase
 from backend.functions.registry import register_function
+from backend.services.embedding_service import embedding_service
+from backend.services.pinecone_query import PineconeQueryError, pinecone_query
 
 logger = get_logger(__name__)
 
@@ -34,6 +43,37 @@ def extract_namespace_from_prompt(prompt: str) -> Optional[str]:
             
     return None
 
+def _remaining(deadline: float) -> float:
+    """Секунды до конца бюджета поиска; истёкший бюджет — таймаут"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()
+    return remaining
+
+
+def _user_api_key(db: Session, user_id: Any) -> Optional[str]:
+    """Читает ключ OpenAI пользователя из БД"""
+    # Импорт здесь, чтобы избежать циклического импорта
+    from backend.models.user import User
+
+    user = db.query(User).get(user_id)
+    return user.openai_api_key if user else None
+
+
+async def _openai_api_key(assistant_config: Any) -> Optional[str]:
+    """
+    Ключ OpenAI владельца ассистента. В голосовом потоке он уже есть в
+    AssistantRuntimeConfig; иначе читается из БД в пуле потоков.
+    """
+    if not assistant_config:
+        return None
+    if hasattr(assistant_config, "api_key"):
+        return assistant_config.api_key
+    if getattr(assistant_config, "user_id", None):
+        return await run_in_session(_user_api_key, assistant_config.user_id)
+    return None
+
+
 @register_function
 class PineconeSearchFunction(FunctionBase):
     """Функция для поиска в векторной базе данных Pinecone"""
@@ -75,6 +115,9 @@ class PineconeSearchFunction(FunctionBase):
         """
         context = context or {}
         assistant_config = context.get("assistant_config")
+        # Общий бюджет на эмбеддинг запроса и запрос к Pinecone
+        started = time.monotonic()
+        deadline = started + settings.PINECONE_SEARCH_BUDGET_SECONDS
         
         try:
             namespace = arguments.get("namespace")
@@ -87,7 +130,9 @@ class PineconeSearchFunction(FunctionBase):
             
             # Если нет namespace, попробуем извлечь из промпта
             if not namespace and assistant_config:
-                if hasattr(assistant_config, "system_prompt") and assistant_config.system_prompt:
+                # Namespace уже извлечён при компиляции сессии ассистента
+                namespace = getattr(assistant_config, "pinecone_namespace", None)
+                if not namespace and hasattr(assistant_config, "system_prompt") and assistant_config.system_prompt:
                     namespace = extract_namespace_from_prompt(assistant_config.system_prompt)
                     logger.info(f"Извлечен namespace из промпта: {namespace}")
             
@@ -101,85 +146,38 @@ class PineconeSearchFunction(FunctionBase):
                 logger.error("PINECONE_API_KEY not found in environment variables")
                 return {"error": "Pinecone API key not configured"}
             
-            # Создаем эмбеддинг через OpenAI API
-            openai_api_key = None
-            if assistant_config and hasattr(assistant_config, "user_id"):
-                # Импортируем здесь, чтобы избежать циклических импортов
-                from backend.models.user import User
-                
-                # Получаем сессию базы данных
-                db_session = None
-                if hasattr(assistant_config, 'db_session'):
-                    db_session = assistant_config.db_session
-                else:
-                    # Создаем новую сессию если нет в объекте
-                    from backend.db.session import get_db
-                    db_session = next(get_db())
-                    
-                # Получаем пользователя и его API ключ
-                user = db_session.query(User).get(assistant_config.user_id)
-                if user and user.openai_api_key:
-                    openai_api_key = user.openai_api_key
-            
+            openai_api_key = await _openai_api_key(assistant_config)
             if not openai_api_key:
                 # Попытка использовать ключ из переменных окружения
                 openai_api_key = os.environ.get("OPENAI_API_KEY")
                 if not openai_api_key:
                     return {"error": "OpenAI API key not available"}
             
-            # Создаем эмбеддинг через OpenAI API
-            embed_response = requests.post(
-                "https://api.openai.com/v1/embeddings",
-                headers={
-                    "Authorization": f"Bearer {openai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "input": query,
-                    "model": "text-embedding-ada-002"
-                }
-            )
-            
-            if embed_response.status_code != 200:
-                logger.error(f"Error creating embedding: {embed_response.text}")
-                return {"error": f"Failed to create embedding: {embed_response.status_code}"}
-            
-            # Извлекаем эмбеддинг из ответа
-            embedding = embed_response.json().get("data", [{}])[0].get("embedding", [])
+            # Эмбеддинг запроса той же моделью, что и база знаний; повторные вопросы берутся из кэша
+            try:
+                embedding = (await asyncio.wait_for(
+                    embedding_service.embed([query], openai_api_key), _remaining(deadline)
+                ))[0]
+            except openai.OpenAIError as e:
+                logger.error(f"Error creating embedding: {e}")
+                return {"error": f"Failed to create embedding: {getattr(e, 'status_code', None) or e}"}
             
             if not embedding:
                 return {"error": "Failed to generate embedding for query"}
             
-            # Создаем запрос к Pinecone
-            pinecone_url = "https://voicufi-gpr1sqd.svc.aped-4627-b74a.pinecone.io/query"
-            
-            pinecone_request = {
-                "vector": embedding,
-                "namespace": namespace,
-                "topK": top_k,
-                "includeMetadata": True
-            }
-            
-            # Отправляем запрос к Pinecone
-            pinecone_response = requests.post(
-                pinecone_url,
-                headers={
-                    "Api-Key": pinecone_api_key,
-                    "Content-Type": "application/json"
-                },
-                json=pinecone_request
-            )
-            
-            if pinecone_response.status_code != 200:
-                logger.error(f"Error from Pinecone: {pinecone_response.text}")
-                return {"error": f"Pinecone query failed: {pinecone_response.status_code}"}
-            
-            # Обрабатываем результаты
-            results = pinecone_response.json()
+            # Запрос к Pinecone через общий пул соединений, в пределах оставшегося бюджета
+            try:
+                matches = await pinecone_query.query(
+                    embedding, namespace, pinecone_api_key, top_k,
+                    timeout=min(settings.PINECONE_QUERY_TIMEOUT_SECONDS, _remaining(deadline))
+                )
+            except PineconeQueryError as e:
+                logger.error(f"Error from Pinecone: {e.message}")
+                return {"error": str(e)}
             
             # Форматируем результаты в более читаемый вид
             formatted_results = []
-            for match in results.get("matches", []):
+            for match in matches:
                 formatted_match = {
                     "id": match.get("id"),
                     "score": match.get("score"),
@@ -195,6 +193,10 @@ class PineconeSearchFunction(FunctionBase):
                 "total": len(formatted_results)
             }
             
+        except asyncio.TimeoutError:
+            elapsed = time.monotonic() - started
+            logger.warning(f"search_pinecone timed out after {elapsed:.2f}s")
+            return {"error": f"Search timed out after {elapsed:.1f}s"}
         except Exception as e:
             logger.error(f"Error in search_pinecone: {str(e)}")
             return {"error": f"Search failed: {str(e)}"}
@@ -85,7 +85,9 @@ class WebhookFunction(FunctionBase):
             
             # Если нет URL, попробуем извлечь из промпта
             if not url and assistant_config:
-                if hasattr(assistant_config, "system_prompt") and assistant_config.system_prompt:
+                # URL уже извлечён при компиляции сессии ассистента
+                url = getattr(assistant_config, "webhook_url", None)
+                if not url and hasattr(assistant_config, "system_prompt") and assistant_config.system_prompt:
                     url = extract_webhook_url_from_prompt(assistant_config.system_prompt)
                     logger.info(f"Извлечен URL вебхука из промпта: {url}")
             
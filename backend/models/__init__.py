@@ -11,6 +11,9 @@ from .file import File
 from .integration import Integration
 from .pinecone_config import PineconeConfig  # Add this line
 from .function_log import FunctionLog
+from .active_call import ActiveCall
+from .knowledge_base_job import KnowledgeBaseJob
+from .embedding_cache import EmbeddingCacheEntry
 # Export specific models
 __all__ = [
     "Base", 
@@ -21,6 +24,9 @@ __all__ = [
     "Conversation", 
     "File",
     "Integration",
-    "PineconeConfig"  # Add this line
-    "FunctionLog"
+    "PineconeConfig",  # Add this line
+    "FunctionLog",
+    "ActiveCall",
+    "KnowledgeBaseJob",
+    "EmbeddingCacheEntry"
 ]
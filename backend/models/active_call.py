@@ -0,0 +1,32 @@
+"""
+Active call model for WellcomeAI application.
+Leases of live voice calls shared by all workers.
+"""
+
+from sqlalchemy import Column, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from backend.models.base import Base, BaseModel
+
+class ActiveCall(Base, BaseModel):
+    """
+    Live realtime call; the row is a lease renewed by the owning worker's heartbeat.
+    """
+    __tablename__ = "active_calls"
+
+    call_id = Column(String, primary_key=True)
+    assistant_id = Column(UUID(as_uuid=True), nullable=True)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+    worker_id = Column(String, nullable=False)
+    started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    heartbeat_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_active_calls_user_heartbeat", "user_id", "heartbeat_at"),
+        Index("ix_active_calls_heartbeat", "heartbeat_at"),
+    )
+
+    def __repr__(self):
+        """String representation of ActiveCall"""
+        return f"<ActiveCall {self.call_id} (assistant={self.assistant_id}, worker={self.worker_id})>"
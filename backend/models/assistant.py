@@ -31,6 +31,7 @@ class AssistantConfig(Base):
     temperature = Column(Float, default=0.7, nullable=False)
     max_tokens = Column(Integer, default=1000, nullable=False)
     functions = Column(JSON, nullable=True)
+    record_calls = Column(Boolean, default=False, server_default="false", nullable=False)  # Запись звонков в WAV
     
     # Relationship with User
     user = relationship("User", back_populates="assistants")
@@ -31,6 +31,7 @@ class Conversation(Base, BaseModel):
     is_flagged = Column(Boolean, default=False)  # Flagged for review
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     audio_duration = Column(Float, nullable=True)  # Duration of audio in seconds
+    recording_file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="SET NULL"), nullable=True)  # WAV recording of the call
 
     # Relationships
     assistant = relationship("AssistantConfig", back_populates="conversations")
@@ -47,6 +48,8 @@ class Conversation(Base, BaseModel):
             data["id"] = str(data["id"])
         if isinstance(data.get("assistant_id"), uuid.UUID):
             data["assistant_id"] = str(data["assistant_id"])
+        if isinstance(data.get("recording_file_id"), uuid.UUID):
+            data["recording_file_id"] = str(data["recording_file_id"])
             
         return data
     
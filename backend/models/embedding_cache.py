@@ -0,0 +1,33 @@
+"""
+Embedding cache model for WellcomeAI application.
+Persistent tier of the embedding cache shared by all workers.
+"""
+
+from sqlalchemy import Column, String, DateTime, Integer, LargeBinary, Index
+from sqlalchemy.sql import func
+
+from backend.models.base import Base, BaseModel
+
+
+class EmbeddingCacheEntry(Base, BaseModel):
+    """
+    Embedding of a normalized text under one model, stored as little-endian float32.
+    Rows not used for the longest time are pruned above EMBEDDING_CACHE_DB_MAX_ROWS.
+    """
+    __tablename__ = "embedding_cache"
+
+    # sha256 от модели и нормализованного текста
+    key = Column(String(64), primary_key=True)
+    model = Column(String(100), nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_embedding_cache_used_at", "used_at"),
+    )
+
+    def __repr__(self):
+        """String representation of EmbeddingCacheEntry"""
+        return f"<EmbeddingCacheEntry {self.key} ({self.model}, {self.dimensions})>"
@@ -0,0 +1,65 @@
+"""
+Knowledge base build job model for WellcomeAI application.
+Durable queue of chunk -> embed -> upsert builds shared by all workers.
+"""
+
+import uuid
+from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, Text, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from backend.models.base import Base, BaseModel
+
+# Состояния задания
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FAILED = "failed"
+JOB_DONE = "done"
+
+
+class KnowledgeBaseJob(Base, BaseModel):
+    """
+    Build of a knowledge base namespace. Only chunks missing from the namespace
+    are embedded; processed_chunks counts them and is the checkpoint a new worker
+    resumes from. The chunks stored when the job first ran are saved with it,
+    so every attempt diffs against the same set. A running job is a lease
+    renewed by the worker's heartbeat.
+    """
+    __tablename__ = "knowledge_base_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    assistant_id = Column(UUID(as_uuid=True), ForeignKey("assistant_configs.id", ondelete="CASCADE"), nullable=True)
+    # База знаний, которую обновляет задание; пусто — будет создана новая
+    config_id = Column(UUID(as_uuid=True), ForeignKey("pinecone_configs.id", ondelete="SET NULL"), nullable=True)
+    namespace = Column(String, nullable=False)
+    name = Column(String(100), nullable=True)
+    content = Column(Text, nullable=True)  # очищается после сборки, текст остаётся в pinecone_configs
+
+    status = Column(String(20), nullable=False, default=JOB_QUEUED)
+    total_chunks = Column(Integer, nullable=False, default=0)
+    kept_chunks = Column(Integer, nullable=False, default=0)  # уже есть в namespace, не пересчитываются
+    processed_chunks = Column(Integer, nullable=False, default=0)  # контрольная точка среди новых фрагментов
+    upserted_chunks = Column(Integer, nullable=False, default=0)
+    failed_chunks = Column(Integer, nullable=False, default=0)
+    deleted_chunks = Column(Integer, nullable=False, default=0)
+    failed_chunk_ids = Column(JSON, nullable=True)  # не попадут в манифест, будут добавлены следующим обновлением
+    stored_chunk_ids = Column(JSON, nullable=True)  # фрагменты namespace при первом запуске, пусто — ещё не запускалось
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    retry_at = Column(DateTime(timezone=True), nullable=True)  # повтор после ошибки не раньше этого времени
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_knowledge_base_jobs_status_created", "status", "created_at"),
+        Index("ix_knowledge_base_jobs_namespace", "namespace"),
+    )
+
+    def __repr__(self):
+        """String representation of KnowledgeBaseJob"""
+        return f"<KnowledgeBaseJob {self.id} ({self.namespace}, {self.status})>"
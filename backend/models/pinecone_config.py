@@ -1,6 +1,6 @@
 # backend/models/pinecone_config.py
 import uuid
-from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, Text, func
+from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, Text, JSON, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -23,6 +23,7 @@ class PineconeConfig(Base):
     # New fields
     full_content = Column(Text, nullable=True)  # Store complete content text
     name = Column(String(100), nullable=True)  # Optional name for the knowledge base
+    chunk_manifest = Column(JSON, nullable=True)  # ID фрагментов в namespace (хеши текста); пусто — база собрана до манифестов
     
     # Только связь с ассистентом
     assistant = relationship("AssistantConfig", back_populates="pinecone_config", foreign_keys=[assistant_id])
@@ -33,6 +33,7 @@ class AssistantBase(BaseModel):
     language: str = Field("ru", description="Language for the assistant")
     google_sheet_id: Optional[str] = Field(None, description="Google Sheet ID for data source")
     functions: Optional[List[Dict[str, Any]]] = Field(None, description="Functions for the assistant")
+    record_calls: bool = Field(False, description="Whether call audio is recorded")
     
     @validator('voice')
     def validate_voice(cls, v):
@@ -59,6 +60,7 @@ class AssistantUpdate(BaseModel):
     is_public: Optional[bool] = Field(None, description="Whether the assistant is public")
     temperature: Optional[float] = Field(None, description="Temperature for generation")
     max_tokens: Optional[int] = Field(None, description="Max tokens for generation")
+    record_calls: Optional[bool] = Field(None, description="Whether call audio is recorded")
     
     @validator('voice')
     def validate_voice(cls, v):
@@ -35,6 +35,7 @@ class ConversationResponse(ConversationBase):
     feedback_rating: Optional[int] = Field(None, description="User feedback rating (1-5)")
     feedback_text: Optional[str] = Field(None, description="User feedback text")
     is_flagged: Optional[bool] = Field(False, description="Whether the conversation is flagged")
+    recording_file_id: Optional[str] = Field(None, description="File ID of the call recording")
     
     class Config:
         orm_mode = True  # Allow conversion from ORM models
@@ -0,0 +1,403 @@
+"""
+In-process cache of resolved assistant runtime configurations.
+Saves the AssistantConfig and User queries on every WebSocket connect
+and keeps workers consistent through an invalidation channel.
+"""
+
+import asyncio
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.db.executor import run_in_session
+from backend.models.assistant import AssistantConfig
+from backend.models.user import User
+
+logger = get_logger(__name__)
+
+# Ключ кэша для демо-ассистента
+DEMO_KEY = "demo"
+
+# Сообщения канала инвалидации: "assistant:<id>", "user:<id>" или "*"
+INVALIDATE_ALL = "*"
+
+
+class AssistantRuntimeConfig:
+    """
+    Detached snapshot of everything a realtime session needs from an assistant.
+    Attribute-compatible with AssistantConfig for the fields the voice path reads.
+    """
+
+    __slots__ = (
+        "id", "user_id", "name", "system_prompt", "voice", "language", "google_sheet_id",
+        "functions", "is_public", "updated_at", "enabled_functions", "tools", "webhook_url",
+        "pinecone_namespace", "compiled", "api_key", "max_concurrent_calls", "record_calls", "loaded_at",
+    )
+
+    def __init__(self, assistant: AssistantConfig, api_key: Optional[str], max_concurrent_calls: int = 0):
+        # Импорт здесь, чтобы избежать циклического импорта с websockets
+        from backend.websockets.session_compiler import get_compiled_session
+
+        self.id = assistant.id
+        self.user_id = assistant.user_id
+        self.name = assistant.name
+        self.system_prompt = assistant.system_prompt
+        self.voice = assistant.voice
+        self.language = assistant.language
+        self.google_sheet_id = assistant.google_sheet_id
+        self.functions = assistant.functions
+        self.is_public = assistant.is_public
+        self.updated_at = assistant.updated_at
+        self.record_calls = bool(getattr(assistant, "record_calls", False))
+        self.api_key = api_key
+        self.max_concurrent_calls = max_concurrent_calls
+        self.loaded_at = time.monotonic()
+
+        # Компилируется в потоке исполнителя БД и переиспользуется, пока строка не изменится
+        self.compiled = get_compiled_session(self)
+        self.enabled_functions = self.compiled.enabled_functions
+        self.tools = self.compiled.tools
+        self.webhook_url = self.compiled.webhook_url
+        self.pinecone_namespace = self.compiled.pinecone_namespace
+
+    def __repr__(self) -> str:
+        return f"<AssistantRuntimeConfig id={self.id} user_id={self.user_id} has_api_key={bool(self.api_key)}>"
+
+
+def _cache_key(assistant_id: Any) -> str:
+    """Canonical UUID string of an assistant ID; "demo" and IDs that are not UUIDs are kept as is"""
+    key = str(assistant_id)
+    if key == DEMO_KEY:
+        return key
+    try:
+        # Верхний регистр, без дефисов, в фигурных скобках — одна запись кэша
+        return str(uuid.UUID(key))
+    except ValueError:
+        return key
+
+
+def _load_runtime_config(db: Session, assistant_id: str) -> Optional[AssistantRuntimeConfig]:
+    """Resolve an assistant, its owner's API key and call limit (runs in the DB executor)"""
+    if assistant_id == DEMO_KEY:
+        assistant = db.query(AssistantConfig).filter(AssistantConfig.is_public.is_(True)).first()
+        if not assistant:
+            assistant = db.query(AssistantConfig).first()
+    else:
+        try:
+            assistant = db.query(AssistantConfig).get(uuid.UUID(assistant_id))
+        except ValueError:
+            assistant = db.query(AssistantConfig).filter(AssistantConfig.id.cast(str) == assistant_id).first()
+
+    if not assistant:
+        return None
+
+    # Импорт здесь, чтобы избежать циклического импорта с websockets
+    from backend.websockets.session_registry import get_call_limit
+
+    api_key = None
+    max_concurrent_calls = 0
+    if assistant.user_id:
+        user = db.query(User).get(assistant.user_id)
+        if user and user.openai_api_key:
+            api_key = user.openai_api_key
+        max_concurrent_calls = get_call_limit(db, user)
+    return AssistantRuntimeConfig(assistant, api_key, max_concurrent_calls)
+
+
+class LocalInvalidationChannel:
+    """
+    Invalidation channel for a single worker: messages are delivered in process.
+    Other channels extend it to fan messages out to every worker.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[[str], None]] = []
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        """
+        Register a callback for invalidation messages
+
+        Args:
+            callback: Called with each message
+        """
+        self._subscribers.append(callback)
+
+    def publish(self, message: str) -> None:
+        """
+        Send an invalidation message
+
+        Args:
+            message: "assistant:<id>", "user:<id>" or "*"
+        """
+        self._dispatch(message)
+
+    def _dispatch(self, message: str) -> None:
+        for callback in list(self._subscribers):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error handling cache invalidation {message}: {e}")
+
+    def start(self) -> None:
+        """Start receiving messages from other workers"""
+
+    def close(self) -> None:
+        """Stop receiving messages"""
+
+
+class PostgresInvalidationChannel(LocalInvalidationChannel):
+    """
+    Invalidation channel over Postgres LISTEN/NOTIFY.
+    Every worker listens on a dedicated connection in a background thread.
+    """
+
+    CHANNEL = "assistant_cache"
+
+    def __init__(self):
+        super().__init__()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, message: str) -> None:
+        # Локально применяем сразу, остальные воркеры получат NOTIFY
+        self._dispatch(message)
+        try:
+            from sqlalchemy import text
+            from backend.db.session import engine
+
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :message)"), {"channel": self.CHANNEL, "message": message})
+        except Exception as e:
+            logger.error(f"Error publishing cache invalidation {message}: {e}")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._listen, name="assistant-cache-listener", daemon=True)
+            self._thread.start()
+
+    def _listen(self) -> None:
+        from backend.db.session import engine
+
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = engine.raw_connection()
+                dbapi_conn = getattr(conn, "driver_connection", None) or conn.connection
+                dbapi_conn.autocommit = True
+                dbapi_conn.cursor().execute(f"LISTEN {self.CHANNEL}")
+                # Пока не слушали, могли пропустить сообщения — сбрасываем всё
+                self._dispatch(INVALIDATE_ALL)
+                logger.info("Assistant cache invalidation listener connected")
+
+                while not self._stopped.is_set():
+                    if select.select([dbapi_conn], [], [], 5) == ([], [], []):
+                        continue
+                    dbapi_conn.poll()
+                    while dbapi_conn.notifies:
+                        self._dispatch(dbapi_conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Assistant cache invalidation listener error: {e}")
+                self._stopped.wait(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread = None
+
+
+def create_invalidation_channel(kind: str = None) -> LocalInvalidationChannel:
+    """
+    Create the invalidation channel selected in settings
+
+    Args:
+        kind: "local" or "postgres" (default: settings.ASSISTANT_CACHE_CHANNEL)
+
+    Returns:
+        Invalidation channel instance
+    """
+    kind = kind or settings.ASSISTANT_CACHE_CHANNEL
+    if kind == "postgres":
+        return PostgresInvalidationChannel()
+    if kind != "local":
+        logger.warning(f"Unknown assistant cache channel '{kind}', using local")
+    return LocalInvalidationChannel()
+
+
+class AssistantConfigCache:
+    """
+    TTL + LRU cache of AssistantRuntimeConfig keyed by assistant ID (or "demo").
+
+    Concurrent misses for the same key share one DB load. Entries are dropped
+    on invalidation messages; a load that overlaps an invalidation is not stored.
+    """
+
+    def __init__(self, ttl: int = None, max_size: int = None, channel: LocalInvalidationChannel = None):
+        """
+        Initialize the cache
+
+        Args:
+            ttl: Entry lifetime in seconds (default: settings.ASSISTANT_CACHE_TTL_SECONDS)
+            max_size: Max cached assistants (default: settings.ASSISTANT_CACHE_MAX_SIZE)
+            channel: Invalidation channel (default: created from settings)
+        """
+        self.ttl = ttl or settings.ASSISTANT_CACHE_TTL_SECONDS
+        self.max_size = max_size or settings.ASSISTANT_CACHE_MAX_SIZE
+        self.channel = channel or create_invalidation_channel()
+        self.channel.subscribe(self._on_message)
+        self._entries: "OrderedDict[str, AssistantRuntimeConfig]" = OrderedDict()
+        # Слушатель Postgres вызывает инвалидацию из своего потока
+        self._lock = threading.Lock()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._epoch = 0
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    async def get(self, assistant_id: str) -> Optional[AssistantRuntimeConfig]:
+        """
+        Get the runtime config of an assistant, loading it on a miss
+
+        Args:
+            assistant_id: Assistant ID or "demo"
+
+        Returns:
+            AssistantRuntimeConfig or None if the assistant does not exist
+        """
+        key = _cache_key(assistant_id)
+        with self._lock:
+            config = self._entries.get(key)
+            if config is not None:
+                if time.monotonic() - config.loaded_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    return config
+                del self._entries[key]
+        self.metrics["misses"] += 1
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+            # Отменили загружавший вызов, а не этот — загружаем сами
+            return await self.get(assistant_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        epoch = self._epoch
+        try:
+            config = await run_in_session(_load_runtime_config, key)
+            self.metrics["loads"] += 1
+            if config is not None:
+                self._store(key, config, epoch)
+            future.set_result(config)
+            return config
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получил вызывающий; ожидающим оно тоже будет передано
+            future.exception()
+            raise
+        finally:
+            # Загружавший вызов отменён (CancelledError — не Exception): ожидающие не должны зависнуть
+            if not future.done():
+                future.cancel()
+            self._loading.pop(key, None)
+
+    def _store(self, key: str, config: AssistantRuntimeConfig, epoch: int) -> None:
+        with self._lock:
+            if epoch != self._epoch:
+                # Во время загрузки пришла инвалидация — данные могли устареть
+                return
+            self._entries[key] = config
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def invalidate(self, assistant_id: Any) -> None:
+        """
+        Drop an assistant on every worker (call after the row changes)
+
+        Args:
+            assistant_id: Assistant ID
+        """
+        self.channel.publish(f"assistant:{_cache_key(assistant_id)}")
+
+    def invalidate_user(self, user_id: Any) -> None:
+        """
+        Drop all assistants of a user on every worker (e.g. after an API key change)
+
+        Args:
+            user_id: User ID
+        """
+        self.channel.publish(f"user:{user_id}")
+
+    def clear(self) -> None:
+        """Drop every cached assistant on every worker"""
+        self.channel.publish(INVALIDATE_ALL)
+
+    def _on_message(self, message: str) -> None:
+        kind, _, value = message.partition(":")
+        with self._lock:
+            self._epoch += 1
+            self.metrics["invalidations"] += 1
+            if message == INVALIDATE_ALL:
+                self._entries.clear()
+                return
+            # Демо-ассистент выбирается по is_public, поэтому сбрасываем его при любом изменении
+            self._entries.pop(DEMO_KEY, None)
+            if kind == "assistant":
+                self._entries.pop(value, None)
+            elif kind == "user":
+                for key in [k for k, c in self._entries.items() if str(c.user_id) == value]:
+                    del self._entries[key]
+
+    def start(self) -> None:
+        """Start listening for invalidations from other workers"""
+        self.channel.start()
+
+    def close(self) -> None:
+        """Stop the invalidation channel and drop cached entries"""
+        self.channel.close()
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache size and hit/miss counters
+
+        Returns:
+            Dict with cache metrics
+        """
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "channel": type(self.channel).__name__,
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0,
+            **self.metrics
+        }
+
+
+# Кэш на процесс
+assistant_cache = AssistantConfigCache()
@@ -14,6 +14,7 @@ from backend.core.logging import get_logger
 from backend.core.config import settings
 from backend.models.assistant import AssistantConfig
 from backend.models.user import User
+from backend.services.assistant_cache import assistant_cache
 from backend.schemas.assistant import AssistantCreate, AssistantUpdate, AssistantResponse, EmbedCodeResponse
 
 logger = get_logger(__name__)
@@ -60,7 +61,8 @@ class AssistantService:
                 updated_at=assistant.updated_at,
                 total_conversations=assistant.total_conversations,
                 temperature=assistant.temperature,
-                max_tokens=assistant.max_tokens
+                max_tokens=assistant.max_tokens,
+                record_calls=assistant.record_calls
             ))
         
         return result
@@ -127,6 +129,7 @@ class AssistantService:
                 language=assistant_data.language,
                 google_sheet_id=assistant_data.google_sheet_id,
                 functions=assistant_data.functions,
+                record_calls=assistant_data.record_calls,
                 is_active=True,
                 is_public=False
             )
@@ -138,6 +141,7 @@ class AssistantService:
             db.add(assistant)
             db.commit()
             db.refresh(assistant)
+            assistant_cache.invalidate(assistant.id)
             
             logger.info(f"Assistant created: {assistant.id} for user {user_id}")
             
@@ -164,7 +168,8 @@ class AssistantService:
                 updated_at=assistant.updated_at,
                 total_conversations=assistant.total_conversations,
                 temperature=assistant.temperature,
-                max_tokens=assistant.max_tokens
+                max_tokens=assistant.max_tokens,
+                record_calls=assistant.record_calls
             )
             
         except IntegrityError as e:
@@ -219,6 +224,7 @@ class AssistantService:
             
             db.commit()
             db.refresh(assistant)
+            assistant_cache.invalidate(assistant.id)
             
             logger.info(f"Assistant updated: {assistant_id}")
             
@@ -245,7 +251,8 @@ class AssistantService:
                 updated_at=assistant.updated_at,
                 total_conversations=assistant.total_conversations,
                 temperature=assistant.temperature,
-                max_tokens=assistant.max_tokens
+                max_tokens=assistant.max_tokens,
+                record_calls=assistant.record_calls
             )
             
         except IntegrityError as e:
@@ -286,8 +293,10 @@ class AssistantService:
             assistant = await AssistantService.get_assistant_by_id(db, assistant_id, user_id)
             
             # Delete assistant
+            assistant_uuid = assistant.id
             db.delete(assistant)
             db.commit()
+            assistant_cache.invalidate(assistant_uuid)
             
             logger.info(f"Assistant deleted: {assistant_id}")
             return True
@@ -13,6 +13,7 @@ import traceback
 from backend.core.logging import get_logger
 from backend.core.security import hash_password, verify_password, create_jwt_token
 from backend.models.user import User
+from backend.services.assistant_cache import assistant_cache
 from backend.schemas.auth import LoginRequest, RegisterRequest
 from backend.schemas.user import UserCreate, UserResponse
 
@@ -170,7 +171,8 @@ class AuthService:
             # Проверяем, есть ли у пользователя даты подписки
             # Если нет, устанавливаем триальный период
             now = datetime.now(timezone.utc)
-            if not user.subscription_start_date or not user.subscription_end_date:
+            trial_started = not user.subscription_start_date or not user.subscription_end_date
+            if trial_started:
                 logger.warning(f"User {user.id} logged in without subscription dates, setting trial period")
                 
                 user.subscription_start_date = now
@@ -188,6 +190,9 @@ class AuthService:
             # Update last login timestamp
             user.last_login = now
             db.commit()
+            if trial_started:
+                # Лимит одновременных звонков кэшируется вместе с конфигом ассистентов
+                assistant_cache.invalidate_user(user.id)
             
             # Create token
             token = create_jwt_token(str(user.id))
@@ -126,7 +126,8 @@ class ConversationService:
                 tokens_used=conv.tokens_used,
                 feedback_rating=conv.feedback_rating,
                 feedback_text=conv.feedback_text,
-                is_flagged=conv.is_flagged
+                is_flagged=conv.is_flagged,
+                recording_file_id=str(conv.recording_file_id) if conv.recording_file_id else None
             ) for conv in conversations
         ]
     
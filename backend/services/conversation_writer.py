@@ -0,0 +1,473 @@
+"""
+Write-behind persistence for realtime conversations.
+Collects conversation inserts and updates from all live sessions and writes
+them in multi-row batches, spooling to a local file of the worker process when
+the DB is unavailable.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.db.executor import run_blocking, run_in_session
+from backend.models.conversation import Conversation
+
+logger = get_logger(__name__)
+
+# Поля Conversation, которые может менять голосовой поток
+WRITABLE_FIELDS = {
+    "user_message", "assistant_message", "duration_seconds", "tokens_used", "audio_duration", "recording_file_id"
+}
+
+# UUID-поля, которые в файле очереди хранятся строками
+_UUID_FIELDS = ("id", "assistant_id", "recording_file_id")
+
+# Поля даты, которые в файле очереди хранятся строками ISO
+_DATETIME_FIELDS = ("created_at",)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this PID is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_connection_error(error: Exception) -> bool:
+    """Whether the error means the DB is unreachable rather than the data is bad"""
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DBAPIError) and bool(error.connection_invalidated)
+
+
+def _apply_batch(db: Session, inserts: List[Dict[str, Any]], updates: List[Dict[str, Any]]) -> None:
+    """
+    Write one batch in a single transaction.
+    Inserts whose rows already exist (e.g. replayed from the spool) become updates.
+    """
+    if inserts:
+        ids = [row["id"] for row in inserts]
+        existing = {row_id for (row_id,) in db.query(Conversation.id).filter(Conversation.id.in_(ids))}
+        if existing:
+            updates = [
+                {k: v for k, v in row.items() if k == "id" or k in WRITABLE_FIELDS}
+                for row in inserts if row["id"] in existing
+            ] + updates
+            inserts = [row for row in inserts if row["id"] not in existing]
+
+    if inserts:
+        db.bulk_insert_mappings(Conversation, inserts)
+    if updates:
+        db.bulk_update_mappings(Conversation, updates)
+    db.commit()
+
+
+def _apply_rows_individually(db: Session, inserts: List[Dict[str, Any]], updates: List[Dict[str, Any]]) -> int:
+    """
+    Fallback when a batch is rejected: write rows one by one and drop the bad ones
+
+    Returns:
+        Number of dropped rows
+    """
+    dropped = 0
+    for row_inserts, row_updates in [([row], []) for row in inserts] + [([], [row]) for row in updates]:
+        try:
+            _apply_batch(db, row_inserts, row_updates)
+        except Exception as e:
+            db.rollback()
+            dropped += 1
+            row = (row_inserts or row_updates)[0]
+            logger.error(f"Dropping conversation row {row.get('id')}: {e}")
+    return dropped
+
+
+class ConversationWriteBehind:
+    """
+    Buffers conversation writes and flushes them by size or time.
+
+    IDs are generated locally, so callers get a conversation ID immediately.
+    Updates to a conversation that has not been inserted yet are merged into
+    the pending insert. At most one flush interval of data lives only in memory.
+
+    Every worker process spools to its own file. Files are moved aside with an
+    atomic rename before they are replayed, so appends made meanwhile go to a
+    new file; spools of stopped workers are replayed by the next worker that
+    replays its own.
+    """
+
+    def __init__(self, flush_interval: float = None, batch_size: int = None, spool_path: str = None):
+        """
+        Initialize the writer
+
+        Args:
+            flush_interval: Seconds between flushes (default: settings.CONVERSATION_FLUSH_INTERVAL_SECONDS)
+            batch_size: Pending rows that trigger an early flush (default: settings.CONVERSATION_FLUSH_BATCH_SIZE)
+            spool_path: Base name of the per-worker files for batches that could not be written
+                (default: settings.CONVERSATION_SPOOL_PATH)
+        """
+        self.flush_interval = flush_interval or settings.CONVERSATION_FLUSH_INTERVAL_SECONDS
+        self.batch_size = batch_size or settings.CONVERSATION_FLUSH_BATCH_SIZE
+        self.spool_base = spool_path or settings.CONVERSATION_SPOOL_PATH
+        self._spool_root, self._spool_ext = os.path.splitext(self.spool_base)
+        # <база>.<pid><расширение> — файл воркера, <база>.<pid>.<метка>.replay<расширение> — взятый на повтор
+        self._spool_name = re.compile(
+            re.escape(os.path.basename(self._spool_root)) + r"\.(\d+)(\.[0-9a-f]{32}\.replay)?" + re.escape(self._spool_ext)
+        )
+        self._replay_pending = False
+        self._inserts: Dict[str, Dict[str, Any]] = {}
+        self._updates: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._replay_lock: Optional[asyncio.Lock] = None
+        self._spool_lock = threading.Lock()
+        self._closing = False
+        self.metrics = {
+            "inserts": 0,
+            "updates": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "rows_spooled": 0,
+            "rows_replayed": 0,
+            "rows_dropped": 0,
+        }
+
+    @property
+    def spool_path(self) -> str:
+        """Spool file of this worker process"""
+        # PID берётся при каждом обращении: при preload объект создаётся ещё в мастере gunicorn
+        return f"{self._spool_root}.{os.getpid()}{self._spool_ext}"
+
+    @property
+    def pending(self) -> int:
+        """Number of rows waiting to be written"""
+        return len(self._inserts) + len(self._updates)
+
+    def record_created(self, assistant_id: Any, session_id: str) -> str:
+        """
+        Queue a new conversation row
+
+        Args:
+            assistant_id: Assistant ID
+            session_id: Realtime session ID
+
+        Returns:
+            ID of the conversation as string
+        """
+        conversation_id = uuid.uuid4()
+        self._inserts[str(conversation_id)] = {
+            "id": conversation_id,
+            "assistant_id": assistant_id,
+            "session_id": session_id,
+            "user_message": "",
+            "assistant_message": "",
+        }
+        self.metrics["inserts"] += 1
+        self._notify()
+        return str(conversation_id)
+
+    def record_turns(self, assistant_id: Any, session_id: str, turns: List[Dict[str, Any]]) -> List[str]:
+        """
+        Queue finished turns of a call as separate conversation rows.
+        Rows carry the turn start time, so a call reads back in order even
+        when several turns are written in one batch.
+
+        Args:
+            assistant_id: Assistant ID
+            session_id: Realtime session ID shared by the call's rows
+            turns: Dicts with user_message, assistant_message, started_at and duration_seconds
+
+        Returns:
+            IDs of the queued conversations as strings
+        """
+        ids = []
+        for turn in turns:
+            conversation_id = uuid.uuid4()
+            self._inserts[str(conversation_id)] = {
+                "id": conversation_id,
+                "assistant_id": assistant_id,
+                "session_id": session_id,
+                "user_message": turn.get("user_message") or "",
+                "assistant_message": turn.get("assistant_message") or "",
+                "duration_seconds": turn.get("duration_seconds"),
+                "created_at": turn["started_at"],
+            }
+            ids.append(str(conversation_id))
+        self.metrics["inserts"] += len(ids)
+        if ids:
+            self._notify()
+        return ids
+
+    def record_update(self, conversation_id: str, keep_existing: Tuple[str, ...] = (), **fields: Any) -> None:
+        """
+        Queue changes to a conversation row; later values win
+
+        Args:
+            conversation_id: Conversation ID
+            keep_existing: Fields not to overwrite if a non-empty value is already buffered
+            **fields: Columns to update (see WRITABLE_FIELDS)
+        """
+        pending = self.peek(conversation_id) or {}
+        changes = {
+            k: v for k, v in fields.items()
+            if k in WRITABLE_FIELDS and v is not None and not (k in keep_existing and pending.get(k))
+        }
+        if not changes:
+            return
+
+        pending_insert = self._inserts.get(conversation_id)
+        if pending_insert is not None:
+            pending_insert.update(changes)
+        else:
+            self._updates.setdefault(conversation_id, {"id": uuid.UUID(conversation_id)}).update(changes)
+        self.metrics["updates"] += 1
+        self._notify()
+
+    def peek(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get not yet written values of a conversation
+
+        Args:
+            conversation_id: Conversation ID
+
+        Returns:
+            Pending column values or None if nothing is buffered
+        """
+        return self._inserts.get(conversation_id) or self._updates.get(conversation_id)
+
+    def _notify(self) -> None:
+        self._ensure_started()
+        if self._wakeup and self.pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self.start()
+
+    def start(self) -> None:
+        """Start the background flusher and replay spooled batches"""
+        if self._task is not None and not self._task.done():
+            return
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._replay_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            await self.replay_spool()
+        except Exception as e:
+            logger.error(f"Error replaying conversation spool: {e}")
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing conversation writes: {e}")
+
+    def _take_batch(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        inserts = list(self._inserts.values())
+        updates = list(self._updates.values())
+        self._inserts = {}
+        self._updates = {}
+        return inserts, updates
+
+    async def flush(self) -> int:
+        """
+        Write every pending row in one transaction
+
+        Returns:
+            Number of rows taken from the buffer
+        """
+        if not self.pending:
+            return 0
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            inserts, updates = self._take_batch()
+            if not inserts and not updates:
+                return 0
+            await self._write(inserts, updates)
+            self.metrics["flushes"] += 1
+            return len(inserts) + len(updates)
+
+    async def _write(self, inserts: List[Dict[str, Any]], updates: List[Dict[str, Any]]) -> None:
+        rows = len(inserts) + len(updates)
+        if self._replay_pending or os.path.exists(self.spool_path):
+            # Сохраняем порядок: новые изменения не должны обогнать отложенные
+            await run_blocking(self._spool, inserts, updates)
+            self.metrics["rows_spooled"] += rows
+            await self.replay_spool()
+            return
+        try:
+            await run_in_session(_apply_batch, inserts, updates)
+            self.metrics["rows_written"] += rows
+            logger.debug(f"Flushed {len(inserts)} conversation inserts and {len(updates)} updates")
+        except Exception as e:
+            if _is_connection_error(e):
+                logger.error(f"Database unavailable, spooling {rows} conversation rows: {e}")
+                await run_blocking(self._spool, inserts, updates)
+                self.metrics["rows_spooled"] += rows
+            else:
+                logger.error(f"Conversation batch rejected, writing rows individually: {e}")
+                dropped = await run_in_session(_apply_rows_individually, inserts, updates)
+                self.metrics["rows_dropped"] += dropped
+                self.metrics["rows_written"] += rows - dropped
+
+    def _spool(self, inserts: List[Dict[str, Any]], updates: List[Dict[str, Any]]) -> None:
+        """Append a batch to the spool file and fsync it"""
+        os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+        with self._spool_lock, open(self.spool_path, "a", encoding="utf-8") as spool:
+            for op, rows in (("insert", inserts), ("update", updates)):
+                for row in rows:
+                    spool.write(json.dumps({"op": op, "row": row}, default=str, ensure_ascii=False) + "\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+
+    def _claim_spools(self) -> List[str]:
+        """
+        Move this worker's spool and those left by stopped workers aside for replay
+
+        Returns:
+            Claimed files, oldest first
+        """
+        pid = os.getpid()
+        directory = os.path.dirname(self.spool_base) or "."
+        claimed = []
+        with self._spool_lock:
+            try:
+                names = os.listdir(directory)
+            except FileNotFoundError:
+                return claimed
+            for name in names:
+                path = os.path.join(directory, name)
+                if path == self.spool_base:
+                    # Общий файл версий до разделения по воркерам
+                    owner, replaying = None, False
+                else:
+                    match = self._spool_name.fullmatch(name)
+                    if match is None:
+                        continue
+                    owner, replaying = int(match.group(1)), match.group(2) is not None
+                if owner == pid and replaying:
+                    # Остался от повтора, который не дошёл до БД
+                    claimed.append(path)
+                    continue
+                if owner is not None and owner != pid and _pid_alive(owner):
+                    continue
+                target = f"{self._spool_root}.{pid}.{uuid.uuid4().hex}.replay{self._spool_ext}"
+                try:
+                    # rename атомарен: файл достаётся одному воркеру, новые записи идут в новый файл
+                    os.rename(path, target)
+                except FileNotFoundError:
+                    continue
+                claimed.append(target)
+        # Порядок записи: изменения одного разговора не должны применяться задом наперёд
+        return sorted(claimed, key=os.path.getmtime)
+
+    def _read_spool(self, paths: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        inserts, updates = [], []
+        for path in paths:
+            with open(path, encoding="utf-8") as spool:
+                for line in spool:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Последняя строка могла оборваться при падении процесса
+                        logger.warning(f"Skipping corrupted line in conversation spool {path}")
+                        continue
+                    row = entry["row"]
+                    for field in _UUID_FIELDS:
+                        if row.get(field):
+                            row[field] = uuid.UUID(row[field])
+                    for field in _DATETIME_FIELDS:
+                        if row.get(field):
+                            row[field] = datetime.fromisoformat(row[field])
+                    (inserts if entry["op"] == "insert" else updates).append(row)
+        return inserts, updates
+
+    def _clear_spool(self, paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def replay_spool(self) -> int:
+        """
+        Write batches that were spooled while the DB was unavailable
+
+        Returns:
+            Number of replayed rows
+        """
+        lock = self._replay_lock or asyncio.Lock()
+        async with lock:
+            paths = await run_blocking(self._claim_spools)
+            if not paths:
+                return 0
+            inserts, updates = await run_blocking(self._read_spool, paths)
+            if inserts or updates:
+                try:
+                    await run_in_session(_apply_batch, inserts, updates)
+                except Exception as e:
+                    if _is_connection_error(e):
+                        # Взятые файлы остаются за этим воркером до следующего повтора
+                        self._replay_pending = True
+                        logger.warning(f"Database still unavailable, keeping conversation spool: {e}")
+                        return 0
+                    dropped = await run_in_session(_apply_rows_individually, inserts, updates)
+                    self.metrics["rows_dropped"] += dropped
+            await run_blocking(self._clear_spool, paths)
+            self._replay_pending = False
+            rows = len(inserts) + len(updates)
+            self.metrics["rows_replayed"] += rows
+            if rows:
+                logger.info(f"Replayed {rows} conversation rows from {len(paths)} spool files")
+            return rows
+
+    async def close(self) -> None:
+        """Stop the flusher and write everything that is still buffered"""
+        if self._task is not None:
+            # Не отменяем задачу: прерванный flush потерял бы уже взятый пакет
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get buffer size and write counters
+
+        Returns:
+            Dict with writer metrics
+        """
+        return {"pending": self.pending, **self.metrics}
+
+
+# Буфер на процесс
+conversation_writer = ConversationWriteBehind()
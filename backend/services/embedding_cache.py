@@ -0,0 +1,267 @@
+"""
+Content-addressed cache of embeddings.
+Vectors are keyed by model and a hash of the normalized text and kept as
+float32 bytes in an in-process LRU tier backed by the embedding_cache table,
+so knowledge base builds and search queries do not pay twice for one text.
+"""
+
+import asyncio
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.db.executor import run_in_session
+from backend.models.embedding_cache import EmbeddingCacheEntry
+
+logger = get_logger(__name__)
+
+# Накладные расходы записи LRU сверх самого вектора (ключ, узел словаря)
+_ENTRY_OVERHEAD = 200
+
+# Ключей в одном запросе к таблице
+_DB_BATCH_SIZE = 500
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC with whitespace runs collapsed: texts differing only there share a vector"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model: str) -> str:
+    """
+    Cache key of a text under a model
+
+    Args:
+        text: Embedded text
+        model: Embedding model
+
+    Returns:
+        sha256 hex digest of the model and the normalized text
+    """
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    """Little-endian float32 bytes of a vector (4 bytes per dimension)"""
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def unpack_vector(data: bytes) -> List[float]:
+    """Vector from its float32 bytes"""
+    return np.frombuffer(data, dtype="<f4").tolist()
+
+
+def _load(db: Session, keys: List[str]) -> Dict[str, bytes]:
+    """Read cached vectors and mark them as used"""
+    found: Dict[str, bytes] = {}
+    for start in range(0, len(keys), _DB_BATCH_SIZE):
+        part = keys[start:start + _DB_BATCH_SIZE]
+        rows = db.query(EmbeddingCacheEntry.key, EmbeddingCacheEntry.vector).filter(
+            EmbeddingCacheEntry.key.in_(part)
+        ).all()
+        found.update((key, bytes(vector)) for key, vector in rows)
+    if found:
+        hits = list(found)
+        for start in range(0, len(hits), _DB_BATCH_SIZE):
+            db.query(EmbeddingCacheEntry).filter(
+                EmbeddingCacheEntry.key.in_(hits[start:start + _DB_BATCH_SIZE])
+            ).update({EmbeddingCacheEntry.used_at: func.now()}, synchronize_session=False)
+        db.commit()
+    return found
+
+
+def _store(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Insert vectors; rows written meanwhile by another worker are kept"""
+    for start in range(0, len(rows), _DB_BATCH_SIZE):
+        db.execute(
+            insert(EmbeddingCacheEntry)
+            .values(rows[start:start + _DB_BATCH_SIZE])
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+    db.commit()
+
+
+def _prune(db: Session, max_rows: int) -> int:
+    """Delete the least recently used rows above max_rows"""
+    stale = select(EmbeddingCacheEntry.key).order_by(EmbeddingCacheEntry.used_at.desc()).offset(max_rows)
+    deleted = db.query(EmbeddingCacheEntry).filter(
+        EmbeddingCacheEntry.key.in_(stale)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    The memory tier is an LRU bounded by the bytes of its vectors. The DB tier
+    is read on memory misses and written behind, off the caller's path; its
+    errors count as misses and never fail an embedding.
+    """
+
+    def __init__(self, memory_mb: int = None, persistent: bool = None, max_rows: int = None):
+        """
+        Initialize the cache
+
+        Args:
+            memory_mb: Memory tier size in MB, 0 disables it (default: settings.EMBEDDING_CACHE_MEMORY_MB)
+            persistent: Use the embedding_cache table (default: settings.EMBEDDING_CACHE_DB_ENABLED)
+            max_rows: Rows kept in the table (default: settings.EMBEDDING_CACHE_DB_MAX_ROWS)
+        """
+        memory_mb = settings.EMBEDDING_CACHE_MEMORY_MB if memory_mb is None else memory_mb
+        self.max_bytes = memory_mb * 1024 * 1024
+        self.persistent = settings.EMBEDDING_CACHE_DB_ENABLED if persistent is None else persistent
+        self.max_rows = max_rows or settings.EMBEDDING_CACHE_DB_MAX_ROWS
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._writes: Set[asyncio.Task] = set()
+        self._pruned_at = 0.0
+        self._pruning = False
+        self.metrics = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "pruned": 0,
+            "db_errors": 0,
+        }
+
+    async def get_many(self, texts: Sequence[str], model: str) -> List[Optional[List[float]]]:
+        """
+        Look texts up in both tiers
+
+        Args:
+            texts: Texts to look up
+            model: Embedding model
+
+        Returns:
+            Cached vector or None for every text, in order
+        """
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            key = cache_key(text, model)
+            data = self._entries.get(key)
+            if data is None:
+                missing.setdefault(key, []).append(index)
+                continue
+            self._entries.move_to_end(key)
+            vectors[index] = unpack_vector(data)
+            self.metrics["memory_hits"] += 1
+
+        if missing and self.persistent:
+            try:
+                loaded = await run_in_session(_load, list(missing))
+            except Exception as e:
+                self.metrics["db_errors"] += 1
+                logger.warning(f"Embedding cache lookup failed, embedding {len(missing)} texts: {e}")
+                loaded = {}
+            for key, data in loaded.items():
+                self._remember(key, data)
+                for index in missing.pop(key):
+                    vectors[index] = unpack_vector(data)
+                    self.metrics["db_hits"] += 1
+
+        self.metrics["misses"] += sum(len(indexes) for indexes in missing.values())
+        return vectors
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]], model: str) -> None:
+        """
+        Store fresh embeddings; the DB write runs in the background
+
+        Args:
+            texts: Embedded texts
+            vectors: Their embeddings, in order
+            model: Embedding model
+        """
+        rows = []
+        for text, vector in zip(texts, vectors):
+            key = cache_key(text, model)
+            data = pack_vector(vector)
+            self._remember(key, data)
+            rows.append({"key": key, "model": model, "dimensions": len(vector), "vector": data})
+        self.metrics["stores"] += len(rows)
+        if rows and self.persistent:
+            task = asyncio.create_task(self._write(rows))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if self.max_bytes <= 0:
+            return
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = data
+        self._bytes += len(data) + _ENTRY_OVERHEAD
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted) + _ENTRY_OVERHEAD
+            self.metrics["evictions"] += 1
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            await run_in_session(_store, rows)
+        except Exception as e:
+            self.metrics["db_errors"] += 1
+            logger.warning(f"Error writing {len(rows)} embeddings to the cache: {e}")
+            return
+
+        # Чистку запускает запись, не чаще раза в EMBEDDING_CACHE_PRUNE_SECONDS на воркер
+        now = time.monotonic()
+        if self._pruning or now - self._pruned_at < settings.EMBEDDING_CACHE_PRUNE_SECONDS:
+            return
+        self._pruning, self._pruned_at = True, now
+        try:
+            pruned = await run_in_session(_prune, self.max_rows)
+            self.metrics["pruned"] += pruned
+            if pruned:
+                logger.info(f"Pruned {pruned} least recently used embeddings from the cache")
+        except Exception as e:
+            self.metrics["db_errors"] += 1
+            logger.warning(f"Error pruning the embedding cache: {e}")
+        finally:
+            self._pruning = False
+
+    async def close(self) -> None:
+        """Wait for pending DB writes and drop the memory tier"""
+        if self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache size and hit/miss counters
+
+        Returns:
+            Dict with cache metrics
+        """
+        lookups = self.metrics["memory_hits"] + self.metrics["db_hits"] + self.metrics["misses"]
+        hits = self.metrics["memory_hits"] + self.metrics["db_hits"]
+        return {
+            "size": len(self._entries),
+            "memory_bytes": self._bytes,
+            "max_memory_bytes": self.max_bytes,
+            "persistent": self.persistent,
+            "max_rows": self.max_rows,
+            "pending_writes": len(self._writes),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_hit_rate": round(self.metrics["memory_hits"] / lookups, 4) if lookups else 0.0,
+            **self.metrics
+        }
+
+
+# Кэш на процесс
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,434 @@
+"""
+Embedding pipeline for knowledge base ingestion.
+Texts are embedded in multi-input requests through a shared async OpenAI
+client, with concurrency adapted to 429 responses per API key, and finished
+batches are upserted while the next ones are still being embedded. Texts
+already in the embedding cache are not sent to the API.
+"""
+
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import httpx
+import openai
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.services.embedding_cache import EmbeddingCache, embedding_cache
+
+logger = get_logger(__name__)
+
+# Сколько клиентов OpenAI (по одному на ключ) держим; соединения у них общие
+_MAX_CLIENTS = 64
+
+# Колбэк прогресса: (эмбеддингов готово, векторов записано, всего)
+ProgressCallback = Callable[[int, int, int], Any]
+
+
+class AdaptiveRateLimiter:
+    """
+    Concurrency limit for one API key that adapts to rate limiting.
+
+    Halves the number of requests in flight on every 429 and pauses new ones
+    for the time the API asks for; after a run of successful requests grows
+    back by one, up to the configured maximum (AIMD).
+    """
+
+    def __init__(self, max_concurrency: int = None, increase_after: int = 8):
+        """
+        Initialize the limiter
+
+        Args:
+            max_concurrency: Upper bound of requests in flight (default: settings.EMBEDDING_MAX_CONCURRENCY)
+            increase_after: Successful requests needed to raise the limit by one
+        """
+        self.max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+        self.limit = self.max_concurrency
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self.rate_limited = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait for a free slot and for the end of a rate limit pause"""
+        async with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                await self._condition.wait()
+
+    async def release(self, rate_limited: bool = False, retry_after: Optional[float] = None) -> None:
+        """
+        Return a slot and adapt the limit to the request outcome
+
+        Args:
+            rate_limited: Whether the request got a 429
+            retry_after: Pause requested by the API in seconds
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.rate_limited += 1
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+                # Разброс паузы, чтобы запросы не возвращались одновременно
+                pause = (retry_after or 1.0) * random.uniform(1.0, 1.5)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                logger.warning(f"Embedding rate limit hit: concurrency -> {self.limit}, pause {pause:.1f}s")
+            else:
+                self._successes += 1
+                if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get limiter state
+
+        Returns:
+            Dict with the current limit, requests in flight and 429 count
+        """
+        return {"limit": self.limit, "in_flight": self.in_flight, "rate_limited": self.rate_limited}
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Pause requested in the headers of a rate limited response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+def make_batches(texts: Sequence[str], max_inputs: int, max_chars: int) -> List[List[int]]:
+    """
+    Group text indexes into embedding requests
+
+    Args:
+        texts: Texts to embed
+        max_inputs: Inputs per request
+        max_chars: Total characters per request (keeps requests under the token limit)
+
+    Returns:
+        Lists of indexes into texts, in order
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    chars = 0
+    for index, text in enumerate(texts):
+        if current and (len(current) >= max_inputs or chars + len(text) > max_chars):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(index)
+        chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingService:
+    """
+    Shared async OpenAI clients and per-key rate limiters for embeddings
+    """
+
+    def __init__(self, cache: EmbeddingCache = None):
+        """
+        Initialize the service
+
+        Args:
+            cache: Embedding cache (default: the process-wide embedding_cache)
+        """
+        self.cache = cache or embedding_cache
+        self._http: Optional[httpx.AsyncClient] = None
+        self._clients: "OrderedDict[str, openai.AsyncOpenAI]" = OrderedDict()
+        self._limiters: Dict[str, AdaptiveRateLimiter] = {}
+        self.requests = 0
+        self.inputs = 0
+
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        Get the connection pool shared by the clients of all API keys
+
+        Creating it loads the TLS context (~100 ms of blocking work), so it
+        is done once per process instead of once per key on the voice path.
+
+        Returns:
+            httpx client with keep-alive connections
+        """
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS)
+        return self._http
+
+    def client(self, api_key: str) -> openai.AsyncOpenAI:
+        """
+        Get the async client of an API key
+
+        Args:
+            api_key: OpenAI API key
+
+        Returns:
+            AsyncOpenAI client on the shared connection pool
+        """
+        client = self._clients.get(api_key)
+        if client is None:
+            # Повторы после 429 делает ограничитель, а не SDK
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=settings.EMBEDDING_API_BASE or None,
+                max_retries=0,
+                timeout=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS,
+                http_client=self.http_client()
+            )
+            self._clients[api_key] = client
+            if len(self._clients) > _MAX_CLIENTS:
+                # Не закрываем: close() клиента закрыл бы общий пул соединений
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(api_key)
+        return client
+
+    def limiter(self, api_key: str) -> AdaptiveRateLimiter:
+        """
+        Get the rate limiter of an API key, shared by every ingestion using it
+
+        Args:
+            api_key: OpenAI API key
+
+        Returns:
+            AdaptiveRateLimiter of the key
+        """
+        limiter = self._limiters.get(api_key)
+        if limiter is None:
+            limiter = self._limiters[api_key] = AdaptiveRateLimiter()
+        return limiter
+
+    async def embed_batch(self, texts: List[str], api_key: str, model: str = None) -> List[List[float]]:
+        """
+        Embed several texts with one request, retrying rate limits and transient errors
+
+        Args:
+            texts: Texts to embed
+            api_key: OpenAI API key
+            model: Embedding model (default: settings.EMBEDDING_MODEL)
+
+        Returns:
+            Embeddings in the order of texts
+        """
+        model = model or settings.EMBEDDING_MODEL
+        client = self.client(api_key)
+        limiter = self.limiter(api_key)
+        for attempt in range(settings.EMBEDDING_MAX_RETRIES + 1):
+            await limiter.acquire()
+            try:
+                response = await client.embeddings.create(model=model, input=texts)
+            except openai.RateLimitError as e:
+                await limiter.release(rate_limited=True, retry_after=_retry_after(e))
+                if attempt == settings.EMBEDDING_MAX_RETRIES:
+                    raise
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError):
+                await limiter.release()
+                if attempt == settings.EMBEDDING_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+                continue
+            except BaseException:
+                await limiter.release()
+                raise
+            await limiter.release()
+            self.requests += 1
+            self.inputs += len(texts)
+            # Порядок в ответе задаётся полем index
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        raise RuntimeError("Embedding retries exhausted")
+
+    async def embed(self, texts: Sequence[str], api_key: str, model: str = None) -> List[List[float]]:
+        """
+        Embed any number of texts with batched concurrent requests, using the cache
+
+        Args:
+            texts: Texts to embed
+            api_key: OpenAI API key
+            model: Embedding model (default: settings.EMBEDDING_MODEL)
+
+        Returns:
+            Embeddings in the order of texts
+        """
+        model = model or settings.EMBEDDING_MODEL
+        vectors = await self.cache.get_many(texts, model)
+
+        async def run(batch: List[int]) -> None:
+            batch_texts = [texts[i] for i in batch]
+            embedded = await self.embed_batch(batch_texts, api_key, model)
+            self.cache.put_many(batch_texts, embedded, model)
+            for index, vector in zip(batch, embedded):
+                vectors[index] = vector
+
+        await asyncio.gather(*(run(batch) for batch in self._batches(texts, vectors)))
+        return vectors
+
+    @staticmethod
+    def _batches(texts: Sequence[str], cached: List[Optional[List[float]]]) -> List[List[int]]:
+        """Embedding requests for the texts missing from the cache, as indexes into texts"""
+        missing = [index for index, vector in enumerate(cached) if vector is None]
+        batches = make_batches(
+            [texts[i] for i in missing], settings.EMBEDDING_BATCH_SIZE, settings.EMBEDDING_BATCH_MAX_CHARS
+        )
+        return [[missing[i] for i in batch] for batch in batches]
+
+    async def ingest(
+        self,
+        texts: Sequence[str],
+        api_key: str,
+        build_vectors: Callable[[List[int], List[List[float]]], List[Dict[str, Any]]],
+        upsert: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        model: str = None,
+        on_progress: Optional[ProgressCallback] = None,
+        budget: Optional[asyncio.Semaphore] = None
+    ) -> int:
+        """
+        Embed texts and upsert the vectors, overlapping both stages
+
+        Embedding requests run concurrently under the key's limiter; every
+        finished batch is queued for a single upsert worker, so vector
+        store writes proceed while later batches are still being embedded.
+        Cached texts go straight to the upsert worker.
+
+        Args:
+            texts: Texts to embed
+            api_key: OpenAI API key
+            build_vectors: Builds upsert records from text indexes and their embeddings
+            upsert: Coroutine function writing a list of records
+            model: Embedding model (default: settings.EMBEDDING_MODEL)
+            on_progress: Called with (embedded, upserted, total) after every stage step
+            budget: Semaphore bounding embedding requests shared with other ingestions
+
+        Returns:
+            Number of upserted vectors
+        """
+        total = len(texts)
+        model = model or settings.EMBEDDING_MODEL
+        cached = await self.cache.get_many(texts, model)
+        hits = [index for index, vector in enumerate(cached) if vector is not None]
+        batches = self._batches(texts, cached)
+        # Ограниченная очередь: эмбеддинги не убегают далеко вперёд записи
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(2, self.limiter(api_key).max_concurrency * 2))
+        counters = {"embedded": 0, "upserted": 0, "failed": 0}
+
+        def report() -> None:
+            if on_progress:
+                on_progress(counters["embedded"], counters["upserted"], total)
+
+        async def embed(batch: List[int]) -> None:
+            batch_texts = [texts[i] for i in batch]
+            try:
+                if budget is None:
+                    vectors = await self.embed_batch(batch_texts, api_key, model)
+                else:
+                    async with budget:
+                        vectors = await self.embed_batch(batch_texts, api_key, model)
+            except openai.OpenAIError as e:
+                # Как и раньше, неудавшиеся фрагменты пропускаются, остальные записываются
+                counters["failed"] += len(batch)
+                logger.error(f"Error creating embeddings for chunks {batch[0]}-{batch[-1]}: {e}")
+                return
+            self.cache.put_many(batch_texts, vectors, model)
+            counters["embedded"] += len(batch)
+            report()
+            await queue.put(build_vectors(batch, vectors))
+
+        async def write() -> None:
+            pending: List[Dict[str, Any]] = []
+            while True:
+                records = await queue.get()
+                if records is None:
+                    break
+                pending.extend(records)
+                while len(pending) >= settings.PINECONE_UPSERT_BATCH_SIZE:
+                    chunk = pending[:settings.PINECONE_UPSERT_BATCH_SIZE]
+                    del pending[:settings.PINECONE_UPSERT_BATCH_SIZE]
+                    await upsert(chunk)
+                    counters["upserted"] += len(chunk)
+                    report()
+            if pending:
+                await upsert(pending)
+                counters["upserted"] += len(pending)
+                report()
+
+        async def produce() -> None:
+            for start in range(0, len(hits), settings.PINECONE_UPSERT_BATCH_SIZE):
+                part = hits[start:start + settings.PINECONE_UPSERT_BATCH_SIZE]
+                counters["embedded"] += len(part)
+                report()
+                await queue.put(build_vectors(part, [cached[i] for i in part]))
+            await asyncio.gather(*embedders)
+            await queue.put(None)
+
+        started = time.monotonic()
+        writer = asyncio.create_task(write())
+        embedders = [asyncio.create_task(embed(batch)) for batch in batches]
+        producer = asyncio.create_task(produce())
+        tasks = embedders + [producer, writer]
+        try:
+            # Запись ждётся вместе с эмбеддингами: после её ошибки очередь никто не читает,
+            # и эмбеддинги зависли бы на queue.put
+            done, _ = await asyncio.wait([producer, writer], return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        logger.info(
+            f"Ingested {counters['upserted']} vectors ({counters['failed']} chunks failed) "
+            f"in {len(batches)} embedding requests ({len(hits)} chunks cached), {time.monotonic() - started:.1f}s "
+            f"({self.limiter(api_key).stats()})"
+        )
+        return counters["upserted"]
+
+    async def close(self) -> None:
+        """Close the shared connection pool"""
+        self._clients.clear()
+        http, self._http = self._http, None
+        if http is not None:
+            try:
+                await http.aclose()
+            except Exception as e:
+                logger.error(f"Error closing embedding client: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get embedding counters
+
+        Returns:
+            Dict with requests, inputs, open clients and limiter states
+        """
+        return {
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "clients": len(self._clients),
+            "rate_limited": sum(limiter.rate_limited for limiter in self._limiters.values()),
+        }
+
+
+embedding_service = EmbeddingService()
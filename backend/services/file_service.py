@@ -9,7 +9,7 @@ import shutil
 from fastapi import HTTPException, status, UploadFile
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional, BinaryIO
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 
 from backend.core.logging import get_logger
 from backend.core.config import settings
@@ -36,6 +36,9 @@ class FileService:
     # Maximum file size (10MB)
     MAX_FILE_SIZE = 10 * 1024 * 1024
     
+    # Chunk size for streaming downloads
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    
     @staticmethod
     def _ensure_upload_dir():
         """Ensure the upload directory exists"""
@@ -346,3 +349,71 @@ class FileService:
         
         logger.info(f"File download requested: {file_id}")
         return (full_path, file.original_filename, file.content_type)
+    
+    @staticmethod
+    def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+        """
+        Parse a single-range HTTP Range header
+        
+        Args:
+            range_header: Value of the Range header, e.g. "bytes=0-1023" or "bytes=-500"
+            file_size: Size of the file in bytes
+            
+        Returns:
+            Inclusive (start, end) byte offsets, or None to send the whole file
+            
+        Raises:
+            HTTPException: 416 if the range lies outside the file
+        """
+        if not range_header:
+            return None
+        unit, _, spec = range_header.partition("=")
+        # Несколько диапазонов не поддерживаем — отдаём файл целиком, как разрешает RFC 9110
+        if unit.strip().lower() != "bytes" or "," in spec:
+            return None
+        
+        first, _, last = spec.strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else file_size - 1
+            else:
+                suffix = int(last)
+                start = max(0, file_size - suffix)
+                end = file_size - 1 if suffix else -1
+        except ValueError:
+            return None
+        
+        end = min(end, file_size - 1)
+        if start > end:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{file_size}"}
+            )
+        return start, end
+    
+    @staticmethod
+    def iter_file(full_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Read a file or a byte range of it in fixed-size chunks
+        
+        Args:
+            full_path: Path to the file on disk
+            start: First byte to send
+            end: Last byte to send, inclusive (default: end of file)
+            
+        Yields:
+            File content chunks
+        """
+        with open(full_path, mode="rb") as file_like:
+            file_like.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = FileService.DOWNLOAD_CHUNK_SIZE if remaining is None else min(FileService.DOWNLOAD_CHUNK_SIZE, remaining)
+                chunk = file_like.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
@@ -0,0 +1,599 @@
+"""
+Background builds of knowledge bases.
+Create and update requests are stored as jobs and built by worker tasks:
+chunks missing from the namespace are embedded and upserted segment by
+segment, each finished segment is a durable checkpoint, so a job interrupted
+by a crash or a deploy is resumed by any worker from the last upserted segment.
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import func
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.db.executor import run_in_session
+from backend.models.knowledge_base_job import (
+    JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, KnowledgeBaseJob
+)
+
+logger = get_logger(__name__)
+
+# Идентификатор воркера: чьи задания продлевать и возвращать в очередь при остановке
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Поля задания, которые отдаются в API
+_STATUS_FIELDS = (
+    "status", "namespace", "name", "total_chunks", "kept_chunks", "processed_chunks", "upserted_chunks",
+    "failed_chunks", "deleted_chunks", "attempts", "error", "created_at", "started_at", "finished_at"
+)
+
+
+class JobLeaseLost(Exception):
+    """The job was taken over by another worker"""
+
+
+def job_status(job: KnowledgeBaseJob) -> Dict[str, Any]:
+    """
+    Public view of a job
+
+    Args:
+        job: Job row
+
+    Returns:
+        Dict with the job state and chunk progress
+    """
+    result = {field: getattr(job, field) for field in _STATUS_FIELDS}
+    result["id"] = str(job.id)
+    result["config_id"] = str(job.config_id) if job.config_id else None
+    # Неизменённые фрагменты готовы сразу
+    done = job.kept_chunks + job.upserted_chunks + job.failed_chunks
+    result["progress"] = min(100, round(100 * done / job.total_chunks)) if job.total_chunks else 0
+    return result
+
+
+def _enqueue(
+    db: Session,
+    user_id: Any,
+    assistant_id: Any,
+    config_id: Any,
+    namespace: str,
+    name: str,
+    content: str
+) -> Dict[str, Any]:
+    # Ожидающая сборка той же базы получает новый текст вместо второго задания
+    job = db.query(KnowledgeBaseJob).filter(
+        KnowledgeBaseJob.namespace == namespace,
+        KnowledgeBaseJob.status == JOB_QUEUED
+    ).order_by(KnowledgeBaseJob.created_at.desc()).with_for_update().first()
+    if job is not None and job.content != content:
+        # Задание могло быть прервано или ждать повтора с контрольной точкой: она относится
+        # к разнице старого текста, с новым текстом сборка начинается заново
+        job.stored_chunk_ids = _rebase_stored(job, content)
+        job.total_chunks = 0
+        job.kept_chunks = 0
+        job.processed_chunks = 0
+        job.upserted_chunks = 0
+        job.failed_chunks = 0
+        job.deleted_chunks = 0
+        job.failed_chunk_ids = None
+        job.attempts = 0
+        job.error = None
+        job.retry_at = None
+    if job is None:
+        job = KnowledgeBaseJob(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            assistant_id=assistant_id,
+            config_id=config_id,
+            namespace=namespace,
+            status=JOB_QUEUED,
+            total_chunks=0,
+            kept_chunks=0,
+            processed_chunks=0,
+            upserted_chunks=0,
+            failed_chunks=0,
+            deleted_chunks=0,
+            attempts=0
+        )
+        db.add(job)
+    job.name = name
+    job.content = content
+    db.commit()
+    return job_status(job)
+
+
+def _rebase_stored(job: KnowledgeBaseJob, content: str) -> Optional[List[str]]:
+    """
+    Stored chunks of a started job whose text is replaced: the saved set plus
+    the chunks its attempts may have written. Chunks of the old text that are
+    not in the new one count as stored so the new build deletes them; deleting
+    an absent ID is a no-op. Chunks of the new text count only if surely written.
+    """
+    if job.stored_chunk_ids is None:
+        return None
+    # Импорт здесь, чтобы избежать циклического импорта
+    from backend.services.pinecone_service import PineconeService
+
+    chunk_ids, _ = PineconeService.build_manifest(job.content or "")
+    added, _ = PineconeService.diff_chunks(chunk_ids, job.stored_chunk_ids)
+    new_ids = set(PineconeService.build_manifest(content)[0])
+    failed = set(job.failed_chunk_ids or [])
+    stored = list(job.stored_chunk_ids)
+    seen = set(stored)
+    for number, position in enumerate(added):
+        chunk_id = chunk_ids[position]
+        written = number < job.processed_chunks and chunk_id not in failed
+        if chunk_id not in seen and (written or chunk_id not in new_ids):
+            seen.add(chunk_id)
+            stored.append(chunk_id)
+    return stored
+
+
+def _claim(db: Session, lease: int) -> Optional[Dict[str, Any]]:
+    """Take the oldest queued job, or a running one whose worker stopped renewing it"""
+    from backend.models.pinecone_config import PineconeConfig
+
+    expired = func.now() - timedelta(seconds=lease)
+    # Две сборки одной базы одновременно не идут
+    busy = db.query(KnowledgeBaseJob.namespace).filter(
+        KnowledgeBaseJob.status == JOB_RUNNING,
+        KnowledgeBaseJob.heartbeat_at >= expired
+    )
+    # Сборки одной базы идут в порядке постановки: более новый текст не обгоняет
+    # задание, которое ждёт повтора, иначе тот повтор вернул бы старый текст
+    earlier = aliased(KnowledgeBaseJob)
+    waiting_earlier = db.query(earlier.id).filter(
+        earlier.namespace == KnowledgeBaseJob.namespace,
+        earlier.status.in_((JOB_QUEUED, JOB_RUNNING)),
+        earlier.created_at < KnowledgeBaseJob.created_at
+    ).exists()
+    while True:
+        job = db.query(KnowledgeBaseJob).filter(
+            or_(
+                and_(
+                    KnowledgeBaseJob.status == JOB_QUEUED,
+                    or_(KnowledgeBaseJob.retry_at.is_(None), KnowledgeBaseJob.retry_at <= func.now()),
+                    ~KnowledgeBaseJob.namespace.in_(busy),
+                    ~waiting_earlier
+                ),
+                and_(KnowledgeBaseJob.status == JOB_RUNNING, KnowledgeBaseJob.heartbeat_at < expired)
+            )
+        ).order_by(KnowledgeBaseJob.created_at).with_for_update(skip_locked=True).first()
+        if job is None:
+            db.rollback()
+            return None
+
+        if job.attempts >= settings.KB_JOB_MAX_ATTEMPTS:
+            job.status = JOB_FAILED
+            job.error = job.error or "Too many attempts"
+            job.finished_at = func.now()
+            db.commit()
+            logger.error(f"Knowledge base job {job.id} failed after {job.attempts} attempts")
+            continue
+
+        if job.status == JOB_RUNNING:
+            logger.warning(
+                f"Resuming knowledge base job {job.id} of worker {job.worker_id} "
+                f"from chunk {job.processed_chunks}"
+            )
+        job.status = JOB_RUNNING
+        job.worker_id = WORKER_ID
+        job.heartbeat_at = func.now()
+        job.attempts += 1
+        job.started_at = job.started_at or func.now()
+        # Манифест базы: какие фрагменты уже записаны (None — база собрана до манифестов)
+        manifest = []
+        if job.config_id:
+            config = db.query(PineconeConfig).get(job.config_id)
+            manifest = config.chunk_manifest if config else []
+        snapshot = {
+            "id": job.id,
+            "user_id": job.user_id,
+            "namespace": job.namespace,
+            "content": job.content or "",
+            "processed_chunks": job.processed_chunks,
+            "upserted_chunks": job.upserted_chunks,
+            "failed_chunks": job.failed_chunks,
+            "failed_chunk_ids": job.failed_chunk_ids or [],
+            "attempts": job.attempts,
+            "manifest": manifest,
+            "stored_chunk_ids": job.stored_chunk_ids,
+        }
+        db.commit()
+        return snapshot
+
+
+def _own(db: Session, job_id: uuid.UUID):
+    """Query of a job still leased by this worker"""
+    return db.query(KnowledgeBaseJob).filter(
+        KnowledgeBaseJob.id == job_id,
+        KnowledgeBaseJob.status == JOB_RUNNING,
+        KnowledgeBaseJob.worker_id == WORKER_ID
+    )
+
+
+def _own_any(db: Session, job_ids: List[uuid.UUID]):
+    """Query of the jobs still leased by this worker"""
+    return db.query(KnowledgeBaseJob).filter(
+        KnowledgeBaseJob.id.in_(job_ids),
+        KnowledgeBaseJob.status == JOB_RUNNING,
+        KnowledgeBaseJob.worker_id == WORKER_ID
+    )
+
+
+def _checkpoint(db: Session, job_id: uuid.UUID, fields: Dict[str, Any]) -> None:
+    updated = _own(db, job_id).update(
+        dict(fields, heartbeat_at=func.now()), synchronize_session=False
+    )
+    db.commit()
+    if not updated:
+        raise JobLeaseLost(str(job_id))
+
+
+def _heartbeat(db: Session, job_ids: List[uuid.UUID]) -> None:
+    # Только продление аренды: upserted_chunks — часть контрольной точки и пишется в _checkpoint
+    _own_any(db, job_ids).update({KnowledgeBaseJob.heartbeat_at: func.now()}, synchronize_session=False)
+    db.commit()
+
+
+def _finish(db: Session, job_id: uuid.UUID, fields: Dict[str, Any], manifest: List[str]) -> None:
+    """Mark the job done and create or update its knowledge base record in one transaction"""
+    from backend.models.pinecone_config import PineconeConfig
+
+    job = _own(db, job_id).with_for_update().first()
+    if job is None:
+        db.rollback()
+        raise JobLeaseLost(str(job_id))
+
+    content = job.content or ""
+    preview = content[:200] + "..." if len(content) > 200 else content
+    config = db.query(PineconeConfig).get(job.config_id) if job.config_id else None
+    if config is None:
+        config = PineconeConfig(assistant_id=job.assistant_id, namespace=job.namespace)
+        db.add(config)
+    config.namespace = job.namespace
+    config.char_count = len(content)
+    config.content_preview = preview
+    config.full_content = content
+    config.name = job.name
+    config.chunk_manifest = manifest
+    config.updated_at = func.now()
+    db.flush()
+
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.config_id = config.id
+    job.status = JOB_DONE
+    job.error = None
+    job.retry_at = None
+    job.content = None
+    job.failed_chunk_ids = None
+    job.stored_chunk_ids = None
+    job.finished_at = func.now()
+    db.commit()
+
+
+def _fail(db: Session, job_id: uuid.UUID, error: str, retry_in: Optional[float]) -> None:
+    fields = {
+        KnowledgeBaseJob.status: JOB_FAILED,
+        KnowledgeBaseJob.error: error[:2000],
+        KnowledgeBaseJob.worker_id: None,
+        KnowledgeBaseJob.finished_at: func.now(),
+    }
+    if retry_in is not None:
+        # Временная ошибка: повтор с контрольной точки после паузы
+        fields.update({
+            KnowledgeBaseJob.status: JOB_QUEUED,
+            KnowledgeBaseJob.finished_at: None,
+            KnowledgeBaseJob.retry_at: func.now() + timedelta(seconds=retry_in),
+        })
+    _own(db, job_id).update(fields, synchronize_session=False)
+    db.commit()
+
+
+def _release(db: Session, job_ids: List[uuid.UUID]) -> None:
+    """Return jobs of a stopping worker to the queue; they resume from their checkpoint"""
+    if job_ids:
+        db.query(KnowledgeBaseJob).filter(
+            KnowledgeBaseJob.id.in_(job_ids),
+            KnowledgeBaseJob.worker_id == WORKER_ID,
+            KnowledgeBaseJob.status == JOB_RUNNING
+        ).update(
+            {KnowledgeBaseJob.status: JOB_QUEUED, KnowledgeBaseJob.worker_id: None,
+             KnowledgeBaseJob.attempts: KnowledgeBaseJob.attempts - 1},
+            synchronize_session=False
+        )
+        db.commit()
+
+
+def _cancel(db: Session, namespace: str) -> None:
+    db.query(KnowledgeBaseJob).filter(
+        KnowledgeBaseJob.namespace == namespace,
+        KnowledgeBaseJob.status.in_((JOB_QUEUED, JOB_RUNNING))
+    ).update(
+        {KnowledgeBaseJob.status: JOB_FAILED, KnowledgeBaseJob.error: "Knowledge base deleted",
+         KnowledgeBaseJob.content: None, KnowledgeBaseJob.finished_at: func.now()},
+        synchronize_session=False
+    )
+    db.commit()
+
+
+def _api_key(db: Session, user_id: uuid.UUID) -> Optional[str]:
+    from backend.models.user import User
+
+    user = db.query(User).get(user_id)
+    return user.openai_api_key if user else None
+
+
+def _get(db: Session, job_id: uuid.UUID) -> Optional[KnowledgeBaseJob]:
+    job = db.query(KnowledgeBaseJob).get(job_id)
+    if job is not None:
+        db.expunge(job)
+    return job
+
+
+class KnowledgeBaseJobQueue:
+    """
+    Worker side of the knowledge base build queue.
+
+    Up to KB_JOB_WORKERS jobs are built at once; their embedding requests
+    share one budget of KB_JOB_EMBEDDING_CONCURRENCY requests in flight on
+    top of the per-key rate limiting, so parallel builds do not multiply the
+    load on the embedding API. Leases of running jobs are renewed together
+    in one query; progress inside a segment is kept in memory and merged
+    into job reads on this worker.
+    """
+
+    def __init__(self, workers: int = None, poll_interval: float = None):
+        """
+        Initialize the queue
+
+        Args:
+            workers: Jobs built at once (default: settings.KB_JOB_WORKERS)
+            poll_interval: Seconds between queue checks (default: settings.KB_JOB_POLL_SECONDS)
+        """
+        self.workers = workers or settings.KB_JOB_WORKERS
+        self.poll_interval = poll_interval or settings.KB_JOB_POLL_SECONDS
+        self.lease = settings.KB_JOB_LEASE_SECONDS
+        self._running: Dict[uuid.UUID, asyncio.Task] = {}
+        # Число записанных фрагментов заданий этого воркера, обновляется между контрольными точками
+        self._progress: Dict[uuid.UUID, int] = {}
+        self._namespaces: Dict[uuid.UUID, str] = {}
+        self._budget: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "claimed": 0,
+            "done": 0,
+            "failed": 0,
+            "retried": 0,
+        }
+
+    def start(self) -> None:
+        """Start taking jobs from the queue"""
+        if self._task is not None and not self._task.done():
+            return
+        self._budget = asyncio.Semaphore(settings.KB_JOB_EMBEDDING_CONCURRENCY)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(f"Knowledge base job queue started with {self.workers} workers")
+
+    async def enqueue(
+        self,
+        user_id: Any,
+        assistant_id: Any,
+        namespace: str,
+        name: str,
+        content: str,
+        config_id: Any = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a knowledge base build
+
+        Args:
+            user_id: Owner of the knowledge base
+            assistant_id: Assistant a new knowledge base is linked to
+            namespace: Namespace to build (replaced if it exists)
+            name: Knowledge base name
+            content: Knowledge base text
+            config_id: Knowledge base record to update, None to create one when the build is done
+
+        Returns:
+            Job status
+        """
+        job = await run_in_session(_enqueue, user_id, assistant_id, config_id, namespace, name, content)
+        logger.info(f"Queued knowledge base job {job['id']} for {namespace} ({len(content)} chars)")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def cancel(self, namespace: str) -> None:
+        """
+        Stop builds of a deleted knowledge base; a build running on another
+        worker stops at its next checkpoint
+
+        Args:
+            namespace: Namespace of the knowledge base
+        """
+        await run_in_session(_cancel, namespace)
+        for job_id, task in list(self._running.items()):
+            if self._namespaces.get(job_id) == namespace:
+                task.cancel()
+
+    async def get(self, job_id: Any) -> Optional[KnowledgeBaseJob]:
+        """
+        Get a job with the latest progress
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            Job row (detached) or None
+        """
+        try:
+            job_id = uuid.UUID(str(job_id))
+        except ValueError:
+            return None
+        job = await run_in_session(_get, job_id)
+        # Задание этого воркера: прогресс свежее, чем в базе
+        if job is not None and job_id in self._progress:
+            job.upserted_chunks = max(job.upserted_chunks, self._progress[job_id])
+        return job
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while len(self._running) < self.workers:
+                    job = await run_in_session(_claim, self.lease)
+                    if job is None:
+                        break
+                    self.metrics["claimed"] += 1
+                    self._namespaces[job["id"]] = job["namespace"]
+                    self._running[job["id"]] = asyncio.create_task(self._build(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error taking knowledge base jobs: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _build(self, job: Dict[str, Any]) -> None:
+        # Импорт здесь, чтобы избежать циклического импорта
+        from backend.services.pinecone_service import PineconeService
+
+        job_id = job["id"]
+        namespace = job["namespace"]
+        done = job["processed_chunks"]
+        counters = {"upserted_chunks": job["upserted_chunks"], "failed_chunks": job["failed_chunks"]}
+        failed_ids = list(job["failed_chunk_ids"])
+        self._progress[job_id] = counters["upserted_chunks"]
+        try:
+            api_key = await run_in_session(_api_key, job["user_id"])
+            if not api_key:
+                raise ValueError("OpenAI API key is required for knowledge base creation")
+
+            # Разница с фрагментами namespace на момент первого запуска: список без манифеста
+            # уже содержит записанное прерванной попыткой, поэтому он сохраняется в задании,
+            # и контрольная точка при продолжении указывает на то же место списка новых фрагментов
+            chunk_ids, chunks = PineconeService.build_manifest(job["content"])
+            index = await PineconeService.get_index()
+            stored = job["stored_chunk_ids"]
+            if stored is None:
+                stored = await PineconeService.stored_chunk_ids(index, namespace, job["manifest"])
+            added, removed = PineconeService.diff_chunks(chunk_ids, stored)
+            await run_in_session(_checkpoint, job_id, {
+                "total_chunks": len(chunk_ids),
+                "kept_chunks": len(chunk_ids) - len(added),
+                "stored_chunk_ids": stored,
+            })
+
+            step = settings.KB_JOB_CHECKPOINT_CHUNKS
+            while done < len(added):
+                segment = added[done:done + step]
+                base = counters["upserted_chunks"]
+
+                def on_progress(embedded: int, upserted: int, total: int) -> None:
+                    self._progress[job_id] = base + upserted
+
+                segment_ids = [chunk_ids[position] for position in segment]
+                upserted = await PineconeService.ingest_chunks(
+                    index, namespace, [chunks[position] for position in segment], api_key, segment_ids,
+                    on_progress=on_progress, budget=self._budget
+                )
+                if not upserted:
+                    raise RuntimeError(f"No chunks embedded in {done}-{done + len(segment) - 1}")
+                done += len(segment)
+                failed_ids.extend(set(segment_ids) - set(upserted))
+                counters["upserted_chunks"] += len(upserted)
+                counters["failed_chunks"] = len(failed_ids)
+                await run_in_session(
+                    _checkpoint, job_id, dict(counters, processed_chunks=done, failed_chunk_ids=failed_ids)
+                )
+
+            # Исчезнувшие фрагменты удаляются после записи новых: namespace не бывает пустым
+            await PineconeService.delete_chunks(index, namespace, removed)
+
+            # Неудавшиеся фрагменты не попадают в манифест и будут добавлены при следующем обновлении
+            failed = set(failed_ids)
+            manifest = [chunk_id for chunk_id in chunk_ids if chunk_id not in failed]
+            await run_in_session(_finish, job_id, dict(counters, deleted_chunks=len(removed)), manifest)
+            self.metrics["done"] += 1
+            logger.info(
+                f"Knowledge base job {job_id} done: {namespace} +{counters['upserted_chunks']} "
+                f"-{len(removed)} ={len(chunk_ids) - len(added)} chunks"
+            )
+        except JobLeaseLost:
+            logger.warning(f"Knowledge base job {job_id} was taken over by another worker")
+        except Exception as e:
+            # Ошибки клиента не повторяются, временные — с контрольной точки, пауза растёт с каждой попыткой
+            retry = not isinstance(e, ValueError) and getattr(e, "status_code", 500) >= 500
+            retry_in = settings.KB_JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1) if retry else None
+            self.metrics["retried" if retry else "failed"] += 1
+            logger.error(f"Knowledge base job {job_id} failed at chunk {done}: {e}")
+            try:
+                await run_in_session(_fail, job_id, str(getattr(e, "detail", None) or e), retry_in)
+            except Exception as db_error:
+                logger.error(f"Error saving failure of knowledge base job {job_id}: {db_error}")
+        finally:
+            self._running.pop(job_id, None)
+            self._progress.pop(job_id, None)
+            self._namespaces.pop(job_id, None)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    async def _heartbeat(self) -> None:
+        interval = max(1, self.lease // 3)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                if not self._progress:
+                    continue
+                try:
+                    await run_in_session(_heartbeat, list(self._progress))
+                except Exception as e:
+                    logger.error(f"Error renewing knowledge base job leases: {e}")
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self) -> None:
+        """Stop building and return unfinished jobs to the queue"""
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                task.cancel()
+        self._task = self._heartbeat_task = None
+        job_ids = list(self._running)
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await run_in_session(_release, job_ids)
+        except Exception as e:
+            logger.error(f"Error releasing knowledge base jobs: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue counters of this worker
+
+        Returns:
+            Dict with running jobs and job metrics
+        """
+        return {"running": len(self._running), **self.metrics}
+
+
+# Очередь на процесс
+knowledge_base_jobs = KnowledgeBaseJobQueue()
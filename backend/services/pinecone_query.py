@@ -0,0 +1,146 @@
+"""
+Async Pinecone query client for the voice path.
+Queries go over one pooled aiohttp session with keep-alive connections and
+per-request timeouts, so a knowledge base search never blocks the event loop.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class PineconeQueryError(Exception):
+    """Pinecone answered with an error status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Pinecone query failed: {status}")
+        self.status = status
+        self.message = message
+
+
+class PineconeQueryClient:
+    """
+    Pooled HTTP client for the Pinecone query endpoint of the knowledge base index
+    """
+
+    def __init__(self, host: str = None, pool_size: int = None):
+        """
+        Initialize the client
+
+        Args:
+            host: Index host (default: settings.PINECONE_INDEX_HOST)
+            pool_size: Max open connections (default: settings.PINECONE_HTTP_POOL_SIZE)
+        """
+        self.host = (host or settings.PINECONE_INDEX_HOST).rstrip("/")
+        self.pool_size = pool_size or settings.PINECONE_HTTP_POOL_SIZE
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.metrics = {
+            "requests": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "total_ms": 0.0,
+        }
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Get the shared session, creating it on first use
+
+        Returns:
+            aiohttp session with a keep-alive connection pool
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            )
+        return self._session
+
+    async def query(
+        self,
+        vector: List[float],
+        namespace: str,
+        api_key: str,
+        top_k: int = 3,
+        timeout: float = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the nearest vectors of a namespace
+
+        Args:
+            vector: Query embedding
+            namespace: Knowledge base namespace
+            api_key: Pinecone API key
+            top_k: Number of matches
+            timeout: Seconds for the whole query (default: settings.PINECONE_QUERY_TIMEOUT_SECONDS)
+
+        Returns:
+            Matches with id, score and metadata
+
+        Raises:
+            asyncio.TimeoutError: The query did not finish in time
+            PineconeQueryError: Pinecone answered with an error status
+        """
+        deadline = time.monotonic() + (timeout or settings.PINECONE_QUERY_TIMEOUT_SECONDS)
+        payload = {"vector": vector, "namespace": namespace, "topK": top_k, "includeMetadata": True}
+        headers = {"Api-Key": api_key, "Content-Type": "application/json"}
+        started = time.monotonic()
+        for attempt in range(2):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.metrics["timeouts"] += 1
+                raise asyncio.TimeoutError()
+            try:
+                async with self.session().post(
+                    f"{self.host}/query", json=payload, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=remaining)
+                ) as response:
+                    if response.status != 200:
+                        self.metrics["errors"] += 1
+                        raise PineconeQueryError(response.status, await response.text())
+                    result = await response.json()
+                break
+            except asyncio.TimeoutError:
+                self.metrics["timeouts"] += 1
+                raise
+            except aiohttp.ClientConnectionError as e:
+                # Соединение из пула могло быть закрыто сервером — одна повторная попытка
+                if attempt:
+                    self.metrics["errors"] += 1
+                    raise
+                self.metrics["reconnects"] += 1
+                logger.warning(f"Pinecone connection dropped, retrying query: {e}")
+        self.metrics["requests"] += 1
+        self.metrics["total_ms"] += (time.monotonic() - started) * 1000
+        return result.get("matches", [])
+
+    async def close(self) -> None:
+        """Close the pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get query counters
+
+        Returns:
+            Dict with requests, errors, timeouts and mean latency
+        """
+        requests = self.metrics["requests"]
+        return {
+            "host": self.host,
+            "pool_size": self.pool_size,
+            "mean_ms": round(self.metrics["total_ms"] / requests, 1) if requests else 0.0,
+            **{key: value for key, value in self.metrics.items() if key != "total_ms"}
+        }
+
+
+# Клиент на процесс
+pinecone_query = PineconeQueryClient()
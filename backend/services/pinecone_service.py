@@ -2,19 +2,29 @@
 import os
 import uuid
 import json
-from typing import List, Dict, Optional, Tuple
+import hashlib
+from typing import List, Dict, Optional, Sequence, Tuple
 import asyncio
 
-import openai
 import pinecone
 from fastapi import HTTPException, status
 
 from backend.core.logging import get_logger
 from backend.core.config import settings
 from backend.models.pinecone_config import PineconeConfig
+from backend.services.embedding_service import ProgressCallback, embedding_service
 
 logger = get_logger(__name__)
 
+# Индекс Pinecone с базами знаний (namespace на базу)
+INDEX_NAME = "voicufi"
+
+# Максимальный размер текста базы знаний
+MAX_CONTENT_CHARS = 500000
+
+# Сколько ID удаляется одним запросом к Pinecone
+DELETE_BATCH_SIZE = 1000
+
 class PineconeService:
     @staticmethod
     async def initialize():
@@ -37,13 +47,9 @@ class PineconeService:
     @staticmethod
     async def create_embeddings(text: str, api_key: str, model: str = "text-embedding-3-small") -> List[float]:
         """Create embeddings using OpenAI API"""
-        client = openai.OpenAI(api_key=api_key)
         try:
-            response = client.embeddings.create(
-                model=model, 
-                input=text
-            )
-            return response.data[0].embedding
+            # Общий асинхронный клиент ключа и кэш эмбеддингов, без блокировки event loop
+            return (await embedding_service.embed([text], api_key, model))[0]
         except Exception as e:
             logger.error(f"Error creating embeddings: {str(e)}")
             raise HTTPException(
@@ -55,87 +61,57 @@ class PineconeService:
     async def create_or_update_knowledge_base(
         content: str, 
         api_key: str, 
-        namespace: Optional[str] = None
-    ) -> Tuple[str, int]:
-        """Create a new namespace in Pinecone with embeddings from content or update existing"""
-        try:
-            # Initialize Pinecone
-            pc = await PineconeService.initialize()
+        namespace: Optional[str] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        manifest: Optional[List[str]] = None
+    ) -> Tuple[str, int, List[str]]:
+        """
+        Create a new namespace in Pinecone with embeddings from content or update existing
+        
+        Only chunks missing from the namespace are embedded; chunks that are no
+        longer in the content are deleted after the new ones are written.
+        
+        Args:
+            content: Knowledge base text
+            api_key: OpenAI API key of the owner
+            namespace: Existing namespace to update, a new one is generated if omitted
+            on_progress: Called with (embedded, upserted, total) chunk counters
+            manifest: Chunk IDs stored in the namespace (None if unknown)
             
+        Returns:
+            Tuple of namespace, content length and the new manifest
+        """
+        try:
             # Check content limits
-            if len(content) > 500000:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Content exceeds maximum limit of 500,000 characters"
-                )
+            PineconeService.check_content(content)
             
             # Generate a namespace if not provided
             if not namespace:
-                namespace = f"kb-{uuid.uuid4().hex[:10]}"
+                namespace = PineconeService.new_namespace()
+                manifest = []
                 
             # Process content into chunks
-            chunks = PineconeService._process_text_into_chunks(content)
+            chunk_ids, chunks = PineconeService.build_manifest(content)
             logger.info(f"Processed content into {len(chunks)} chunks")
             
-            # Get index
-            index_name = "voicufi"  # Используем ваш существующий индекс
-            try:
-                index = pc.Index(index_name)
-            except Exception as e:
-                logger.error(f"Error accessing Pinecone index: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to access Pinecone index"
-                )
-            
-            # If namespace exists, delete old vectors
-            try:
-                stats = index.describe_index_stats()
-                namespaces = stats.get("namespaces", {})
-                if namespace in namespaces:
-                    logger.info(f"Deleting existing namespace: {namespace}")
-                    index.delete(namespace=namespace, delete_all=True)
-            except Exception as e:
-                logger.warning(f"Error checking/deleting namespace: {str(e)}")
-            
-            # Create batches for parallel processing
-            batch_size = 10  # Adjust based on your rate limits
-            batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+            index = await PineconeService.get_index()
+            stored = await PineconeService.stored_chunk_ids(index, namespace, manifest)
+            added, removed = PineconeService.diff_chunks(chunk_ids, stored)
+            logger.info(
+                f"Updating {namespace}: {len(added)} new, {len(removed)} removed, "
+                f"{len(chunk_ids) - len(added)} unchanged chunks"
+            )
             
-            # Process each batch
-            for batch_idx, batch in enumerate(batches):
-                logger.info(f"Processing batch {batch_idx+1}/{len(batches)}")
-                vectors = []
-                
-                # Create embeddings for each chunk in batch
-                for i, chunk in enumerate(batch):
-                    chunk_id = batch_idx * batch_size + i
-                    try:
-                        embedding = await PineconeService.create_embeddings(chunk, api_key)
-                        vectors.append({
-                            'id': f"{namespace}-{chunk_id}",
-                            'values': embedding,
-                            'metadata': {
-                                'text': chunk,
-                                'chunk_id': chunk_id
-                            }
-                        })
-                    except Exception as e:
-                        logger.error(f"Error creating embedding for chunk {chunk_id}: {str(e)}")
-                
-                # Upsert vectors into the index
-                if vectors:
-                    try:
-                        index.upsert(vectors=vectors, namespace=namespace)
-                        logger.info(f"Upserted {len(vectors)} vectors in batch {batch_idx+1}")
-                    except Exception as e:
-                        logger.error(f"Error upserting vectors: {str(e)}")
-                
-                # Add delay to avoid rate limits
-                await asyncio.sleep(1)
+            upserted = await PineconeService.ingest_chunks(
+                index, namespace, [chunks[i] for i in added], api_key,
+                [chunk_ids[i] for i in added], on_progress=on_progress
+            )
+            await PineconeService.delete_chunks(index, namespace, removed)
             
+            # Неудавшиеся фрагменты не попадают в манифест и будут добавлены при следующем обновлении
+            failed = {chunk_ids[i] for i in added} - set(upserted)
             logger.info(f"Knowledge base created/updated successfully with namespace: {namespace}")
-            return namespace, len(content)
+            return namespace, len(content), [chunk_id for chunk_id in chunk_ids if chunk_id not in failed]
         except HTTPException:
             raise
         except Exception as e:
@@ -145,6 +121,190 @@ class PineconeService:
                 detail=f"Failed to create/update knowledge base: {str(e)}"
             )
     
+    @staticmethod
+    def check_content(content: str) -> None:
+        """Reject content over the knowledge base size limit"""
+        if len(content) > MAX_CONTENT_CHARS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Content exceeds maximum limit of 500,000 characters"
+            )
+    
+    @staticmethod
+    def new_namespace() -> str:
+        """Generate a namespace for a new knowledge base"""
+        return f"kb-{uuid.uuid4().hex[:10]}"
+    
+    @staticmethod
+    async def get_index():
+        """Get the Pinecone index holding the knowledge bases"""
+        pc = await PineconeService.initialize()
+        try:
+            return pc.Index(INDEX_NAME)
+        except Exception as e:
+            logger.error(f"Error accessing Pinecone index: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to access Pinecone index"
+            )
+    
+    @staticmethod
+    def chunk_id(text: str) -> str:
+        """Stable ID of a chunk derived from its text"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+    
+    @staticmethod
+    def build_manifest(content: str) -> Tuple[List[str], List[str]]:
+        """
+        Split content into chunks keyed by their content hash
+        
+        Args:
+            content: Knowledge base text
+            
+        Returns:
+            Tuple of chunk IDs and chunk texts in document order; repeated chunks are kept once
+        """
+        chunk_ids, chunks, seen = [], [], set()
+        for chunk in PineconeService._process_text_into_chunks(content):
+            # Пустой фрагмент (абзац длиннее фрагмента в начале текста) API эмбеддингов отклоняет
+            if not chunk:
+                continue
+            chunk_id = PineconeService.chunk_id(chunk)
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                chunk_ids.append(chunk_id)
+                chunks.append(chunk)
+        return chunk_ids, chunks
+    
+    @staticmethod
+    def diff_chunks(chunk_ids: Sequence[str], stored: Sequence[str]) -> Tuple[List[int], List[str]]:
+        """
+        Compare the chunks of new content with the chunks stored in a namespace
+        
+        Args:
+            chunk_ids: Chunk IDs of the new content
+            stored: Chunk IDs in the namespace
+            
+        Returns:
+            Tuple of positions in chunk_ids to embed and stored IDs to delete
+        """
+        stored_set = set(stored)
+        new_set = set(chunk_ids)
+        added = [position for position, chunk_id in enumerate(chunk_ids) if chunk_id not in stored_set]
+        removed = [chunk_id for chunk_id in stored if chunk_id not in new_set]
+        return added, removed
+    
+    @staticmethod
+    async def stored_chunk_ids(index, namespace: str, manifest: Optional[List[str]]) -> List[str]:
+        """
+        Chunk IDs stored in a namespace
+        
+        Args:
+            index: Pinecone index
+            namespace: Namespace of the knowledge base
+            manifest: Saved manifest; None for namespaces built before manifests were kept
+            
+        Returns:
+            Chunk IDs; without a manifest the listed IDs, or the positional IDs
+            an old namespace was built with if the index cannot list them
+        """
+        if manifest is not None:
+            return list(manifest)
+        # Клиент Pinecone синхронный — его вызовы уходят в поток
+        prefix = f"{namespace}-"
+        try:
+            # Serverless-индекс отдаёт список ID; pod-индекс его не поддерживает
+            pages = await asyncio.to_thread(
+                lambda: [list(page) for page in index.list(prefix=prefix, namespace=namespace)]
+            )
+            return [vector_id[len(prefix):] for page in pages for vector_id in page]
+        except Exception as e:
+            logger.info(f"Listing vectors of {namespace} is not available, using vector count: {e}")
+        stats = await asyncio.to_thread(index.describe_index_stats)
+        summary = stats.get("namespaces", {}).get(namespace)
+        if summary is None:
+            return []
+        count = getattr(summary, "vector_count", None)
+        if count is None:
+            count = summary.get("vector_count", 0)
+        # Раньше фрагменты нумеровались по порядку: {namespace}-0, {namespace}-1, ...
+        return [str(position) for position in range(count)]
+    
+    @staticmethod
+    async def delete_chunks(index, namespace: str, chunk_ids: Sequence[str]) -> None:
+        """
+        Delete chunks from a namespace
+        
+        Args:
+            index: Pinecone index
+            namespace: Namespace of the knowledge base
+            chunk_ids: Chunk IDs to delete
+        """
+        for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+            ids = [f"{namespace}-{chunk_id}" for chunk_id in chunk_ids[start:start + DELETE_BATCH_SIZE]]
+            await asyncio.to_thread(index.delete, ids=ids, namespace=namespace)
+        if chunk_ids:
+            logger.info(f"Deleted {len(chunk_ids)} vectors from {namespace}")
+    
+    @staticmethod
+    async def ingest_chunks(
+        index,
+        namespace: str,
+        chunks: List[str],
+        api_key: str,
+        chunk_ids: Sequence[str],
+        on_progress: Optional[ProgressCallback] = None,
+        budget: Optional[asyncio.Semaphore] = None
+    ) -> List[str]:
+        """
+        Embed chunks and upsert them into a namespace
+        
+        Chunks are embedded in batched concurrent requests and upserted while
+        the next batches are still being embedded. Writing a chunk again
+        overwrites the same vector.
+        
+        Args:
+            index: Pinecone index
+            namespace: Target namespace
+            chunks: Chunk texts
+            api_key: OpenAI API key of the owner
+            chunk_ids: IDs of the chunks
+            on_progress: Called with (embedded, upserted, total) chunk counters
+            budget: Semaphore bounding embedding requests shared with other builds
+            
+        Returns:
+            IDs of the upserted chunks
+        """
+        upserted: List[str] = []
+        
+        def build_vectors(positions: List[int], embeddings: List[List[float]]) -> List[Dict]:
+            return [
+                {
+                    'id': f"{namespace}-{chunk_ids[position]}",
+                    'values': embedding,
+                    'metadata': {
+                        'text': chunks[position],
+                        'chunk_id': chunk_ids[position]
+                    }
+                }
+                for position, embedding in zip(positions, embeddings)
+            ]
+        
+        async def upsert(vectors: List[Dict]) -> None:
+            try:
+                await asyncio.to_thread(index.upsert, vectors=vectors, namespace=namespace)
+                logger.info(f"Upserted {len(vectors)} vectors into {namespace}")
+            except Exception as e:
+                logger.error(f"Error upserting vectors: {str(e)}")
+                raise
+            upserted.extend(vector['metadata']['chunk_id'] for vector in vectors)
+        
+        # Эмбеддинги пакетами с ограниченной параллельностью, запись — по мере готовности
+        await embedding_service.ingest(
+            chunks, api_key, build_vectors, upsert, on_progress=on_progress, budget=budget
+        )
+        return upserted
+    
     @staticmethod
     def _process_text_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Process text into overlapping chunks for better vector representation"""
@@ -176,16 +336,15 @@ class PineconeService:
             pc = await PineconeService.initialize()
             
             # Get the index
-            index_name = "voicufi"
             try:
-                index = pc.Index(index_name)
+                index = pc.Index(INDEX_NAME)
             except Exception as e:
                 logger.error(f"Error accessing Pinecone index: {str(e)}")
                 return False
             
             # Delete all vectors in the namespace
             try:
-                index.delete(namespace=namespace, delete_all=True)
+                await asyncio.to_thread(index.delete, namespace=namespace, delete_all=True)
                 logger.info(f"Deleted namespace: {namespace}")
                 return True
             except Exception as e:
@@ -14,6 +14,7 @@ from backend.core.logging import get_logger
 from backend.models.user import User
 from backend.models.subscription import SubscriptionPlan
 from backend.models.subscription_log import SubscriptionLog
+from backend.services.assistant_cache import assistant_cache
 
 
 logger = get_logger(__name__)
@@ -91,6 +92,8 @@ class SubscriptionService:
             
             db.commit()
             db.refresh(user)
+            # Лимит одновременных звонков кэшируется вместе с конфигом ассистентов
+            assistant_cache.invalidate_user(user.id)
             
             # Логирование активации пробного периода
             await SubscriptionService.log_subscription_event(
@@ -175,6 +178,8 @@ class SubscriptionService:
             
             if updated_count > 0:
                 db.commit()
+                for user in expired_users:
+                    assistant_cache.invalidate_user(user.id)
                 logger.info(f"Updated {updated_count} expired subscriptions")
                 
             return updated_count
@@ -15,6 +15,7 @@ from backend.models.assistant import AssistantConfig  # Правильный и
 from backend.models.file import File  # Добавлен импорт для файлов
 from backend.models.subscription import SubscriptionPlan # Добавлен импорт для подписок
 from backend.schemas.user import UserUpdate, UserResponse, UserDetailResponse
+from backend.services.assistant_cache import assistant_cache
 
 logger = get_logger(__name__)
 
@@ -143,7 +144,8 @@ class UserService:
                 update_data = user_data.model_dump(exclude_unset=True)
             
             # Явно обрабатываем случай с API ключом
-            if 'openai_api_key' in update_data:
+            key_changed = 'openai_api_key' in update_data
+            if key_changed:
                 # Разрешаем пустую строку или None
                 user.openai_api_key = update_data.pop('openai_api_key')
             
@@ -153,6 +155,9 @@ class UserService:
             
             db.commit()
             db.refresh(user)
+            if key_changed:
+                # Ключ кэшируется вместе с конфигом ассистентов пользователя
+                assistant_cache.invalidate_user(user.id)
             
             logger.info(f"User updated successfully: {user_id}")
             
@@ -360,6 +365,8 @@ class UserService:
             # Сохраняем изменения
             db.commit()
             db.refresh(user)
+            # Лимит одновременных звонков кэшируется вместе с конфигом ассистентов
+            assistant_cache.invalidate_user(user.id)
             
             logger.info(f"Set subscription plan {plan_code} for user {user_id} for {duration_days} days")
             
@@ -6,7 +6,10 @@ Contains helper functions and utilities used across the application.
 from .audio_utils import (
     audio_buffer_to_base64, 
     base64_to_audio_buffer,
-    create_wav_from_pcm
+    create_wav_from_pcm,
+    write_wav,
+    measure_levels,
+    normalize_gain
 )
 from .error_handling import (
     handle_exception, 
@@ -38,6 +41,9 @@ __all__ = [
     "audio_buffer_to_base64", 
     "base64_to_audio_buffer",
     "create_wav_from_pcm",
+    "write_wav",
+    "measure_levels",
+    "normalize_gain",
     
     # Error handling
     "handle_exception", 
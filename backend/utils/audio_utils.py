@@ -3,11 +3,15 @@ Audio utilities for WellcomeAI application.
 """
 
 import base64
+import math
+import os
 import struct
 import numpy as np
-from typing import Union, Optional
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
 import io
 
+from backend.core.config import settings
 from backend.core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -47,6 +51,85 @@ def base64_to_audio_buffer(base64_str: str) -> bytes:
         logger.error(f"Error converting base64 to audio buffer: {str(e)}")
         raise
 
+# Заголовок WAV (RIFF + fmt + data) одним вызовом pack
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+WAV_HEADER_SIZE = WAV_HEADER.size
+
+# Размер блока для пакетной обработки длинных буферов через переиспользуемый float32-буфер
+_BLOCK_SAMPLES = 65536
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+class WorkBuffers:
+    """Named scratch arrays reused across calls, grown geometrically"""
+
+    def __init__(self):
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def get(self, name: str, size: int, dtype: Any = np.float32, width: int = 0) -> np.ndarray:
+        """
+        Get a scratch array of at least size rows
+
+        Args:
+            name: Buffer name
+            size: Rows needed
+            dtype: Element type
+            width: Columns for a 2-D buffer (0 for 1-D)
+
+        Returns:
+            View of exactly size rows; its contents are undefined
+        """
+        array = self._arrays.get(name)
+        if array is None or len(array) < size:
+            rows = max(size, 2 * len(array) if array is not None else size)
+            array = self._arrays[name] = np.empty((rows, width) if width else rows, dtype=dtype)
+        return array[:size]
+
+
+def pack_wav_header(
+    buffer: Union[bytearray, memoryview],
+    data_size: int,
+    sample_rate: int = 24000,
+    sample_width: int = 2,
+    channels: int = 1,
+    offset: int = 0
+) -> None:
+    """
+    Write a PCM WAV header into an existing buffer
+
+    Args:
+        buffer: Writable buffer with at least WAV_HEADER_SIZE bytes after offset
+        data_size: Size of the PCM payload in bytes
+        sample_rate: Sample rate in Hz (default: 24000)
+        sample_width: Sample width in bytes (default: 2 for 16-bit)
+        channels: Number of channels (default: 1 for mono)
+        offset: Position of the header in the buffer
+    """
+    WAV_HEADER.pack_into(
+        buffer, offset,
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b"data", data_size
+    )
+
+def wav_header(data_size: int, sample_rate: int = 24000, sample_width: int = 2, channels: int = 1) -> bytes:
+    """
+    Build a PCM WAV header
+
+    Args:
+        data_size: Size of the PCM payload in bytes
+        sample_rate: Sample rate in Hz (default: 24000)
+        sample_width: Sample width in bytes (default: 2 for 16-bit)
+        channels: Number of channels (default: 1 for mono)
+
+    Returns:
+        44-byte header
+    """
+    header = bytearray(WAV_HEADER_SIZE)
+    pack_wav_header(header, data_size, sample_rate, sample_width, channels)
+    return bytes(header)
+
 def create_wav_from_pcm(
     pcm_data: bytes, 
     sample_rate: int = 24000, 
@@ -66,48 +149,86 @@ def create_wav_from_pcm(
         WAV file as bytes
     """
     try:
-        # Calculate sizes
-        data_size = len(pcm_data)
-        file_size = 36 + data_size
-        
-        # Create header
-        header = bytearray()
-        
-        # RIFF chunk descriptor
-        header.extend(b'RIFF')
-        header.extend(struct.pack('<I', file_size))
-        header.extend(b'WAVE')
-        
-        # fmt sub-chunk
-        header.extend(b'fmt ')
-        header.extend(struct.pack('<I', 16))  # Subchunk1Size (16 for PCM)
-        header.extend(struct.pack('<H', 1))   # AudioFormat (1 for PCM)
-        header.extend(struct.pack('<H', channels))  # NumChannels
-        header.extend(struct.pack('<I', sample_rate))  # SampleRate
-        header.extend(struct.pack('<I', sample_rate * channels * sample_width))  # ByteRate
-        header.extend(struct.pack('<H', channels * sample_width))  # BlockAlign
-        header.extend(struct.pack('<H', sample_width * 8))  # BitsPerSample
-        
-        # data sub-chunk
-        header.extend(b'data')
-        header.extend(struct.pack('<I', data_size))
-        
-        # Combine header and PCM data
-        wav_data = header + pcm_data
-        
-        return wav_data
+        data_size = len(memoryview(pcm_data).cast("B"))
+        # join выделяет результат точного размера и копирует PCM один раз, без обнуления буфера
+        return b"".join((wav_header(data_size, sample_rate, sample_width, channels), pcm_data))
     except Exception as e:
         logger.error(f"Error creating WAV from PCM: {str(e)}")
         raise
 
+def write_wav(
+    target: Any,
+    pcm_chunks: List[BytesLike],
+    sample_rate: int = 24000,
+    sample_width: int = 2,
+    channels: int = 1
+) -> int:
+    """
+    Write a WAV file from PCM chunks without joining them in memory
+
+    Args:
+        target: File descriptor or binary file object
+        pcm_chunks: PCM payload split into any number of buffers
+        sample_rate: Sample rate in Hz (default: 24000)
+        sample_width: Sample width in bytes (default: 2 for 16-bit)
+        channels: Number of channels (default: 1 for mono)
+
+    Returns:
+        Number of bytes written
+    """
+    segments = [memoryview(chunk).cast("B") for chunk in pcm_chunks]
+    segments.insert(0, memoryview(wav_header(sum(len(s) for s in segments), sample_rate, sample_width, channels)))
+    total = sum(len(s) for s in segments)
+
+    fd = target if isinstance(target, int) else None
+    if fd is None and hasattr(os, "writev"):
+        try:
+            target.flush()
+            fd = target.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fd = None
+
+    if fd is None:
+        for segment in segments:
+            target.write(segment)
+        return total
+
+    # Scatter-запись: ядро собирает заголовок и PCM сразу из исходных буферов
+    index = 0
+    while index < len(segments):
+        written = os.writev(fd, segments[index:index + 1024])
+        while index < len(segments) and written >= len(segments[index]):
+            written -= len(segments[index])
+            index += 1
+        if written:
+            segments[index] = segments[index][written:]
+    return total
+
+def pcm16_view(data: BytesLike) -> np.ndarray:
+    """
+    Zero-copy int16 view of PCM16 bytes (a trailing odd byte is ignored)
+
+    Args:
+        data: PCM16 little-endian audio
+
+    Returns:
+        Int16 array sharing memory with data (read-only for bytes)
+    """
+    view = memoryview(data).cast("B")
+    return np.frombuffer(view[:len(view) - len(view) % 2], dtype=np.int16)
+
 def float32_to_int16(
-    float32_array: np.ndarray
+    float32_array: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    work: Optional[np.ndarray] = None
 ) -> np.ndarray:
     """
     Convert float32 numpy array to int16 numpy array
     
     Args:
         float32_array: Float32 numpy array in range [-1.0, 1.0]
+        out: Int16 array to write the result into (allocated if not given)
+        work: Float32 scratch of the same length; pass float32_array itself to convert in place
         
     Returns:
         Int16 numpy array
@@ -115,24 +236,28 @@ def float32_to_int16(
     try:
         # Ensure input is float32 array
         float32_array = np.asarray(float32_array, dtype=np.float32)
+        if out is None:
+            out = np.empty(float32_array.shape, dtype=np.int16)
         
-        # Clip to [-1.0, 1.0] range to avoid overflow
-        float32_array = np.clip(float32_array, -1.0, 1.0)
-        
-        # Scale to int16 range and convert
-        return (float32_array * 32767.0).astype(np.int16)
+        # Scale first and clip in the int16 range to avoid overflow
+        scaled = np.multiply(float32_array, np.float32(32767.0), out=work)
+        np.clip(scaled, -32767.0, 32767.0, out=scaled)
+        np.copyto(out, scaled, casting="unsafe")
+        return out
     except Exception as e:
         logger.error(f"Error converting float32 to int16: {str(e)}")
         raise
 
 def int16_to_float32(
-    int16_array: np.ndarray
+    int16_array: np.ndarray,
+    out: Optional[np.ndarray] = None
 ) -> np.ndarray:
     """
     Convert int16 numpy array to float32 numpy array
     
     Args:
         int16_array: Int16 numpy array
+        out: Float32 array to write the result into (allocated if not given)
         
     Returns:
         Float32 numpy array in range [-1.0, 1.0]
@@ -141,12 +266,286 @@ def int16_to_float32(
         # Ensure input is int16 array
         int16_array = np.asarray(int16_array, dtype=np.int16)
         
-        # Scale to [-1.0, 1.0] range
-        return int16_array.astype(np.float32) / 32767.0
+        # Scale to [-1.0, 1.0] range in a single pass
+        return np.multiply(int16_array, np.float32(1 / 32767.0), out=out, dtype=np.float32)
     except Exception as e:
         logger.error(f"Error converting int16 to float32: {str(e)}")
         raise
 
+def _blocks(samples: np.ndarray, work: WorkBuffers):
+    """Yield (slice, float32 copy) pairs of a long signal through one reusable scratch block"""
+    for start in range(0, len(samples), _BLOCK_SAMPLES):
+        block = samples[start:start + _BLOCK_SAMPLES]
+        scratch = work.get("block", len(block))
+        np.copyto(scratch, block, casting="unsafe")
+        yield slice(start, start + len(block)), scratch
+
+def measure_levels(
+    pcm: Union[BytesLike, np.ndarray],
+    clip_level: int = 32767,
+    work: Optional[WorkBuffers] = None
+) -> Dict[str, Any]:
+    """
+    Measure RMS, peak and clipping of PCM16 audio
+
+    Args:
+        pcm: PCM16 bytes or int16 array
+        clip_level: Absolute sample value counted as clipped (default: 32767)
+        work: Reusable scratch buffers (created if not given)
+
+    Returns:
+        Dict with samples, rms_dbfs, peak_dbfs, clipped_samples and clipping_ratio
+    """
+    samples = pcm if isinstance(pcm, np.ndarray) else pcm16_view(pcm)
+    work = work or WorkBuffers()
+    energy = 0.0
+    peak = 0.0
+    clipped = 0
+    for _, block in _blocks(samples, work):
+        energy += float(np.dot(block, block))
+        np.abs(block, out=block)
+        peak = max(peak, float(block.max()))
+        clipped += int(np.count_nonzero(np.greater_equal(block, clip_level, out=work.get("mask", len(block), np.bool_))))
+
+    count = len(samples)
+    rms = math.sqrt(energy / count) if count else 0.0
+    return {
+        "samples": count,
+        "rms_dbfs": round(20 * math.log10(rms / 32768), 2) if rms else None,
+        "peak_dbfs": round(20 * math.log10(peak / 32768), 2) if peak else None,
+        "clipped_samples": clipped,
+        "clipping_ratio": round(clipped / count, 6) if count else 0.0,
+    }
+
+def apply_gain(
+    pcm: Union[BytesLike, np.ndarray],
+    gain: float,
+    out: Optional[np.ndarray] = None,
+    work: Optional[WorkBuffers] = None
+) -> np.ndarray:
+    """
+    Multiply PCM16 audio by a linear gain with saturation
+
+    Args:
+        pcm: PCM16 bytes or int16 array
+        gain: Linear gain factor
+        out: Int16 array for the result; may be the input array itself (allocated if not given)
+        work: Reusable scratch buffers (created if not given)
+
+    Returns:
+        Int16 array with the amplified audio
+    """
+    samples = pcm if isinstance(pcm, np.ndarray) else pcm16_view(pcm)
+    if out is None:
+        out = np.empty(len(samples), dtype=np.int16)
+    work = work or WorkBuffers()
+    gain = np.float32(gain)
+    for span, block in _blocks(samples, work):
+        block *= gain
+        np.rint(block, out=block)
+        np.clip(block, -32768.0, 32767.0, out=block)
+        np.copyto(out[span], block, casting="unsafe")
+    return out
+
+def normalize_gain(
+    pcm: Union[BytesLike, np.ndarray],
+    target_dbfs: float = -20.0,
+    max_gain_db: float = 20.0,
+    out: Optional[np.ndarray] = None,
+    work: Optional[WorkBuffers] = None
+) -> Tuple[np.ndarray, float]:
+    """
+    Bring PCM16 audio to a target RMS level without clipping
+
+    Args:
+        pcm: PCM16 bytes or int16 array
+        target_dbfs: Desired RMS level in dBFS (default: -20.0)
+        max_gain_db: Upper bound for amplification in dB (default: 20.0)
+        out: Int16 array for the result; may be the input array itself (allocated if not given)
+        work: Reusable scratch buffers (created if not given)
+
+    Returns:
+        Tuple of the normalized int16 array and the applied linear gain
+    """
+    work = work or WorkBuffers()
+    levels = measure_levels(pcm, work=work)
+    gain = 1.0
+    if levels["rms_dbfs"] is not None:
+        gain = min(10 ** ((target_dbfs - levels["rms_dbfs"]) / 20), 10 ** (max_gain_db / 20))
+        # Пик после усиления не должен выйти за полную шкалу
+        gain = min(gain, 32767 / (32768 * 10 ** (levels["peak_dbfs"] / 20)))
+    return apply_gain(pcm, gain, out=out, work=work), gain
+
+class StreamingResampler:
+    """
+    Chunk-wise polyphase resampler for a mono float32 stream.
+
+    A Kaiser-windowed sinc low-pass is split into `up` branches; every output
+    sample is one dot product of a branch with the last taps input samples.
+    The filter history carries over between calls and work buffers are reused,
+    so a steady stream of equal chunks allocates nothing after the first call.
+    Returned arrays are views into these buffers and are only valid until the
+    next call.
+    """
+
+    def __init__(self, input_rate: int, output_rate: int = 24000, taps_per_phase: int = None):
+        """
+        Initialize the resampler
+
+        Args:
+            input_rate: Sample rate of the incoming stream in Hz
+            output_rate: Sample rate to produce in Hz (default: 24000)
+            taps_per_phase: FIR length per branch (default: settings.AUDIO_RESAMPLER_TAPS)
+        """
+        divisor = math.gcd(input_rate, output_rate)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.passthrough = self.up == self.down
+        self.taps = taps_per_phase or settings.AUDIO_RESAMPLER_TAPS
+
+        # Прототип ФНЧ на частоте input_rate * up, срез по меньшей из частот Найквиста
+        length = self.taps * self.up
+        cutoff = 1.0 / max(self.up, self.down)
+        t = np.arange(length) - (length - 1) / 2
+        prototype = cutoff * np.sinc(cutoff * t) * np.kaiser(length, 8.0) * self.up
+        # kernels[p] — ветвь p в обратном порядке, чтобы умножать на окно входа как есть
+        self._kernels = np.ascontiguousarray(prototype.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0
+        self._produced = 0
+        self._ramp = np.arange(0, dtype=np.int64)
+        self._buffers = WorkBuffers()
+
+    def output_length(self, input_length: int) -> int:
+        """
+        Number of samples the next process() call returns for an input length
+
+        Args:
+            input_length: Samples about to be passed in
+
+        Returns:
+            Output sample count
+        """
+        if self.passthrough:
+            return input_length
+        total = self._consumed + input_length
+        return -(-total * self.up // self.down) - self._produced
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample the next chunk of the stream
+
+        Args:
+            samples: Float32 mono samples
+
+        Returns:
+            Resampled float32 samples (view into an internal buffer)
+        """
+        if self.passthrough:
+            return samples
+
+        count = len(samples)
+        if not count:
+            return self._buffers.get("out", 0)
+        outputs = self.output_length(count)
+        history = self.taps - 1
+
+        # История фильтра и новый чанк подряд в одном буфере
+        work = self._buffers.get("work", history + count)
+        work[:history] = self._history
+        work[history:] = samples
+
+        # Для выхода m: вход n = m * down // up, ветвь m * down % up
+        if len(self._ramp) < outputs:
+            self._ramp = np.arange(max(outputs, 2 * len(self._ramp)), dtype=np.int64)
+        positions = self._buffers.get("positions", outputs, np.int64)
+        np.multiply(self._ramp[:outputs], self.down, out=positions)
+        positions += self._produced * self.down
+        phases = self._buffers.get("phases", outputs, np.int64)
+        np.remainder(positions, self.up, out=phases)
+        np.floor_divide(positions, self.up, out=positions)
+        positions -= self._consumed
+
+        windows = np.lib.stride_tricks.sliding_window_view(work, self.taps)
+        gathered = np.take(windows, positions, axis=0, out=self._buffers.get("gathered", outputs, width=self.taps))
+        kernels = np.take(self._kernels, phases, axis=0, out=self._buffers.get("kernels", outputs, width=self.taps))
+        out = np.einsum("ij,ij->i", gathered, kernels, out=self._buffers.get("out", outputs))
+
+        self._history[:] = work[count:count + history]
+        self._consumed += count
+        self._produced += outputs
+        return out
+
+    def reset(self) -> None:
+        """Forget the stream position and filter history"""
+        self._history[:] = 0
+        self._consumed = 0
+        self._produced = 0
+
+
+class AudioInputConverter:
+    """
+    Converts client audio of a declared format to PCM16 mono at the realtime rate.
+    Bytes of a sample split across chunks are kept until the next call.
+    """
+
+    def __init__(self, encoding: str = "pcm16", sample_rate: int = 24000, output_rate: int = 24000):
+        """
+        Initialize the converter
+
+        Args:
+            encoding: "pcm16" (little-endian int16) or "float32" (little-endian, range [-1.0, 1.0])
+            sample_rate: Sample rate of the client audio in Hz
+            output_rate: Sample rate to produce in Hz (default: 24000)
+        """
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.dtype = np.dtype("<f4") if encoding == "float32" else np.dtype("<i2")
+        self.resampler = StreamingResampler(sample_rate, output_rate)
+        self.passthrough = encoding == "pcm16" and self.resampler.passthrough
+        self._partial = bytearray()
+        self._buffers = WorkBuffers()
+
+    def convert(self, data: Union[bytes, bytearray, memoryview]) -> bytes:
+        """
+        Convert the next chunk of client audio
+
+        Args:
+            data: Raw audio bytes in the declared format
+
+        Returns:
+            PCM16 mono bytes at the output rate (may be empty for tiny chunks)
+        """
+        if self.passthrough:
+            return data
+        if self._partial:
+            data = bytes(self._partial) + bytes(data)
+            self._partial.clear()
+        view = memoryview(data).cast("B")
+        usable = len(view) - len(view) % self.dtype.itemsize
+        if usable < len(view):
+            self._partial.extend(view[usable:])
+        samples = np.frombuffer(view[:usable], dtype=self.dtype)
+        if self.encoding == "pcm16":
+            samples = int16_to_float32(samples, out=self._buffers.get("input", len(samples)))
+        resampled = self.resampler.process(samples)
+
+        out = float32_to_int16(
+            resampled,
+            out=self._buffers.get("pcm16", len(resampled), np.int16),
+            work=self._buffers.get("pcm_float", len(resampled))
+        )
+        return out.tobytes()
+
+    def reset(self) -> None:
+        """Drop a partial sample and the resampler history"""
+        self._partial.clear()
+        self.resampler.reset()
+
+
 def resample_audio(
     audio_data: np.ndarray,
     original_sample_rate: int,
@@ -157,37 +556,57 @@ def resample_audio(
     Resample audio to a different sample rate
     
     Args:
-        audio_data: Audio data as numpy array
+        audio_data: Audio data as numpy array (interleaved if channels > 1)
         original_sample_rate: Original sample rate in Hz
         target_sample_rate: Target sample rate in Hz
         channels: Number of channels (default: 1)
         
     Returns:
-        Resampled audio data
-    
-    Note:
-        Requires scipy to be installed
+        Resampled float32 audio data
     """
     try:
-        from scipy import signal
-        
-        # Calculate resampling factor
-        resampling_factor = target_sample_rate / original_sample_rate
-        
-        # Calculate new length
-        new_length = int(len(audio_data) * resampling_factor)
-        
-        # Resample
-        resampled_audio = signal.resample(audio_data, new_length)
-        
-        return resampled_audio
-    except ImportError:
-        logger.warning("scipy is not installed. Audio resampling is not available.")
-        raise ImportError("scipy is required for audio resampling")
+        audio = np.asarray(audio_data, dtype=np.float32).reshape(-1, channels)
+        resampled = [
+            StreamingResampler(original_sample_rate, target_sample_rate).process(audio[:, channel]).copy()
+            for channel in range(channels)
+        ]
+        return resampled[0] if channels == 1 else np.stack(resampled, axis=1).reshape(-1)
     except Exception as e:
         logger.error(f"Error resampling audio: {str(e)}")
         raise
 
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run-length encode a boolean mask
+
+    Args:
+        mask: 1-D boolean array
+
+    Returns:
+        Start indices and end indices (exclusive) of every run of True values
+    """
+    padded = np.empty(len(mask) + 2, dtype=np.int8)
+    padded[0] = padded[-1] = 0
+    padded[1:-1] = mask
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[::2], edges[1::2]
+
+def frame_power(samples: np.ndarray, frame_size: int) -> np.ndarray:
+    """
+    Compute the mean square of every complete frame of a signal
+
+    Args:
+        samples: Mono audio samples (int16 or float32)
+        frame_size: Samples per frame
+
+    Returns:
+        Float32 array with one value per complete frame; the incomplete tail is ignored
+    """
+    count = len(samples) // frame_size
+    frames = samples[:count * frame_size].reshape(count, frame_size).astype(np.float32)
+    # einsum считает сумму квадратов по строкам без промежуточного массива квадратов
+    return np.einsum("ij,ij->i", frames, frames) / np.float32(frame_size)
+
 def detect_silence(
     audio_data: np.ndarray,
     threshold: float = 0.01,
@@ -210,34 +629,185 @@ def detect_silence(
         # Calculate sample threshold for min_silence_duration
         min_samples = int(min_silence_duration * sample_rate / 1000)
         
-        # Calculate absolute amplitude
-        amplitude = np.abs(audio_data)
-        
-        # Find where amplitude is below threshold
-        is_silence = amplitude < threshold
-        
-        # Find silence intervals
-        silence_intervals = []
-        silence_start = None
-        
-        for i, silent in enumerate(is_silence):
-            if silent and silence_start is None:
-                silence_start = i
-            elif not silent and silence_start is not None:
-                if i - silence_start >= min_samples:
-                    # Convert to milliseconds
-                    start_ms = int(silence_start * 1000 / sample_rate)
-                    end_ms = int(i * 1000 / sample_rate)
-                    silence_intervals.append((start_ms, end_ms))
-                silence_start = None
+        # Find silence runs in one pass over the whole buffer
+        starts, ends = _runs(np.abs(audio_data) < threshold)
+        keep = ends - starts >= min_samples
         
-        # Check if audio ends with silence
-        if silence_start is not None and len(audio_data) - silence_start >= min_samples:
-            start_ms = int(silence_start * 1000 / sample_rate)
-            end_ms = int(len(audio_data) * 1000 / sample_rate)
-            silence_intervals.append((start_ms, end_ms))
-        
-        return silence_intervals
+        return [
+            (int(start * 1000 / sample_rate), int(end * 1000 / sample_rate))
+            for start, end in zip(starts[keep].tolist(), ends[keep].tolist())
+        ]
     except Exception as e:
         logger.error(f"Error detecting silence: {str(e)}")
         raise
+
+class StreamingVAD:
+    """
+    Energy-based voice activity gate for a PCM16 mono stream.
+
+    Each chunk is split into fixed-size frames whose RMS is compared with a
+    threshold; the partial frame and the speech/silence run lengths carry over
+    between chunks. Leading silence and pauses longer than the hangover are held
+    back, and the last prefix_ms of held audio is released when speech resumes.
+    Chunks are forwarded whole, so a caller can pass an already encoded payload
+    together with the samples and send it unchanged.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 24000,
+        frame_ms: int = None,
+        threshold_dbfs: float = None,
+        min_speech_ms: int = None,
+        hangover_ms: int = None,
+        prefix_ms: int = None
+    ):
+        """
+        Initialize the VAD
+
+        Args:
+            sample_rate: Sample rate of the stream in Hz (default: 24000)
+            frame_ms: Analysis frame in milliseconds (default: settings.AUDIO_VAD_FRAME_MS)
+            threshold_dbfs: Frame RMS counted as speech (default: settings.AUDIO_VAD_THRESHOLD_DBFS)
+            min_speech_ms: Shortest burst that starts speech (default: settings.AUDIO_VAD_MIN_SPEECH_MS)
+            hangover_ms: Silence still forwarded after speech (default: settings.AUDIO_VAD_HANGOVER_MS)
+            prefix_ms: Held audio released before speech (default: settings.AUDIO_VAD_PREFIX_MS)
+        """
+        frame_ms = frame_ms or settings.AUDIO_VAD_FRAME_MS
+        if threshold_dbfs is None:
+            threshold_dbfs = settings.AUDIO_VAD_THRESHOLD_DBFS
+        min_speech_ms = min_speech_ms or settings.AUDIO_VAD_MIN_SPEECH_MS
+        hangover_ms = hangover_ms or settings.AUDIO_VAD_HANGOVER_MS
+        prefix_ms = settings.AUDIO_VAD_PREFIX_MS if prefix_ms is None else prefix_ms
+
+        self.sample_rate = sample_rate
+        self.frame_size = max(1, sample_rate * frame_ms // 1000)
+        # Порог в единицах средней мощности PCM16, чтобы не считать логарифм для каждого фрейма
+        self.threshold_power = (32768.0 * 10 ** (threshold_dbfs / 20)) ** 2
+        self.min_speech_frames = max(1, math.ceil(min_speech_ms / frame_ms))
+        self.hangover_frames = max(1, math.ceil(hangover_ms / frame_ms))
+        self.prefix_samples = sample_rate * prefix_ms // 1000
+
+        self.in_speech = False
+        self._carry = np.zeros(self.frame_size, dtype=np.int16)
+        self._carry_len = 0
+        self._speech_run = 0
+        self._silence_run = 0
+        self._held: Deque[Tuple[Any, int]] = deque()
+        self._held_samples = 0
+        self.samples_in = 0
+        self.samples_forwarded = 0
+
+    def _frame_powers(self, samples: np.ndarray) -> np.ndarray:
+        """Frame powers of the carried partial frame plus the new samples"""
+        head = None
+        if self._carry_len:
+            take = min(self.frame_size - self._carry_len, len(samples))
+            self._carry[self._carry_len:self._carry_len + take] = samples[:take]
+            self._carry_len += take
+            samples = samples[take:]
+            if self._carry_len < self.frame_size:
+                return np.empty(0, dtype=np.float32)
+            head = frame_power(self._carry, self.frame_size)
+            self._carry_len = 0
+
+        powers = frame_power(samples, self.frame_size)
+        rest = len(samples) % self.frame_size
+        if rest:
+            self._carry[:rest] = samples[len(samples) - rest:]
+            self._carry_len = rest
+        return powers if head is None else np.concatenate((head, powers))
+
+    def _classify(self, powers: np.ndarray) -> bool:
+        """
+        Update run lengths with a chunk of frames
+
+        Returns:
+            bool: True if the chunk contains a speech run of at least min_speech_frames
+        """
+        frames = len(powers)
+        if not frames:
+            return False
+        starts, ends = _runs(powers >= self.threshold_power)
+        if not len(starts):
+            self._speech_run = 0
+            self._silence_run += frames
+            return False
+
+        lengths = ends - starts
+        if starts[0] == 0:
+            # Речь, начатая в предыдущем чанке, продолжается
+            lengths[0] += self._speech_run
+        self._speech_run = int(lengths[-1]) if ends[-1] == frames else 0
+
+        speech = lengths >= self.min_speech_frames
+        if not speech.any():
+            # Короткие щелчки не прерывают отсчёт тишины
+            self._silence_run += frames
+            return False
+        self._silence_run = frames - int(ends[speech][-1])
+        return True
+
+    def process(self, audio: Union[bytes, bytearray, memoryview], payload: Any = None) -> List[Any]:
+        """
+        Feed a chunk and get the payloads that should be forwarded now
+
+        Args:
+            audio: PCM16 mono samples of the chunk
+            payload: What to forward for this chunk (default: the audio itself);
+                it is kept while the chunk is held back, so it must not be reused by the caller
+
+        Returns:
+            Payloads to send upstream in order, empty while the stream is held back
+        """
+        samples = pcm16_view(audio)
+        if payload is None:
+            payload = audio
+        count = len(samples)
+        self.samples_in += count
+
+        speech = self._classify(self._frame_powers(samples))
+
+        if self.in_speech:
+            forwarded = [payload]
+        elif speech:
+            forwarded = [held for held, _ in self._held] + [payload]
+            self.samples_forwarded += self._held_samples
+            self._held.clear()
+            self._held_samples = 0
+        else:
+            self._held.append((payload, count))
+            self._held_samples += count
+            # Держим только последние prefix_ms, остальное отбрасываем
+            while self._held and self._held_samples - self._held[0][1] >= self.prefix_samples:
+                self._held_samples -= self._held.popleft()[1]
+            return []
+
+        self.samples_forwarded += count
+        # Хвост тишины длиной hangover уходит в OpenAI, чтобы сработал серверный VAD
+        self.in_speech = self._silence_run < self.hangover_frames
+        return forwarded
+
+    def reset(self) -> None:
+        """Drop held audio and start from silence (e.g. after input_audio_buffer.clear)"""
+        self.in_speech = False
+        self._carry_len = 0
+        self._speech_run = 0
+        self._silence_run = 0
+        self._held.clear()
+        self._held_samples = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get totals of received and forwarded audio
+
+        Returns:
+            Dict with milliseconds in and forwarded and the trimmed share
+        """
+        ms_in = self.samples_in * 1000 // self.sample_rate
+        ms_forwarded = self.samples_forwarded * 1000 // self.sample_rate
+        return {
+            "ms_in": ms_in,
+            "ms_forwarded": ms_forwarded,
+            "trimmed_ratio": round(1 - self.samples_forwarded / self.samples_in, 3) if self.samples_in else 0.0
+        }
@@ -0,0 +1,314 @@
+"""
+Call recording for the realtime voice pipeline.
+Caller and assistant audio are mixed on a wall-clock timeline and streamed
+to a WAV file in small blocks; the header is patched when the call ends.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.db.executor import run_in_session
+from backend.utils.audio_utils import WAV_HEADER_SIZE, WorkBuffers, pack_wav_header, wav_header
+from backend.websockets.protocol import PCM16_SAMPLE_WIDTH, REALTIME_SAMPLE_RATE
+
+logger = get_logger(__name__)
+
+# Раскладка каналов записи
+LAYOUT_STEREO = "stereo"  # левый канал — собеседник, правый — ассистент
+LAYOUT_MONO = "mono"      # оба направления смешаны в один канал
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class CallRecorder:
+    """
+    Streams both directions of a call into a PCM16 WAV file.
+
+    Incoming audio is appended to per-direction backlogs; a background task
+    writes the elapsed wall-clock time every block_ms, padding a direction with
+    silence when it has nothing to play. Backlogs are capped, so memory per
+    call stays constant however long the call runs.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        storage_path: str = None,
+        layout: str = None,
+        sample_rate: int = REALTIME_SAMPLE_RATE,
+        block_ms: int = None,
+        max_backlog_seconds: int = None
+    ):
+        """
+        Initialize the recorder
+
+        Args:
+            path: Target WAV file
+            storage_path: Path relative to the upload directory, as stored in File.file_path
+            layout: LAYOUT_STEREO or LAYOUT_MONO (default: settings.CALL_RECORDING_LAYOUT)
+            sample_rate: Sample rate of both directions in Hz
+            block_ms: Interval between disk writes (default: settings.CALL_RECORDING_BLOCK_MS)
+            max_backlog_seconds: Audio kept per direction before the oldest is dropped
+                (default: settings.CALL_RECORDING_MAX_BACKLOG_SECONDS)
+        """
+        layout = layout or settings.CALL_RECORDING_LAYOUT
+        self.path = path
+        self.storage_path = storage_path or path
+        self.channels = 2 if layout == LAYOUT_STEREO else 1
+        self.sample_rate = sample_rate
+        self.block = (block_ms or settings.CALL_RECORDING_BLOCK_MS) / 1000
+        backlog = max_backlog_seconds or settings.CALL_RECORDING_MAX_BACKLOG_SECONDS
+        self.max_backlog_bytes = sample_rate * PCM16_SAMPLE_WIDTH * backlog
+        self._caller = bytearray()
+        self._assistant = bytearray()
+        self._buffers = WorkBuffers()
+        self._fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+        self._started_at = 0.0
+        self.samples_written = 0
+        self.data_bytes = 0
+        self.dropped_bytes = 0
+        self.interrupted_bytes = 0
+
+    @property
+    def recording(self) -> bool:
+        """Whether the file is open and accepts audio"""
+        return self._fd is not None and not self._closing
+
+    @property
+    def duration(self) -> float:
+        """Recorded duration in seconds"""
+        return self.samples_written / self.sample_rate
+
+    def feed_caller(self, pcm: bytes) -> None:
+        """
+        Add audio received from the caller
+
+        Args:
+            pcm: PCM16 mono audio at the recorder's sample rate
+        """
+        if self.recording:
+            self._append(self._caller, pcm)
+
+    def feed_assistant(self, pcm: bytes) -> None:
+        """
+        Add audio generated by the assistant
+
+        Args:
+            pcm: PCM16 mono audio at the recorder's sample rate
+        """
+        if self.recording:
+            self._append(self._assistant, pcm)
+
+    def drop_assistant(self) -> None:
+        """Discard assistant audio that has not been played yet (the caller interrupted it)"""
+        self.interrupted_bytes += len(self._assistant)
+        self._assistant.clear()
+
+    def _append(self, backlog: bytearray, pcm: bytes) -> None:
+        overflow = len(backlog) + len(pcm) - self.max_backlog_bytes
+        if overflow > 0:
+            # Отбрасываем самое старое, выравнивая по границе сэмпла
+            overflow += overflow % PCM16_SAMPLE_WIDTH
+            del backlog[:overflow]
+            self.dropped_bytes += overflow
+        backlog += pcm
+
+    def _open(self) -> int:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        # Размер данных пока неизвестен — заголовок перепишем при закрытии
+        _write_all(fd, wav_header(0, self.sample_rate, PCM16_SAMPLE_WIDTH, self.channels))
+        return fd
+
+    async def start(self) -> None:
+        """Create the file and start the background writer"""
+        self._fd = await asyncio.to_thread(self._open)
+        self._started_at = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Call recording started: {self.path}")
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.block)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._write_due()
+            except Exception as e:
+                logger.error(f"Error writing call recording {self.path}: {e}")
+
+    def _take(self, name: str, backlog: bytearray, count: int) -> np.ndarray:
+        """Next count samples of a direction, padded with silence"""
+        samples = self._buffers.get(name, count, np.int16)
+        available = min(len(backlog) // PCM16_SAMPLE_WIDTH, count)
+        samples[:available] = np.frombuffer(backlog, dtype=np.int16, count=available)
+        samples[available:] = 0
+        del backlog[:available * PCM16_SAMPLE_WIDTH]
+        return samples
+
+    def _mix(self, count: int) -> bytes:
+        caller = self._take("caller", self._caller, count)
+        assistant = self._take("assistant", self._assistant, count)
+        if self.channels == 2:
+            frames = self._buffers.get("frames", count, np.int16, width=2)
+            frames[:, 0] = caller
+            frames[:, 1] = assistant
+            return frames.tobytes()
+        mixed = self._buffers.get("mixed", count, np.int32)
+        np.add(caller, assistant, out=mixed, dtype=np.int32)
+        np.clip(mixed, -32768, 32767, out=mixed)
+        return mixed.astype(np.int16).tobytes()
+
+    async def _write_due(self, final: bool = False) -> None:
+        due = int((time.monotonic() - self._started_at) * self.sample_rate) - self.samples_written
+        if final:
+            # Дописываем то, что ещё не успело прозвучать
+            due = max(due, len(self._caller) // PCM16_SAMPLE_WIDTH, len(self._assistant) // PCM16_SAMPLE_WIDTH)
+        if due <= 0:
+            return
+        block = self._mix(due)
+        await asyncio.to_thread(_write_all, self._fd, block)
+        self.samples_written += due
+        self.data_bytes += len(block)
+
+    def _finalize(self) -> None:
+        header = bytearray(WAV_HEADER_SIZE)
+        pack_wav_header(header, self.data_bytes, self.sample_rate, PCM16_SAMPLE_WIDTH, self.channels)
+        os.pwrite(self._fd, header, 0)
+        os.close(self._fd)
+
+    async def close(self) -> Dict[str, Any]:
+        """
+        Write the remaining audio, patch the WAV header and close the file
+
+        Returns:
+            Dict with path, size, duration, dropped and interrupted bytes
+        """
+        if self._fd is None:
+            return {
+                "path": self.path,
+                "size": 0,
+                "duration": 0.0,
+                "dropped_bytes": self.dropped_bytes,
+                "interrupted_bytes": self.interrupted_bytes,
+            }
+        if self._task is not None:
+            # Не отменяем задачу: прерванная запись сдвинула бы смещение в файле
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self._closing = True
+        try:
+            await self._write_due(final=True)
+        finally:
+            await asyncio.to_thread(self._finalize)
+            self._fd = None
+        logger.info(f"Call recording finished: {self.path} ({self.duration:.1f}s, {self.data_bytes} bytes)")
+        return {
+            "path": self.path,
+            "size": WAV_HEADER_SIZE + self.data_bytes,
+            "duration": round(self.duration, 2),
+            "dropped_bytes": self.dropped_bytes,
+            "interrupted_bytes": self.interrupted_bytes,
+        }
+
+
+def _save_recording_file(
+    db: Session,
+    user_id: Any,
+    assistant_id: Any,
+    file_path: str,
+    size: int,
+    filename: str
+) -> uuid.UUID:
+    """Create the File row of a finished recording (runs in the DB executor)"""
+    from backend.models.file import File
+
+    db_file = File(
+        user_id=user_id,
+        assistant_id=assistant_id,
+        name=os.path.splitext(filename)[0],
+        original_filename=filename,
+        file_path=file_path,
+        content_type="audio/wav",
+        size=size,
+        processed=True
+    )
+    db.add(db_file)
+    db.commit()
+    return db_file.id
+
+
+async def start_call_recording(assistant: Any, client_id: str) -> Optional[CallRecorder]:
+    """
+    Start recording a call if the assistant has recording enabled
+
+    Args:
+        assistant: Runtime config of the assistant
+        client_id: Client ID of the call
+
+    Returns:
+        Running CallRecorder or None if recording is off or failed to start
+    """
+    if not getattr(assistant, "record_calls", False) or not assistant.user_id:
+        return None
+
+    # Импорт здесь, чтобы избежать циклического импорта
+    from backend.services.file_service import FileService
+
+    try:
+        file_path = await asyncio.to_thread(FileService._generate_file_path, "call.wav", str(assistant.user_id))
+        recorder = CallRecorder(os.path.join(FileService._ensure_upload_dir(), file_path), storage_path=file_path)
+        await recorder.start()
+        return recorder
+    except Exception as e:
+        logger.error(f"Could not start call recording for client_id={client_id}: {e}")
+        return None
+
+
+async def finish_call_recording(recorder: CallRecorder, assistant: Any, conversation_id: Optional[str]) -> None:
+    """
+    Close a recording, register it as a file of the assistant owner and link it to the conversation
+
+    Args:
+        recorder: Recorder returned by start_call_recording
+        assistant: Runtime config of the assistant
+        conversation_id: ID of the call's conversation row, if any
+    """
+    # Импорт здесь, чтобы избежать циклического импорта
+    from backend.services.conversation_writer import conversation_writer
+
+    try:
+        result = await recorder.close()
+        if not recorder.samples_written:
+            await asyncio.to_thread(os.remove, recorder.path)
+            return
+        filename = f"call-{conversation_id or uuid.uuid4()}.wav"
+        file_id = await run_in_session(
+            _save_recording_file, assistant.user_id, assistant.id, recorder.storage_path, result["size"], filename
+        )
+        if conversation_id:
+            conversation_writer.record_update(conversation_id, recording_file_id=file_id)
+        if result["dropped_bytes"]:
+            logger.warning(f"Call recording {filename} dropped {result['dropped_bytes']} bytes of backlog")
+    except Exception as e:
+        logger.error(f"Error finishing call recording {recorder.path}: {e}")
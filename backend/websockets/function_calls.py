@@ -0,0 +1,197 @@
+"""
+Background execution of function calls for the realtime voice pipeline.
+Calls run as tasks of the call's runner, so the OpenAI event reader keeps
+relaying audio while a webhook or a knowledge base lookup is in progress.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.functions import get_function_limits
+
+logger = get_logger(__name__)
+
+# Семафоры функций на процесс: лимит одновременных вызовов общий для всех звонков
+_function_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def _function_slot(name: str, limit: int) -> Optional[asyncio.Semaphore]:
+    if limit <= 0:
+        return None
+    slot = _function_slots.get(name)
+    if slot is None:
+        slot = _function_slots[name] = asyncio.Semaphore(limit)
+    return slot
+
+
+class FunctionCall:
+    """One function call requested by the model"""
+
+    __slots__ = ("call_id", "name", "arguments", "response_id", "started_at", "result")
+
+    def __init__(self, call_id: str, name: str, arguments: Any, response_id: Optional[str]):
+        self.call_id = call_id
+        self.name = name
+        self.arguments = arguments
+        self.response_id = response_id
+        self.started_at = time.monotonic()
+        self.result: Optional[Dict[str, Any]] = None
+
+
+class FunctionCallRunner:
+    """
+    Task group of the function calls of one call.
+
+    Each call runs in its own task under the session's and the function's
+    concurrency limits and the function's timeout; its result is delivered as
+    soon as it is ready. The follow-up response is requested once, after
+    every call of the model's response has been delivered and that response
+    has finished, so parallel tool calls get a single answer.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str, Any], Awaitable[Dict[str, Any]]],
+        deliver: Callable[[FunctionCall], Awaitable[None]],
+        respond: Callable[[], Awaitable[Any]],
+        max_concurrent: Optional[int] = None
+    ):
+        """
+        Initialize the runner
+
+        Args:
+            execute: Coroutine function running a function by name with arguments
+            deliver: Coroutine function sending a finished call's result to the model and the client
+            respond: Coroutine function requesting the model's answer after the results
+            max_concurrent: Calls running at once (default: settings.FUNCTION_CALLS_PER_SESSION)
+        """
+        self._execute = execute
+        self._deliver = deliver
+        self._respond = respond
+        self._slots = asyncio.Semaphore(max_concurrent or settings.FUNCTION_CALLS_PER_SESSION)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Незавершённые вызовы по ответу модели и ответы, для которых пришёл response.done
+        self._pending: Dict[Optional[str], Set[str]] = {}
+        self._responses_done: Set[str] = set()
+        self.completed = 0
+        self.timed_out = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> int:
+        """Number of calls not delivered yet"""
+        return len(self._tasks)
+
+    def submit(
+        self,
+        call_id: str,
+        name: str,
+        arguments: Any,
+        response_id: Optional[str] = None,
+        result: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Start a function call in the background
+
+        Args:
+            call_id: ID of the call
+            name: Normalized function name
+            arguments: Parsed arguments
+            response_id: ID of the response that requested the call, None if unknown
+            result: Ready result to deliver without running the function (e.g. a rejection)
+
+        Returns:
+            bool: False if a call with this ID is already running
+        """
+        if call_id in self._tasks:
+            return False
+        call = FunctionCall(call_id, name, arguments, response_id)
+        self._pending.setdefault(response_id, set()).add(call_id)
+        self._tasks[call_id] = asyncio.create_task(self._run(call, result))
+        return True
+
+    async def _run(self, call: FunctionCall, result: Optional[Dict[str, Any]]) -> None:
+        try:
+            call.result = result if result is not None else await self._call(call)
+            await self._deliver(call)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка доставки результата функции {call.name} ({call.call_id}): {e}")
+        finally:
+            self._tasks.pop(call.call_id, None)
+            pending = self._pending.get(call.response_id)
+            if pending is not None:
+                pending.discard(call.call_id)
+        await self._respond_if_ready(call.response_id)
+
+    async def _call(self, call: FunctionCall) -> Dict[str, Any]:
+        timeout, limit = get_function_limits(call.name)
+        function_slot = _function_slot(call.name, limit)
+        try:
+            async with self._slots:
+                if function_slot is None:
+                    result = await asyncio.wait_for(self._execute(call.name, call.arguments), timeout)
+                else:
+                    async with function_slot:
+                        result = await asyncio.wait_for(self._execute(call.name, call.arguments), timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning(f"Функция {call.name} ({call.call_id}) не ответила за {timeout} с")
+            return {"status": "error", "error": f"Функция {call.name} не ответила за {timeout:g} с"}
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка выполнения функции {call.name} ({call.call_id}): {e}")
+            return {"status": "error", "error": str(e)}
+
+    async def on_response_done(self, response_id: Optional[str]) -> None:
+        """
+        Note that a response has finished; if it requested calls that are all
+        delivered already, the model's answer is requested now
+
+        Args:
+            response_id: ID of the finished response
+        """
+        if response_id in self._pending:
+            self._responses_done.add(response_id)
+            await self._respond_if_ready(response_id)
+
+    async def _respond_if_ready(self, response_id: Optional[str]) -> None:
+        if self._pending.get(response_id):
+            return
+        # Пока ответ с вызовами не завершён, новый ответ модель не примет
+        if response_id is not None and response_id not in self._responses_done:
+            return
+        if self._pending.pop(response_id, None) is None:
+            return
+        self._responses_done.discard(response_id)
+        await self._respond()
+
+    async def close(self) -> None:
+        """Cancel calls that are still running (the call has ended)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._pending.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get counters of the call's function calls
+
+        Returns:
+            Dict with completed, timed out, failed and running calls
+        """
+        return {
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "failed": self.failed,
+            "running": self.running,
+        }
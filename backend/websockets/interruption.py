@@ -0,0 +1,160 @@
+"""
+Barge-in handling for the realtime voice pipeline.
+Tracks how much of the assistant's audio the caller has heard, so that when
+the caller starts talking the unplayed rest can be dropped and truncated.
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+
+from backend.core.logging import get_logger
+from backend.websockets.protocol import PCM16_SAMPLE_WIDTH, REALTIME_SAMPLE_RATE, base64_decoded_size
+
+logger = get_logger(__name__)
+
+# Префикс event_id событий, отправленных при перебивании
+BARGE_IN_EVENT_PREFIX = "barge_in_"
+
+# Сколько последних прерванных ответов помним, чтобы отбрасывать их запоздавшее аудио
+_CANCELLED_HISTORY = 8
+
+
+def audio_payload_size(payload: Any) -> int:
+    """
+    Get the PCM16 size of a queued outbound audio payload
+
+    Args:
+        payload: Raw PCM16 bytes or a response.audio.delta event
+
+    Returns:
+        Size of the audio in bytes
+    """
+    if isinstance(payload, dict):
+        return base64_decoded_size(payload.get("delta") or "")
+    return len(payload)
+
+
+class PlaybackTracker:
+    """
+    Playback position of the assistant audio item being sent to the caller.
+
+    The caller cannot have heard more than was written to its socket, nor more
+    than the wall-clock time since the item's first chunk; the smaller of the
+    two is used as the truncation offset.
+    """
+
+    def __init__(self, sample_rate: int = REALTIME_SAMPLE_RATE):
+        """
+        Initialize the tracker
+
+        Args:
+            sample_rate: Sample rate of the assistant audio in Hz
+        """
+        self.bytes_per_ms = sample_rate * PCM16_SAMPLE_WIDTH / 1000
+        self.response_id: Optional[str] = None
+        self.item_id: Optional[str] = None
+        self.content_index = 0
+        self.queued_bytes = 0
+        self.done = False
+        self._started_at = 0.0
+        self._cancelled: Deque[str] = deque(maxlen=_CANCELLED_HISTORY)
+        self.interruptions = 0
+        self.unplayed_ms = 0
+
+    @property
+    def active(self) -> bool:
+        """Whether assistant audio is currently being played"""
+        if self.item_id is None:
+            return False
+        # Ответ сгенерирован быстрее, чем звучит: после response.done клиент ещё проигрывает хвост
+        return not self.done or (time.monotonic() - self._started_at) * 1000 < self.queued_bytes / self.bytes_per_ms
+
+    def on_audio(self, event: Dict[str, Any]) -> bool:
+        """
+        Account a response.audio.delta event before it is queued for the caller
+
+        Args:
+            event: The delta event from OpenAI
+
+        Returns:
+            bool: False if the delta belongs to an interrupted response and must be dropped
+        """
+        response_id = event.get("response_id")
+        if response_id and response_id in self._cancelled:
+            return False
+        item_id = event.get("item_id")
+        if item_id != self.item_id:
+            self.response_id = response_id
+            self.item_id = item_id
+            self.content_index = event.get("content_index", 0)
+            self.queued_bytes = 0
+            self.done = False
+            self._started_at = time.monotonic()
+        self.queued_bytes += base64_decoded_size(event.get("delta") or "")
+        return True
+
+    def on_response_done(self, response_id: Optional[str]) -> None:
+        """
+        Mark the response as fully generated; its audio may still be playing
+
+        Args:
+            response_id: ID of the finished response
+        """
+        if response_id is None or response_id == self.response_id:
+            self.done = True
+
+    def played_ms(self, unsent: Iterable[Any] = ()) -> int:
+        """
+        Estimate how much of the current item the caller has heard
+
+        Args:
+            unsent: Audio payloads of the item still queued for the caller
+
+        Returns:
+            Offset in milliseconds
+        """
+        sent_bytes = self.queued_bytes - sum(audio_payload_size(payload) for payload in unsent)
+        sent_ms = max(0.0, sent_bytes / self.bytes_per_ms)
+        elapsed_ms = (time.monotonic() - self._started_at) * 1000
+        return int(min(sent_ms, elapsed_ms))
+
+    def interrupt(self, unsent: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Stop tracking the current item because the caller started speaking
+
+        Args:
+            unsent: Audio payloads removed from the caller's send queue
+
+        Returns:
+            Dict with response_id, item_id, content_index, audio_end_ms and done
+            (whether the response had already finished), or None if no audio was playing
+        """
+        if not self.active:
+            return None
+        audio_end_ms = self.played_ms(unsent)
+        interruption = {
+            "response_id": self.response_id,
+            "item_id": self.item_id,
+            "content_index": self.content_index,
+            "audio_end_ms": audio_end_ms,
+            "done": self.done,
+        }
+        if self.response_id and not self.done:
+            self._cancelled.append(self.response_id)
+        self.interruptions += 1
+        self.unplayed_ms += max(0, int(self.queued_bytes / self.bytes_per_ms) - audio_end_ms)
+        self.response_id = None
+        self.item_id = None
+        self.queued_bytes = 0
+        self.done = False
+        return interruption
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get interruption counters of the call
+
+        Returns:
+            Dict with the number of interruptions and milliseconds of audio never played
+        """
+        return {"interruptions": self.interruptions, "unplayed_ms": self.unplayed_ms}
@@ -0,0 +1,255 @@
+"""
+Latency tracing for the realtime voice pipeline.
+Each call gets a span recorder that timestamps pipeline events with a
+monotonic clock; stage durations go into per-assistant histograms.
+"""
+
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Стадии (миллисекунды)
+STAGE_FORWARD = "forward"              # аудио клиента в очереди -> записано в сокет OpenAI
+STAGE_DELIVERY = "delivery"            # аудио ответа в очереди -> записано в сокет клиента
+STAGE_INPUT = "input"                  # первое аудио клиента в реплике -> speech_stopped
+STAGE_FIRST_AUDIO = "first_audio"      # speech_stopped (или commit) -> первый response.audio.delta
+STAGE_RESPONSE_DONE = "response_done"  # speech_stopped (или commit) -> response.done
+STAGE_FUNCTION_CALL = "function_call"  # выполнение execute_function
+
+STAGES = (STAGE_FORWARD, STAGE_DELIVERY, STAGE_INPUT, STAGE_FIRST_AUDIO, STAGE_RESPONSE_DONE, STAGE_FUNCTION_CALL)
+
+# Ключ агрегата по всем ассистентам
+ALL_ASSISTANTS = "*"
+
+
+class LatencyHistogram:
+    """Bounded reservoir of the latest samples of one stage"""
+
+    __slots__ = ("samples", "count")
+
+    def __init__(self, size: int):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, value_ms: float) -> None:
+        self.samples.append(value_ms)
+        self.count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Get percentiles over the retained samples
+
+        Returns:
+            Dict with count, p50, p95, p99 and max in milliseconds
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": self.count, "p50": None, "p95": None, "p99": None, "max": None}
+        last = len(ordered) - 1
+        return {
+            "count": self.count,
+            "p50": round(ordered[int(last * 0.50)], 1),
+            "p95": round(ordered[int(last * 0.95)], 1),
+            "p99": round(ordered[int(last * 0.99)], 1),
+            "max": round(ordered[-1], 1),
+        }
+
+
+class LatencyStats:
+    """
+    Per-assistant stage histograms of this worker.
+    Histograms of at most max_assistants assistants are kept; the least
+    recently active one is dropped first, the aggregate is always kept.
+    """
+
+    def __init__(self, size: int = None, max_assistants: int = None):
+        """
+        Initialize the stats
+
+        Args:
+            size: Samples kept per stage and assistant (default: settings.LATENCY_HISTOGRAM_SIZE)
+            max_assistants: Assistants with histograms (default: settings.LATENCY_MAX_ASSISTANTS)
+        """
+        self.size = size or settings.LATENCY_HISTOGRAM_SIZE
+        self.max_assistants = max_assistants or settings.LATENCY_MAX_ASSISTANTS
+        self._histograms: "OrderedDict[str, Dict[str, LatencyHistogram]]" = OrderedDict()
+
+    def record(self, assistant_id: str, stage: str, value_ms: float) -> None:
+        """
+        Add a stage duration for an assistant and to the overall aggregate
+
+        Args:
+            assistant_id: Assistant ID
+            stage: Stage name
+            value_ms: Duration in milliseconds
+        """
+        for key in (assistant_id, ALL_ASSISTANTS):
+            stages = self._histograms.get(key)
+            if stages is None:
+                stages = self._histograms[key] = {}
+                self._evict()
+            else:
+                self._histograms.move_to_end(key)
+            histogram = stages.get(stage)
+            if histogram is None:
+                histogram = stages[stage] = LatencyHistogram(self.size)
+            histogram.add(value_ms)
+
+    def _evict(self) -> None:
+        # Агрегат не считается и не вытесняется
+        while len(self._histograms) - (ALL_ASSISTANTS in self._histograms) > self.max_assistants:
+            for key in self._histograms:
+                if key != ALL_ASSISTANTS:
+                    del self._histograms[key]
+                    break
+
+    def snapshot(self, assistant_id: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Get percentiles per assistant and stage
+
+        Args:
+            assistant_id: Only this assistant (and the aggregate) if given
+
+        Returns:
+            Dict of assistant ID -> stage -> summary
+        """
+        keys = [assistant_id, ALL_ASSISTANTS] if assistant_id else list(self._histograms)
+        return {
+            key: {stage: histogram.summary() for stage, histogram in self._histograms[key].items()}
+            for key in keys if key in self._histograms
+        }
+
+    def reset(self) -> None:
+        """Drop all samples"""
+        self._histograms.clear()
+
+
+class CallLatencyRecorder:
+    """
+    Span recorder of one call.
+    Turn stages are anchored at speech_stopped, or at the buffer commit
+    when the client commits manually, and closed by response.done.
+    """
+
+    def __init__(self, assistant_id: Any, call_id: str, stats: LatencyStats = None):
+        """
+        Initialize the recorder
+
+        Args:
+            assistant_id: Assistant ID
+            call_id: Client ID of the call
+            stats: Histograms to record into (default: module-level latency_stats)
+        """
+        self.assistant_id = str(assistant_id)
+        self.call_id = call_id
+        self.stats = stats or latency_stats
+        self.sample_every = max(1, settings.LATENCY_AUDIO_SAMPLE_EVERY)
+        self._turn_audio_at: Optional[float] = None
+        self._anchor_at: Optional[float] = None
+        self._first_audio_ms: Optional[float] = None
+        self._turn: Dict[str, float] = {}
+        self.turns = 0
+
+    def record(self, stage: str, value_ms: float) -> None:
+        """
+        Record a stage duration for the current turn
+
+        Args:
+            stage: Stage name
+            value_ms: Duration in milliseconds
+        """
+        self.stats.record(self.assistant_id, stage, value_ms)
+        if stage not in (STAGE_FORWARD, STAGE_DELIVERY):
+            self._turn[stage] = round(self._turn.get(stage, 0.0) + value_ms, 1)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time a block as one sample of a stage"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.monotonic() - started) * 1000)
+
+    def on_client_audio(self) -> None:
+        """Mark arrival of a client audio chunk"""
+        if self._turn_audio_at is None:
+            self._turn_audio_at = time.monotonic()
+
+    def queue_observer(self, stage: str):
+        """
+        Callback for OutboundPipeline that samples audio queue latency into a stage
+
+        Args:
+            stage: STAGE_FORWARD or STAGE_DELIVERY
+
+        Returns:
+            Callable taking (is_audio, queued_seconds)
+        """
+        # Свой счётчик у каждой очереди: общий делил бы выборку между стадиями неравномерно
+        audio_seen = 0
+
+        def observe(is_audio: bool, queued: float) -> None:
+            nonlocal audio_seen
+            if not is_audio:
+                return
+            audio_seen += 1
+            # Аудио идёт ~50 кадров/с на звонок — пишем каждый N-й
+            if audio_seen % self.sample_every == 0:
+                self.stats.record(self.assistant_id, stage, queued * 1000)
+        return observe
+
+    def on_openai_event(self, msg_type: str) -> None:
+        """
+        Timestamp pipeline events received from OpenAI
+
+        Args:
+            msg_type: Event type
+        """
+        if msg_type == "response.audio.delta":
+            if self._anchor_at is not None and self._first_audio_ms is None:
+                self._first_audio_ms = (time.monotonic() - self._anchor_at) * 1000
+                self.record(STAGE_FIRST_AUDIO, self._first_audio_ms)
+        elif msg_type == "input_audio_buffer.speech_stopped":
+            now = time.monotonic()
+            self._anchor_at = now
+            self._first_audio_ms = None
+            if self._turn_audio_at is not None:
+                self.record(STAGE_INPUT, (now - self._turn_audio_at) * 1000)
+        elif msg_type == "input_audio_buffer.committed":
+            if self._anchor_at is None:
+                self._anchor_at = time.monotonic()
+                self._first_audio_ms = None
+        elif msg_type == "response.done":
+            self._finish_turn()
+
+    def _finish_turn(self) -> None:
+        if self._anchor_at is not None:
+            self.record(STAGE_RESPONSE_DONE, (time.monotonic() - self._anchor_at) * 1000)
+        if self._turn:
+            self.turns += 1
+            fields = " ".join(f"{stage}_ms={value}" for stage, value in self._turn.items())
+            logger.info(
+                f"Turn latency call={self.call_id} assistant={self.assistant_id} turn={self.turns} {fields}",
+                extra={"extra": {
+                    "event": "turn_latency",
+                    "call_id": self.call_id,
+                    "assistant_id": self.assistant_id,
+                    "turn": self.turns,
+                    **{f"{stage}_ms": value for stage, value in self._turn.items()}
+                }}
+            )
+        self._turn = {}
+        self._anchor_at = None
+        self._first_audio_ms = None
+        self._turn_audio_at = None
+
+
+# Гистограммы на процесс
+latency_stats = LatencyStats()
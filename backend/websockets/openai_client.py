@@ -1,7 +1,6 @@
 import asyncio
 import json
 import uuid
-import base64
 import time
 import websockets
 import re
@@ -12,14 +11,23 @@ from typing import Optional, List, Dict, Any, Union, AsyncGenerator
 from backend.core.config import settings
 from backend.core.logging import get_logger
 from backend.models.assistant import AssistantConfig
-from backend.models.conversation import Conversation
+from backend.services.conversation_writer import conversation_writer
 from backend.functions import get_function_definitions, get_enabled_functions, normalize_function_name, execute_function
+from backend.websockets.latency import STAGE_FORWARD, STAGE_FUNCTION_CALL, CallLatencyRecorder
+from backend.websockets.protocol import encode_append_event, encode_append_event_b64
+from backend.websockets.send_queue import OutboundPipeline, OVERFLOW_DISCONNECT
+from backend.websockets.session_compiler import (
+    DEFAULT_SYSTEM_MESSAGE,
+    DEFAULT_VOICE,
+    build_session_payload,
+    build_tools,
+    get_compiled_session,
+)
+from backend.websockets.session_pool import session_pool
+from backend.websockets.session_resume import ConversationHistory, reconnect_delays
 
 logger = get_logger(__name__)
 
-DEFAULT_VOICE = "alloy"
-DEFAULT_SYSTEM_MESSAGE = "You are a helpful voice assistant."
-
 def normalize_functions(assistant_functions):
     """
     Преобразует список функций из UI в полные определения с параметрами.
@@ -128,29 +136,30 @@ class OpenAIRealtimeClient:
         self.webhook_url = None  # Сохраняем URL вебхука из промпта
         self.last_function_name = None  # Сохраняем имя последней вызванной функции
         self.enabled_functions = []  # Список разрешенных функций
+        self.outbound: Optional[OutboundPipeline] = None  # Очередь отправки в OpenAI
+        self.latency = CallLatencyRecorder(getattr(assistant_config, "id", None), client_id)
+        # Текст завершённых реплик — для восстановления контекста после переподключения
+        self.history = ConversationHistory()
+        self.reconnects = 0
+        self._reconnect_lock = asyncio.Lock()
         
-        # Извлекаем список разрешенных функций
-        if hasattr(assistant_config, "functions"):
-            functions = assistant_config.functions
-            if isinstance(functions, list):
-                self.enabled_functions = [normalize_function_name(f.get("name")) for f in functions if f.get("name")]
-            elif isinstance(functions, dict) and "enabled_functions" in functions:
-                self.enabled_functions = [normalize_function_name(name) for name in functions.get("enabled_functions", [])]
-            
-            logger.info(f"Извлечены разрешенные функции: {self.enabled_functions}")
-        
-        # Извлекаем URL вебхука из промпта только если функция send_webhook разрешена
-        if "send_webhook" in self.enabled_functions and hasattr(assistant_config, "system_prompt") and assistant_config.system_prompt:
-            self.webhook_url = extract_webhook_url_from_prompt(assistant_config.system_prompt)
-            if self.webhook_url:
-                logger.info(f"Извлечен URL вебхука из промпта: {self.webhook_url}")
+        # Инструменты, URL вебхука и кадр session.update собраны заранее для этой версии ассистента
+        self.compiled = get_compiled_session(assistant_config)
+        self.enabled_functions = list(self.compiled.enabled_functions)
+        self.webhook_url = self.compiled.webhook_url
+        logger.info(f"Извлечены разрешенные функции: {self.enabled_functions}")
+        if self.webhook_url:
+            logger.info(f"Извлечен URL вебхука из промпта: {self.webhook_url}")
 
-    async def connect(self) -> bool:
+    async def connect(self, use_pool: bool = True) -> bool:
         """
         Establish WebSocket connection to OpenAI Realtime API
         and immediately send up-to-date session settings,
         including the system_prompt from the database.
         
+        Args:
+            use_pool: Take an already configured session from the warm pool if available
+        
         Returns:
             bool: True if connection was successful, False otherwise
         """
@@ -158,52 +167,41 @@ class OpenAIRealtimeClient:
             logger.error("OpenAI API key not provided")
             return False
 
+        pooled_ws = None
+        if use_pool:
+            pooled_ws = await session_pool.acquire(self.api_key, self.assistant_config)
+
         headers = [
             ("Authorization", f"Bearer {self.api_key}"),
             ("OpenAI-Beta", "realtime=v1"),
             ("User-Agent", "WellcomeAI/1.0")
         ]
         try:
-            self.ws = await asyncio.wait_for(
-                websockets.connect(
-                    self.openai_url,
-                    extra_headers=headers,
-                    max_size=15*1024*1024,  # 15 MB max message size
-                    ping_interval=30,
-                    ping_timeout=120,
-                    close_timeout=15
-                ),
-                timeout=30
-            )
+            if pooled_ws is not None:
+                self.ws = pooled_ws
+            else:
+                self.ws = await asyncio.wait_for(
+                    websockets.connect(
+                        self.openai_url,
+                        extra_headers=headers,
+                        max_size=15*1024*1024,  # 15 MB max message size
+                        ping_interval=30,
+                        ping_timeout=120,
+                        close_timeout=15
+                    ),
+                    timeout=30
+                )
             self.is_connected = True
-            logger.info(f"Connected to OpenAI for client {self.client_id}")
-
-            # Fetch fresh settings from assistant_config
-            voice = self.assistant_config.voice or DEFAULT_VOICE
-            system_message = getattr(self.assistant_config, "system_prompt", None) or DEFAULT_SYSTEM_MESSAGE
-            functions = getattr(self.assistant_config, "functions", None)
-            
-            # Обновляем список разрешенных функций
-            if functions:
-                if isinstance(functions, list):
-                    self.enabled_functions = [normalize_function_name(f.get("name")) for f in functions if f.get("name")]
-                elif isinstance(functions, dict) and "enabled_functions" in functions:
-                    self.enabled_functions = [normalize_function_name(name) for name in functions.get("enabled_functions", [])]
-                
-                logger.info(f"Обновлены разрешенные функции: {self.enabled_functions}")
-
-            # Проверяем, есть ли URL вебхука в промпте, только если функция send_webhook разрешена
-            if "send_webhook" in self.enabled_functions:
-                self.webhook_url = extract_webhook_url_from_prompt(system_message)
-                if self.webhook_url:
-                    logger.info(f"Извлечен URL вебхука из промпта: {self.webhook_url}")
-
-            # Send updated session settings with actual system_prompt
-            if not await self.update_session(
-                voice=voice,
-                system_message=system_message,
-                functions=functions
-            ):
+            logger.info(f"Connected to OpenAI for client {self.client_id} (pooled={pooled_ws is not None})")
+
+            # Сессия из пула уже получила session.update с этой же конфигурацией
+            if pooled_ws is not None:
+                self._apply_tools(self.compiled.tools)
+                await self._create_conversation_record()
+                return True
+
+            # Send precompiled session settings with actual system_prompt
+            if not await self.update_session():
                 logger.error("Failed to update session settings")
                 await self.close()
                 return False
@@ -216,39 +214,122 @@ class OpenAIRealtimeClient:
             logger.error(f"Failed to connect to OpenAI: {e}")
             return False
 
+    def start_outbound_pipeline(self) -> OutboundPipeline:
+        """
+        Start the bounded send queue towards OpenAI.
+        Audio and buffer commands go through it, so callers never wait on the socket.
+        
+        Returns:
+            OutboundPipeline: The started pipeline
+        """
+        if self.outbound is None:
+            self.outbound = OutboundPipeline(
+                name=f"{self.client_id}:openai",
+                send=self._ws_send,
+                control_policy=OVERFLOW_DISCONNECT,
+                on_error=self._on_outbound_error,
+                on_sent=self.latency.queue_observer(STAGE_FORWARD)
+            ).start()
+        return self.outbound
+
+    async def _ws_send(self, payload: str) -> None:
+        """Write a payload to the current OpenAI socket (it may change on reconnect)"""
+        if not self.ws:
+            raise ConnectionClosed(None, None)
+        await self.ws.send(payload)
+
+    def _on_outbound_error(self, error: Exception) -> bool:
+        """Keep the OpenAI writer alive across reconnects"""
+        if isinstance(error, ConnectionClosed):
+            self.is_connected = False
+        else:
+            logger.error(f"Error sending to OpenAI: {error}")
+        return True
+
+    async def _send(self, payload: str, audio: bool = False) -> bool:
+        """
+        Send a serialized event to OpenAI through the send queue if it is running.
+        
+        Args:
+            payload: JSON text frame
+            audio: Whether the event carries audio
+            
+        Returns:
+            bool: True if the event was sent or queued
+        """
+        if self.outbound and self.outbound.running:
+            return self.outbound.put(payload, audio=audio)
+        await self.ws.send(payload)
+        return True
+
     async def reconnect(self) -> bool:
         """
         Пытается переподключиться к OpenAI Realtime API после потери соединения.
+        Попытки идут с экспоненциальной задержкой со случайным разбросом; новая
+        сессия получает историю разговора и продолжает ту же запись Conversation.
         
         Returns:
             bool: True если переподключение успешно, False иначе
         """
-        logger.info(f"Попытка переподключения к OpenAI для клиента {self.client_id}")
-        try:
+        # Переподключение уже идёт из другой задачи — дожидаемся его результата
+        if self._reconnect_lock.locked():
+            async with self._reconnect_lock:
+                return self.is_connected
+
+        async with self._reconnect_lock:
             # Закрываем старое соединение, если оно ещё существует
             if self.ws:
                 try:
                     await self.ws.close()
-                except:
+                except Exception:
                     pass
             
             self.is_connected = False
             self.ws = None
             
-            # Подключаемся заново
-            return await self.connect()
-        except Exception as e:
-            logger.error(f"Ошибка при переподключении к OpenAI: {e}")
+            for attempt, delay in enumerate(reconnect_delays(), start=1):
+                if delay:
+                    await asyncio.sleep(delay)
+                logger.info(f"Попытка переподключения к OpenAI для клиента {self.client_id} ({attempt}, задержка {delay:.2f} с)")
+                try:
+                    if await self.connect() and await self._restore_history():
+                        self.reconnects += 1
+                        logger.info(
+                            f"Сессия OpenAI восстановлена для клиента {self.client_id}: "
+                            f"попытка {attempt}, сообщений в контексте {len(self.history)}"
+                        )
+                        return True
+                except Exception as e:
+                    logger.error(f"Ошибка при переподключении к OpenAI: {e}")
+                self.is_connected = False
+
+            logger.error(f"Не удалось переподключиться к OpenAI для клиента {self.client_id}")
+            return False
+
+    async def _restore_history(self) -> bool:
+        """
+        Replay the finished turns of the call into the new session
+
+        Returns:
+            bool: True if the history was sent
+        """
+        try:
+            for event in self.history.replay_events():
+                await self.ws.send(event)
+            return True
+        except ConnectionClosed:
+            logger.warning(f"Connection closed while restoring history for client {self.client_id}")
             return False
 
     async def update_session(
         self,
-        voice: str = DEFAULT_VOICE,
-        system_message: str = DEFAULT_SYSTEM_MESSAGE,
+        voice: Optional[str] = None,
+        system_message: Optional[str] = None,
         functions: Optional[Union[List[Dict[str, Any]], Dict[str, Any]]] = None
     ) -> bool:
         """
         Update session settings on the OpenAI Realtime API side.
+        Without arguments the assistant's precompiled session.update frame is sent as is.
         
         Args:
             voice: Voice ID to use for speech synthesis
@@ -261,60 +342,21 @@ class OpenAIRealtimeClient:
         if not self.is_connected or not self.ws:
             logger.error("Cannot update session: not connected")
             return False
-            
-        turn_detection = {
-            "type": "server_vad",
-            "threshold": 0.25,
-            "prefix_padding_ms": 200,
-            "silence_duration_ms": 300,
-            "create_response": True,
-        }
-        
-        # Получаем нормализованные определения функций
-        normalized_functions = normalize_functions(functions)
-        
-        # Формируем tools для API
-        tools = []
-        for func_def in normalized_functions:
-            tools.append({
-                "type": "function",
-                "name": func_def["name"],
-                "description": func_def["description"],
-                "parameters": func_def["parameters"]
-            })
-        
-        # Обновляем список разрешенных функций на основе tools
-        self.enabled_functions = [normalize_function_name(tool["name"]) for tool in tools]
-        logger.info(f"[DEBUG-FUNCTION] Активированные функции для сессии: {self.enabled_functions}")
-        
-        # Устанавливаем tool_choice на основе наличия tools
+
+        if voice is None and system_message is None and functions is None:
+            tools = self.compiled.tools
+            voice = self.compiled.voice
+            payload = self.compiled.payload
+        else:
+            tools = build_tools(functions)
+            voice = voice or DEFAULT_VOICE
+            payload = json.dumps(build_session_payload(voice, system_message or DEFAULT_SYSTEM_MESSAGE, tools))
+        self._apply_tools(tools)
         tool_choice = "auto" if tools else "none"
         
         logger.info(f"Setting up session with {len(tools)} tools, tool_choice={tool_choice}")
-        
-        # Включение транскрипции аудио в соответствии с документацией OpenAI
-        input_audio_transcription = {
-            "model": "whisper-1"
-        }
-            
-        payload = {
-            "type": "session.update",
-            "session": {
-                "turn_detection": turn_detection,
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                "voice": voice,
-                "instructions": system_message,
-                "modalities": ["text", "audio"],
-                "temperature": 0.7,
-                "max_response_output_tokens": 500,
-                "tools": tools,
-                "tool_choice": tool_choice,
-                "input_audio_transcription": input_audio_transcription
-            }
-        }
         try:
-            await self.ws.send(json.dumps(payload))
+            await self.ws.send(payload)
             logger.info(f"Session settings sent (voice={voice}, tools={len(tools)}, tool_choice={tool_choice})")
             
             # Вывод подробной информации о функциях в лог
@@ -325,25 +367,28 @@ class OpenAIRealtimeClient:
             logger.error(f"Error sending session.update: {e}")
             return False
 
-        # Create a conversation record in the database if available
-        if self.db_session:
+        await self._create_conversation_record()
+        return True
+
+    def _apply_tools(self, tools: List[Dict[str, Any]]) -> None:
+        """Update the allowed functions from the tools sent in the session"""
+        self.enabled_functions = [normalize_function_name(tool["name"]) for tool in tools]
+        logger.info(f"[DEBUG-FUNCTION] Активированные функции для сессии: {self.enabled_functions}")
+
+    async def _create_conversation_record(self) -> None:
+        """Create a conversation record in the database if available"""
+        # После переподключения звонок продолжает уже созданную запись
+        if self.db_session and not self.conversation_record_id:
             try:
-                conv = Conversation(
-                    assistant_id=self.assistant_config.id,
-                    session_id=self.session_id,
-                    user_message="",
-                    assistant_message="",
+                # ID генерируется сразу, строка уходит в БД пакетом вместе с другими сессиями
+                self.conversation_record_id = conversation_writer.record_created(
+                    self.assistant_config.id,
+                    self.session_id
                 )
-                self.db_session.add(conv)
-                self.db_session.commit()
-                self.db_session.refresh(conv)
-                self.conversation_record_id = str(conv.id)
-                logger.info(f"Created conversation record: {self.conversation_record_id}")
+                logger.info(f"Queued conversation record: {self.conversation_record_id}")
             except Exception as e:
                 logger.error(f"Error creating Conversation in DB: {e}")
 
-        return True
-
     async def handle_function_call(self, function_call_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process a function call from OpenAI.
@@ -391,24 +436,32 @@ class OpenAIRealtimeClient:
             }
             
             # Выполняем функцию через новую систему
-            result = await execute_function(
-                name=normalized_function_name,
-                arguments=arguments,
-                context=context
-            )
+            with self.latency.span(STAGE_FUNCTION_CALL):
+                result = await execute_function(
+                    name=normalized_function_name,
+                    arguments=arguments,
+                    context=context
+                )
             
             return result
         except Exception as e:
             logger.error(f"Error processing function call: {e}")
             return {"error": str(e)}
 
-    async def send_function_result(self, function_call_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    async def send_function_result(
+        self,
+        function_call_id: str,
+        result: Dict[str, Any],
+        create_response: bool = True
+    ) -> Dict[str, Any]:
         """
         Send the result of a function execution back to OpenAI as a conversation.item.create event.
         
         Args:
             function_call_id: ID of the function call
             result: Result of the function execution
+            create_response: Request the model's answer right after the result;
+                False when the caller requests it once for several results
             
         Returns:
             Dict: Status information about the result delivery
@@ -452,9 +505,18 @@ class OpenAIRealtimeClient:
             logger.info(f"Отправка результата функции: {function_call_id}")
             logger.info(f"Payload: {json.dumps(payload, ensure_ascii=False)[:200]}...")
             
-            await self.ws.send(json.dumps(payload))
+            # Через очередь отправки: результат не обгоняет уже поставленные аудио и команды
+            if not await self._send(json.dumps(payload)):
+                raise RuntimeError("send queue to OpenAI is closed")
             logger.info(f"Результат функции отправлен как item.create: {function_call_id}")
             
+            if not create_response:
+                return {
+                    "success": True,
+                    "error": None,
+                    "payload": payload
+                }
+            
             # Добавляем небольшую задержку перед запросом нового ответа
             logger.info(f"[DEBUG-FUNCTION] Ожидание перед созданием нового ответа (500мс)")
             await asyncio.sleep(0.5)  # 500 мс должно быть достаточно
@@ -507,7 +569,9 @@ class OpenAIRealtimeClient:
                 }
             }
             
-            await self.ws.send(json.dumps(response_payload))
+            if not await self._send(json.dumps(response_payload)):
+                logger.error("Cannot create response: send queue to OpenAI is closed")
+                return False
             logger.info("Запрошен новый ответ после выполнения функции")
             
             logger.info(f"[DEBUG-FUNCTION] Запрос на создание нового ответа отправлен успешно")
@@ -531,13 +595,30 @@ class OpenAIRealtimeClient:
         if not self.is_connected or not self.ws or not audio_buffer:
             return False
         try:
-            data_b64 = base64.b64encode(audio_buffer).decode("utf-8")
-            await self.ws.send(json.dumps({
-                "type": "input_audio_buffer.append",
-                "audio": data_b64,
-                "event_id": f"audio_{time.time()}"
-            }))
-            return True
+            # Событие собирается из шаблона, без построения словаря и json.dumps
+            return await self._send(encode_append_event(audio_buffer), audio=True)
+        except ConnectionClosed:
+            logger.error("Connection closed while sending audio data")
+            self.is_connected = False
+            return False
+        except Exception as e:
+            logger.error(f"Error processing audio: {e}")
+            return False
+
+    async def process_audio_base64(self, audio_b64: str) -> bool:
+        """
+        Send audio that the client already encoded as base64, without re-encoding it.
+
+        Args:
+            audio_b64: Base64 encoded PCM16 audio
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not self.is_connected or not self.ws or not audio_b64:
+            return False
+        try:
+            return await self._send(encode_append_event_b64(audio_b64), audio=True)
         except ConnectionClosed:
             logger.error("Connection closed while sending audio data")
             self.is_connected = False
@@ -556,11 +637,10 @@ class OpenAIRealtimeClient:
         if not self.is_connected or not self.ws:
             return False
         try:
-            await self.ws.send(json.dumps({
+            return await self._send(json.dumps({
                 "type": "input_audio_buffer.commit",
                 "event_id": f"commit_{time.time()}"
             }))
-            return True
         except ConnectionClosed:
             logger.error("Connection closed while committing audio")
             self.is_connected = False
@@ -579,11 +659,10 @@ class OpenAIRealtimeClient:
         if not self.is_connected or not self.ws:
             return False
         try:
-            await self.ws.send(json.dumps({
+            return await self._send(json.dumps({
                 "type": "input_audio_buffer.clear",
                 "event_id": f"clear_{time.time()}"
             }))
-            return True
         except ConnectionClosed:
             logger.error("Connection closed while clearing audio buffer")
             self.is_connected = False
@@ -592,10 +671,76 @@ class OpenAIRealtimeClient:
             logger.error(f"Error clearing audio buffer: {e}")
             return False
 
+    async def cancel_response(self, event_id: Optional[str] = None) -> bool:
+        """
+        Cancel the response that is currently being generated.
+        
+        Args:
+            event_id: Client event ID to pass through
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not self.is_connected or not self.ws:
+            return False
+        try:
+            return await self._send(json.dumps({
+                "type": "response.cancel",
+                "event_id": event_id
+            }))
+        except ConnectionClosed:
+            logger.error("Connection closed while cancelling response")
+            self.is_connected = False
+            return False
+        except Exception as e:
+            logger.error(f"Error cancelling response: {e}")
+            return False
+
+    async def truncate_item(
+        self,
+        item_id: str,
+        content_index: int,
+        audio_end_ms: int,
+        event_id: Optional[str] = None
+    ) -> bool:
+        """
+        Truncate an assistant audio item to the part the caller has heard,
+        so the model's context matches the conversation that actually took place.
+
+        Args:
+            item_id: ID of the assistant message item
+            content_index: Index of the audio content part
+            audio_end_ms: Played duration to keep, in milliseconds
+            event_id: Client event ID to pass through
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not self.is_connected or not self.ws:
+            return False
+        try:
+            return await self._send(json.dumps({
+                "type": "conversation.item.truncate",
+                "event_id": event_id,
+                "item_id": item_id,
+                "content_index": content_index,
+                "audio_end_ms": audio_end_ms
+            }))
+        except ConnectionClosed:
+            logger.error("Connection closed while truncating item")
+            self.is_connected = False
+            return False
+        except Exception as e:
+            logger.error(f"Error truncating item: {e}")
+            return False
+
     async def close(self) -> None:
         """
         Close the WebSocket connection.
         """
+        if self.outbound:
+            await self.outbound.close()
+            self.outbound = None
         if self.ws:
             try:
                 await self.ws.close()
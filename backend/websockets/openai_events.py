@@ -0,0 +1,619 @@
+"""
+Routing of OpenAI Realtime server events for one call.
+Each event type is handled by its own coroutine looked up in a dispatch
+table; audio deltas take a fast path without logging or table lookup.
+"""
+
+import json
+import logging
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from backend.core.logging import get_logger
+from backend.functions import execute_function, normalize_function_name
+from backend.services.conversation_writer import conversation_writer
+from backend.services.google_sheets_service import GoogleSheetsService
+from backend.websockets.call_recorder import CallRecorder
+from backend.websockets.function_calls import FunctionCall, FunctionCallRunner
+from backend.websockets.interruption import BARGE_IN_EVENT_PREFIX, PlaybackTracker
+from backend.websockets.latency import STAGE_FUNCTION_CALL
+from backend.websockets.openai_client import OpenAIRealtimeClient
+from backend.websockets.protocol import AUDIO_TRANSPORT_BINARY, decode_audio_delta
+from backend.websockets.send_queue import OutboundPipeline
+from backend.websockets.session_resume import RESUME_EVENT_PREFIX
+from backend.websockets.transcript import TranscriptBuffer, TranscriptTurn
+
+logger = get_logger(__name__)
+
+AUDIO_DELTA = "response.audio.delta"
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+
+def _dump(event: Dict[str, Any]) -> str:
+    """Serialize an event for debug logs"""
+    try:
+        return json.dumps(event, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return str(event)
+
+
+class OpenAIEventRouter:
+    """
+    Per-call state and handlers for events received from OpenAI.
+
+    A handler returns True when the event itself should be forwarded to the
+    browser after handling; events without a handler are forwarded as is.
+    """
+
+    # Тип события -> имя метода-обработчика
+    HANDLERS = {
+        "error": "on_error",
+        "input_audio_buffer.speech_started": "on_speech_started",
+        "input_audio_buffer.committed": "on_input_committed",
+        "response.created": "on_response_created",
+        "response.function_call.started": "on_function_call_started",
+        "response.function_call_arguments.delta": "on_function_call_arguments_delta",
+        "response.function_call_arguments.done": "on_function_call_arguments_done",
+        "response.content_part.added": "on_content_part_added",
+        "function_call": "on_legacy_function_call",
+        "conversation.item.input_audio_transcription.completed": "on_transcription_completed",
+        "conversation.item.input_audio_transcription.failed": "on_transcription_failed",
+        "conversation.item.input_audio_transcription.delta": "on_transcription_delta",
+        "response.audio_transcript.delta": "on_transcript_delta",
+        "response.audio_transcript.done": "on_transcript_done",
+        "conversation.item.created": "on_item_created",
+        "audio": "on_legacy_audio",
+        "response.output_item.done": "on_output_item_done",
+        "response.done": "on_response_done",
+    }
+
+    def __init__(
+        self,
+        openai_client: OpenAIRealtimeClient,
+        client_out: OutboundPipeline,
+        audio_transport: str = None,
+        recorder: Optional[CallRecorder] = None,
+        barge_in: bool = False
+    ):
+        """
+        Initialize the router
+
+        Args:
+            openai_client: OpenAI Realtime client of the call
+            client_out: Send queue towards the browser
+            audio_transport: Audio transport negotiated with the browser
+            recorder: Call recorder, if the call is recorded
+            barge_in: Whether the caller's speech interrupts playback
+        """
+        self.openai_client = openai_client
+        self.client_out = client_out
+        self.recorder = recorder
+        self.binary_audio = audio_transport == AUDIO_TRANSPORT_BINARY
+        # Позиция воспроизведения ответа — для обрезки при перебивании
+        self.playback = PlaybackTracker() if barge_in else None
+        # Транскрипт звонка по репликам и результат функции
+        self.transcript = TranscriptBuffer()
+        self.function_result: Optional[Dict[str, Any]] = None
+        # Буфер для накопления аргументов функции
+        self.pending_function_call = self._empty_function_call()
+        # Флаг ожидания ответа после вызова функции
+        self.waiting_for_function_response = False
+        self.last_function_delivery_status: Optional[Dict[str, Any]] = None
+        # Функции выполняются в фоне, чтение событий OpenAI при этом не останавливается
+        self.functions = FunctionCallRunner(
+            self._execute_function,
+            self._deliver_function_result,
+            self.openai_client.create_response_after_function
+        )
+        # Связанные методы берутся один раз на звонок
+        self._handlers: Dict[str, EventHandler] = {
+            msg_type: getattr(self, name) for msg_type, name in self.HANDLERS.items()
+        }
+        self.events = 0
+
+    @staticmethod
+    def _empty_function_call() -> Dict[str, Any]:
+        return {
+            "name": None,          # Имя функции (устанавливается при .started или извлекается из первого delta)
+            "call_id": None,       # ID вызова функции
+            "arguments_buffer": "" # Накопленные аргументы
+        }
+
+    async def dispatch(self, event: Dict[str, Any]) -> None:
+        """
+        Handle one event received from OpenAI
+
+        Args:
+            event: Decoded server event
+        """
+        self.events += 1
+        msg_type = event.get("type", "unknown")
+        self.openai_client.latency.on_openai_event(msg_type)
+
+        if msg_type == AUDIO_DELTA:
+            self.on_audio_delta(event)
+            return
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[DEBUG] Получено сообщение от OpenAI: тип=%s", msg_type)
+            if "transcri" in msg_type:
+                logger.debug("[DEBUG-TRANSCRIPT] Данные события: %s", _dump(event))
+
+        handler = self._handlers.get(msg_type)
+        if handler is None or await handler(event):
+            self.client_out.put(event)
+
+    def on_audio_delta(self, event: Dict[str, Any]) -> None:
+        """Fast path for response.audio.delta: no logging, no table lookup"""
+        if self.playback and not self.playback.on_audio(event):
+            # Хвост прерванного ответа: клиенту и в запись не попадает
+            return
+        if self.binary_audio or self.recorder:
+            chunk = decode_audio_delta(event.get("delta", ""))
+            if self.recorder:
+                self.recorder.feed_assistant(chunk)
+            # В бинарном режиме аудио ответа уходит клиенту сырыми PCM16-байтами
+            if self.binary_audio:
+                self.client_out.put(chunk, audio=True)
+                return
+        self.client_out.put(event, audio=True)
+
+    async def on_error(self, event: Dict[str, Any]) -> bool:
+        error = event.get("error", {})
+        # Ответ мог завершиться раньше, чем дошла наша отмена — это не ошибка
+        if str(error.get("event_id") or "").startswith(BARGE_IN_EVENT_PREFIX):
+            logger.info(f"[DEBUG] Событие перебивания не применено: {error.get('message')}")
+            return False
+        # История после переподключения восстанавливается без участия клиента
+        if str(error.get("event_id") or "").startswith(RESUME_EVENT_PREFIX):
+            logger.warning(f"[DEBUG] Сообщение истории не восстановлено: {error.get('message')}")
+            return False
+        logger.error(f"[DEBUG] ОШИБКА API: {_dump(event)}")
+
+        # Если ошибка связана с отправкой результата функции, обрабатываем особым образом
+        if self.waiting_for_function_response and "item" in str(error):
+            error_message = error.get("message", "Ошибка отправки результата функции")
+            logger.error(f"[DEBUG] Ошибка при отправке результата функции: {error_message}")
+
+            # Создаем свое сообщение пользователю об ошибке
+            self.client_out.put({
+                "type": "response.content_part.added",
+                "content": {
+                    "text": f"Ошибка при выполнении функции: {error_message}"
+                }
+            })
+
+            # После сообщения об ошибке явно запрашиваем новый ответ для генерации аудио
+            await self.openai_client.create_response_after_function()
+            self.waiting_for_function_response = False
+            return False
+
+        # Отправляем остальные ошибки клиенту
+        return True
+
+    async def on_speech_started(self, event: Dict[str, Any]) -> bool:
+        if self.playback and self.playback.active:
+            await self.interrupt_playback()
+        return True
+
+    async def on_input_committed(self, event: Dict[str, Any]) -> bool:
+        # Границы реплик: новая начинается с зафиксированного аудио собеседника
+        await self.save_turns(self.transcript.start_turn(event.get("item_id")))
+        return True
+
+    async def on_response_created(self, event: Dict[str, Any]) -> bool:
+        self.transcript.on_response_created(event.get("response", {}).get("id"))
+        return True
+
+    async def _reject_function(
+        self,
+        function_name: str,
+        normalized_name: str,
+        function_call_id: Optional[str],
+        response_id: Optional[str] = None
+    ) -> None:
+        """Tell the caller and the model that a function is not enabled for the assistant"""
+        logger.warning(
+            f"[DEBUG] Попытка вызвать неразрешенную функцию: {normalized_name}. "
+            f"Разрешены только: {self.openai_client.enabled_functions}"
+        )
+
+        # Отправляем сообщение об ошибке пользователю
+        self.client_out.put({
+            "type": "response.content_part.added",
+            "content": {
+                "text": f"Ошибка: функция {function_name} не активирована для этого ассистента."
+            }
+        })
+
+        # Отправляем пустой результат или ошибку, чтобы разблокировать модель
+        if function_call_id:
+            self.functions.submit(function_call_id, normalized_name, None, response_id, result={
+                "error": f"Функция {normalized_name} не разрешена",
+                "status": "error"
+            })
+
+    async def _execute_function(self, name: str, arguments: Any) -> Dict[str, Any]:
+        with self.openai_client.latency.span(STAGE_FUNCTION_CALL):
+            result = await execute_function(
+                name=name,
+                arguments=arguments,
+                context={
+                    "assistant_config": self.openai_client.assistant_config,
+                    "client_id": self.openai_client.client_id,
+                    "db_session": self.openai_client.db_session
+                }
+            )
+        # Сохраняем результат для логирования
+        self.function_result = result
+        self.transcript.note_function_result(result)
+        return result
+
+    async def _deliver_function_result(self, call: FunctionCall) -> None:
+        """Send a finished call's result to the model and report it to the caller"""
+        result = call.result
+        # Устанавливаем флаг ожидания ответа после вызова функции
+        self.waiting_for_function_response = True
+
+        # Отправляем результат обратно в OpenAI; ответ модели запросит FunctionCallRunner
+        delivery_status = await self.openai_client.send_function_result(call.call_id, result, create_response=False)
+        self.last_function_delivery_status = delivery_status
+
+        if not delivery_status["success"]:
+            logger.error(f"[DEBUG] Ошибка отправки результата функции: {delivery_status['error']}")
+            self.client_out.put({
+                "type": "response.content_part.added",
+                "content": {
+                    "text": f"Произошла ошибка при выполнении функции: {delivery_status['error']}"
+                }
+            })
+
+        # Информируем клиента о результате в любом случае
+        self.client_out.put({
+            "type": "function_call.completed",
+            "function": call.name,
+            "function_call_id": call.call_id,
+            "result": result
+        })
+
+        # Анализируем результат вебхука для формирования понятного ответа пользователю
+        if call.name == "send_webhook" and self.waiting_for_function_response and result.get("status", 0) == 404:
+            arguments = call.arguments if isinstance(call.arguments, dict) else {}
+            self.client_out.put({
+                "type": "response.content_part.added",
+                "content": {
+                    "text": f"Вебхук не найден (ошибка 404). Запрос был отправлен на URL: {arguments.get('url', 'неизвестный URL')}, но такой вебхук не зарегистрирован. Пожалуйста, проверьте настройки n8n и повторите попытку."
+                }
+            })
+            # Сбрасываем флаг ожидания, т.к. мы уже предоставили пользователю ответ
+            self.waiting_for_function_response = False
+
+    async def on_function_call_started(self, event: Dict[str, Any]) -> bool:
+        function_name = event.get("function_name")
+        function_call_id = event.get("call_id")
+        logger.info(f"[DEBUG] Начало вызова функции: {function_name}, ID: {function_call_id}")
+
+        normalized_name = normalize_function_name(function_name) or function_name
+        if normalized_name not in self.openai_client.enabled_functions:
+            await self._reject_function(function_name, normalized_name, function_call_id)
+            return False
+
+        # Инициализируем данные о текущем вызове функции
+        self.pending_function_call = {
+            "name": normalized_name,
+            "call_id": function_call_id,
+            "arguments_buffer": ""
+        }
+
+        # Уведомляем клиента о начале вызова функции
+        self.client_out.put({
+            "type": "function_call.started",
+            "function": normalized_name,
+            "function_call_id": function_call_id
+        })
+        return True
+
+    async def on_function_call_arguments_delta(self, event: Dict[str, Any]) -> bool:
+        delta = event.get("delta", "")
+        pending = self.pending_function_call
+
+        # Извлекаем имя функции и ID из первого delta, если их еще нет
+        if not pending["name"] and "call_id" in event:
+            pending["call_id"] = event.get("call_id")
+            logger.info(f"[DEBUG] Получена первая часть аргументов функции: '{delta[:100]}'")
+
+            # Определение функции по содержимому аргументов
+            if "url" in delta or "event" in delta:
+                pending["name"] = "send_webhook"
+                logger.info(f"[DEBUG] Определена функция по аргументам: send_webhook")
+            elif "namespace" in delta or "query" in delta:
+                pending["name"] = "search_pinecone"
+                logger.info(f"[DEBUG] Определена функция по аргументам: search_pinecone")
+
+        pending["arguments_buffer"] += delta
+        return True
+
+    async def on_function_call_arguments_done(self, event: Dict[str, Any]) -> bool:
+        pending = self.pending_function_call
+        # Сбрасываем буфер аргументов для следующего вызова
+        self.pending_function_call = self._empty_function_call()
+
+        arguments_str = event.get("arguments", pending["arguments_buffer"])
+        # Если не получили имя функции через started, но есть в done
+        function_name = event.get("function_name") or event.get("name") or pending["name"]
+        function_call_id = event.get("call_id", pending["call_id"])
+        logger.info(f"[DEBUG-FUNCTION] Завершение получения аргументов для функции: {function_name}")
+
+        # Восстановить имя функции по содержимому аргументов, если она не определена
+        if not function_name and arguments_str:
+            if "url" in arguments_str:
+                function_name = "send_webhook"
+                logger.info(f"[DEBUG-FUNCTION] Определена функция по аргументам: send_webhook")
+            elif "namespace" in arguments_str and "query" in arguments_str:
+                function_name = "search_pinecone"
+                logger.info(f"[DEBUG-FUNCTION] Определена функция по аргументам: search_pinecone")
+
+        normalized_name = normalize_function_name(function_name) or function_name
+        logger.info(f"[DEBUG-FUNCTION] Нормализация окончательного имени: {function_name} -> {normalized_name}")
+
+        if normalized_name and normalized_name not in self.openai_client.enabled_functions:
+            await self._reject_function(function_name, normalized_name, function_call_id, event.get("response_id"))
+            return False
+
+        if not (function_call_id and normalized_name):
+            return True
+
+        logger.info(f"[DEBUG] Получены все аргументы функции {normalized_name}: {arguments_str}")
+        try:
+            arguments = json.loads(arguments_str)
+
+            # Сообщаем клиенту о процессе выполнения функции
+            self.client_out.put({
+                "type": "function_call.start",
+                "function": normalized_name,
+                "function_call_id": function_call_id
+            })
+
+            # Результат отправит задача функции, а события OpenAI читаются дальше
+            self.functions.submit(function_call_id, normalized_name, arguments, event.get("response_id"))
+
+        except json.JSONDecodeError as e:
+            error_msg = f"Ошибка при парсинге аргументов функции: {e}"
+            logger.error(f"[DEBUG] {error_msg}")
+            self.client_out.put({
+                "type": "error",
+                "error": {"code": "function_args_error", "message": error_msg}
+            })
+        except Exception as e:
+            error_msg = f"Ошибка при выполнении функции: {e}"
+            logger.error(f"[DEBUG] {error_msg}")
+            self.client_out.put({
+                "type": "error",
+                "error": {"code": "function_execution_error", "message": error_msg}
+            })
+        return True
+
+    async def on_content_part_added(self, event: Dict[str, Any]) -> bool:
+        # Если был вызов функции, и мы ждем ответа - отслеживаем это
+        if self.waiting_for_function_response:
+            logger.info(f"[DEBUG] Получен ответ после выполнения функции")
+            self.waiting_for_function_response = False
+
+        text = event.get("content", {}).get("text")
+        if text is not None:
+            self.transcript.add_assistant_delta(event.get("response_id"), text)
+            logger.info(f"[DEBUG] Из response.content_part.added получен текст ассистента: '{text}'")
+        return True
+
+    async def on_legacy_function_call(self, event: Dict[str, Any]) -> bool:
+        # Старая логика для обратной совместимости с function_call
+        function_call_id = event.get("function_call_id")
+        function_data = event.get("function", {})
+        function_name = function_data.get("name")
+        logger.info(f"[DEBUG] Получен вызов функции (legacy): {function_name}, аргументы: {function_data.get('arguments')}")
+
+        normalized_name = normalize_function_name(function_name) or function_name
+        if normalized_name not in self.openai_client.enabled_functions:
+            await self._reject_function(function_name, normalized_name, function_call_id)
+            return False
+
+        self.client_out.put({
+            "type": "function_call.start",
+            "function": normalized_name,
+            "function_call_id": function_call_id
+        })
+
+        # Вызов без response_id: ответ модели запрашивается сразу после результата
+        self.functions.submit(function_call_id, normalized_name, function_data.get("arguments", {}))
+        return False
+
+    async def on_transcription_completed(self, event: Dict[str, Any]) -> bool:
+        user_text = event.get("transcript", "")
+        logger.info(f"[DEBUG] Получена транскрипция пользователя: '{user_text}'")
+        await self.save_turns(self.transcript.set_user_transcript(event.get("item_id"), user_text))
+        return True
+
+    async def on_transcription_failed(self, event: Dict[str, Any]) -> bool:
+        await self.save_turns(self.transcript.set_user_transcript(event.get("item_id"), None))
+        return True
+
+    async def on_transcription_delta(self, event: Dict[str, Any]) -> bool:
+        # Фрагменты копятся списком и склеиваются один раз на реплику
+        self.transcript.add_user_delta(event.get("item_id"), event.get("delta", ""))
+        return True
+
+    async def on_transcript_delta(self, event: Dict[str, Any]) -> bool:
+        self.transcript.add_assistant_delta(event.get("response_id"), event.get("delta", ""))
+        return True
+
+    async def on_transcript_done(self, event: Dict[str, Any]) -> bool:
+        self.transcript.set_assistant_transcript(event.get("response_id"), event.get("transcript", ""))
+        return True
+
+    async def on_item_created(self, event: Dict[str, Any]) -> bool:
+        item = event.get("item", {})
+        # Реплики, восстановленные после переподключения, уже сохранены и показаны клиенту
+        if str(item.get("id") or "").startswith(RESUME_EVENT_PREFIX):
+            return False
+        if item.get("role") != "user":
+            return True
+        # Если это сообщение пользователя, пытаемся извлечь транскрипцию
+        for part in item.get("content", []):
+            if part.get("type") == "input_audio" and part.get("transcript"):
+                await self.save_turns(self.transcript.set_user_transcript(item.get("id"), part["transcript"]))
+                logger.info(f"[DEBUG] Из conversation.item.created получена транскрипция пользователя: '{part['transcript']}'")
+            elif part.get("type") == "input_text" and part.get("text"):
+                await self.save_turns(self.transcript.set_user_transcript(item.get("id"), part["text"]))
+                logger.info(f"[DEBUG] Из conversation.item.created получен текст пользователя: '{part['text']}'")
+        return True
+
+    async def on_legacy_audio(self, event: Dict[str, Any]) -> bool:
+        # если это аудио-чанк — отдаём как bytes
+        self.client_out.put(decode_audio_delta(event.get("data", "")), audio=True)
+        return False
+
+    async def on_output_item_done(self, event: Dict[str, Any]) -> bool:
+        # Если мы все еще ждем ответа функции и не получили контента
+        if not (self.waiting_for_function_response and self.last_function_delivery_status):
+            return True
+
+        # Ассистент не обработал результат функции должным образом
+        if self.openai_client.last_function_name == "send_webhook" and self.function_result:
+            status_code = self.function_result.get("status", 0)
+
+            # Генерируем информативный ответ в зависимости от статуса вебхука
+            if status_code == 404:
+                message_text = "Вебхук не найден (ошибка 404). Возможно, он не зарегистрирован или не активирован."
+            elif 200 <= status_code < 300:
+                message_text = "Вебхук успешно выполнен."
+            else:
+                message_text = f"Вебхук вернул статус {status_code}."
+
+            self.client_out.put({
+                "type": "response.content_part.added",
+                "content": {
+                    "text": message_text
+                }
+            })
+
+            # Явно запрашиваем новый ответ для генерации аудио,
+            # так как текущий ответ не содержит аудио
+            await self.openai_client.create_response_after_function()
+
+        self.waiting_for_function_response = False
+        return True
+
+    async def on_response_done(self, event: Dict[str, Any]) -> bool:
+        # Клиент получает response.done сразу, запись в БД и Google Sheets — после
+        self.client_out.put(event)
+        logger.info(f"[DEBUG] Получен сигнал завершения ответа: response.done")
+        response = event.get("response", {})
+        if self.playback:
+            self.playback.on_response_done(response.get("id"))
+        # Ответ с вызовами функций завершён: после их результатов можно запрашивать следующий
+        await self.functions.on_response_done(response.get("id"))
+
+        # Законченные реплики пишутся отдельными строками, перечитывать БД не нужно
+        finished_turns = self.transcript.on_response_done(response)
+        if finished_turns:
+            await self.save_turns(finished_turns)
+            # Результат функции уже записан вместе с репликой
+            self.function_result = None
+
+        # Сбрасываем флаг ожидания функции, если он остался активным
+        self.waiting_for_function_response = False
+        return False
+
+    async def interrupt_playback(self) -> None:
+        """
+        Stop the assistant's audio when the caller starts speaking over it.
+        Queued audio is dropped, the response is cancelled and the item is
+        truncated to what the caller has actually heard.
+        """
+        if not self.playback.active:
+            return
+        interruption = self.playback.interrupt(self.client_out.drop_audio())
+        if self.recorder:
+            self.recorder.drop_assistant()
+
+        event_id = f"{BARGE_IN_EVENT_PREFIX}{interruption['item_id']}"
+        if not interruption["done"]:
+            await self.openai_client.cancel_response(f"{event_id}_cancel")
+        await self.openai_client.truncate_item(
+            interruption["item_id"],
+            interruption["content_index"],
+            interruption["audio_end_ms"],
+            f"{event_id}_truncate"
+        )
+        # Браузер сбрасывает свой буфер воспроизведения
+        self.client_out.put({
+            "type": "response.audio.interrupted",
+            "response_id": interruption["response_id"],
+            "item_id": interruption["item_id"],
+            "audio_end_ms": interruption["audio_end_ms"]
+        })
+        logger.info(
+            f"Caller interrupted response {interruption['response_id']} "
+            f"at {interruption['audio_end_ms']} ms (client_id={self.openai_client.client_id})"
+        )
+
+    async def save_turns(self, turns: List[TranscriptTurn]) -> None:
+        """
+        Persist finished turns of a call and log them to the assistant's Google Sheet.
+        The first turn fills the conversation row created with the session, the
+        following ones are queued as new rows of the same session.
+
+        Args:
+            turns: Finished turns, in order
+        """
+        if not turns:
+            return
+        openai_client = self.openai_client
+        for turn in turns:
+            openai_client.history.add_turn(turn.user_text, turn.assistant_text)
+
+        if openai_client.db_session and openai_client.conversation_record_id:
+            try:
+                new_turns = []
+                for turn in turns:
+                    if turn.index == 1:
+                        conversation_writer.record_update(
+                            openai_client.conversation_record_id,
+                            user_message=turn.user_text,
+                            assistant_message=turn.assistant_text,
+                            duration_seconds=turn.duration
+                        )
+                    else:
+                        new_turns.append(turn.to_dict())
+                conversation_writer.record_turns(openai_client.assistant_config.id, openai_client.session_id, new_turns)
+                logger.info(f"[DEBUG] Реплики {[turn.index for turn in turns]} поставлены в очередь записи в БД")
+            except Exception as e:
+                logger.error(f"[DEBUG] Ошибка при сохранении реплик: {str(e)}")
+
+        # Если у ассистента есть google_sheet_id, логируем разговор
+        sheet_id = openai_client.assistant_config.google_sheet_id if openai_client.assistant_config else None
+        if not sheet_id:
+            return
+        for turn in turns:
+            try:
+                sheets_result = await GoogleSheetsService.log_conversation(
+                    sheet_id=sheet_id,
+                    user_message=turn.user_text,
+                    assistant_message=turn.assistant_text,
+                    function_result=turn.function_result
+                )
+                if not sheets_result:
+                    logger.error(f"[DEBUG] Ошибка при записи в Google Sheet")
+            except Exception as e:
+                logger.error(f"[DEBUG] Ошибка при записи в Google Sheet: {str(e)}")
+                logger.error(f"[DEBUG] Трассировка: {traceback.format_exc()}")
+
+    async def close(self) -> None:
+        """Stop running function calls and save turns that were still open when the call ended"""
+        if self.functions.running:
+            logger.info(f"Отмена незавершённых функций для client_id={self.openai_client.client_id}: {self.functions.stats()}")
+        await self.functions.close()
+        if self.playback and self.playback.interruptions:
+            logger.info(f"Barge-in for client_id={self.openai_client.client_id}: {self.playback.stats()}")
+        await self.save_turns(self.transcript.finish_all())
@@ -0,0 +1,413 @@
+"""
+Client protocol helpers for the realtime WebSocket endpoint.
+Handles audio transport and ack negotiation and zero-copy PCM16 framing.
+"""
+
+import base64
+import binascii
+import re
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Версия клиентского протокола, сообщается в connection_status
+PROTOCOL_VERSION = 2
+
+# Способы передачи аудио между браузером и сервером
+AUDIO_TRANSPORT_JSON = "json"      # base64 внутри JSON (старые виджеты)
+AUDIO_TRANSPORT_BINARY = "binary"  # сырые PCM16 в бинарных фреймах
+AUDIO_TRANSPORTS = (AUDIO_TRANSPORT_JSON, AUDIO_TRANSPORT_BINARY)
+
+# Режимы подтверждения входящего аудио
+ACK_MODE_CHUNK = "chunk"            # ack на каждый чанк (поведение протокола v1)
+ACK_MODE_NONE = "none"              # без подтверждений
+ACK_MODE_CUMULATIVE = "cumulative"  # одно подтверждение на окно по времени или объёму
+ACK_MODE_OFFSET = "offset"          # как cumulative, но с абсолютным смещением в байтах
+ACK_MODES = (ACK_MODE_CHUNK, ACK_MODE_NONE, ACK_MODE_CUMULATIVE, ACK_MODE_OFFSET)
+
+# PCM16 mono 24 kHz — формат, который объявляется в session.update
+PCM16_SAMPLE_WIDTH = 2
+REALTIME_SAMPLE_RATE = 24000
+
+# Минимальный объём для commit: 100 мс аудио в формате сессии
+MIN_COMMIT_BYTES = REALTIME_SAMPLE_RATE * PCM16_SAMPLE_WIDTH // 10
+
+# Форматы, которые клиент может объявить при подключении; всё приводится к PCM16 24 kHz
+INPUT_ENCODING_PCM16 = "pcm16"
+INPUT_ENCODING_FLOAT32 = "float32"
+INPUT_ENCODINGS = (INPUT_ENCODING_PCM16, INPUT_ENCODING_FLOAT32)
+INPUT_SAMPLE_RATES = (8000, 16000, 24000, 44100, 48000)
+
+# Шаблон события input_audio_buffer.append: собираем строку без json.dumps
+_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+_APPEND_SUFFIX = '"}'
+
+# Строгий base64 без пробелов и переводов строк: только такая строка может попасть в шаблон
+_BASE64_RE = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+def is_valid_base64(value: Any) -> bool:
+    """
+    Check that a client value is a strict base64 string
+
+    Args:
+        value: Value of the "audio" field
+
+    Returns:
+        True if the value can be embedded into an event template as is
+    """
+    return isinstance(value, str) and len(value) % 4 == 0 and _BASE64_RE.fullmatch(value) is not None
+
+
+def encode_append_event(audio: BytesLike) -> str:
+    """
+    Build an input_audio_buffer.append event from raw PCM16 bytes
+
+    Args:
+        audio: PCM16 audio data
+
+    Returns:
+        JSON text frame ready to be sent to OpenAI
+    """
+    return _APPEND_PREFIX + base64.b64encode(audio).decode("ascii") + _APPEND_SUFFIX
+
+
+def encode_append_event_b64(audio_b64: str) -> str:
+    """
+    Build an input_audio_buffer.append event from audio that is already base64 encoded
+
+    Args:
+        audio_b64: Base64 encoded PCM16 audio
+
+    Returns:
+        JSON text frame ready to be sent to OpenAI
+
+    Raises:
+        ValueError: The string is not strict base64 and would break out of the template
+    """
+    if not is_valid_base64(audio_b64):
+        raise ValueError("Audio is not valid base64")
+    return _APPEND_PREFIX + audio_b64 + _APPEND_SUFFIX
+
+
+def decode_audio_delta(audio_b64: str) -> bytes:
+    """
+    Decode a base64 audio delta from OpenAI into raw PCM16 bytes
+
+    Args:
+        audio_b64: Base64 encoded audio
+
+    Returns:
+        Raw audio bytes
+    """
+    # a2b_base64 не делает лишних проверок, в отличие от b64decode(validate=True)
+    return binascii.a2b_base64(audio_b64)
+
+
+def base64_decoded_size(audio_b64: str) -> int:
+    """
+    Compute the decoded size of a base64 string without decoding it
+
+    Args:
+        audio_b64: Base64 encoded data
+
+    Returns:
+        Number of bytes the string decodes to
+    """
+    length = len(audio_b64)
+    if not length:
+        return 0
+    padding = 2 if audio_b64.endswith("==") else 1 if audio_b64.endswith("=") else 0
+    return (length * 3) // 4 - padding
+
+
+def negotiate_audio_transport(requested: Optional[str]) -> str:
+    """
+    Pick the audio transport for a client connection
+
+    Args:
+        requested: Transport requested by the client (query parameter)
+
+    Returns:
+        One of AUDIO_TRANSPORTS, JSON by default for old widgets
+    """
+    if requested and requested.lower() in AUDIO_TRANSPORTS:
+        return requested.lower()
+    if requested:
+        logger.warning(f"Unknown audio transport requested: {requested}, falling back to json")
+    return AUDIO_TRANSPORT_JSON
+
+
+def parse_int_param(value: Optional[str]) -> Optional[int]:
+    """
+    Parse an optional positive integer query parameter
+
+    Args:
+        value: Raw parameter value
+
+    Returns:
+        Parsed integer or None if missing or invalid
+    """
+    try:
+        parsed = int(value) if value else None
+    except ValueError:
+        return None
+    return parsed if parsed and parsed > 0 else None
+
+
+def negotiate_ack_mode(requested: Optional[str]) -> str:
+    """
+    Pick the acknowledgement mode for a client connection
+
+    Args:
+        requested: Ack mode requested by the client (query parameter)
+
+    Returns:
+        One of ACK_MODES, per-chunk acks by default for old widgets
+    """
+    if requested and requested.lower() in ACK_MODES:
+        return requested.lower()
+    if requested:
+        logger.warning(f"Unknown ack mode requested: {requested}, falling back to {ACK_MODE_CHUNK}")
+    return ACK_MODE_CHUNK
+
+
+def negotiate_input_format(encoding: Optional[str], sample_rate: Optional[str]) -> Tuple[str, int]:
+    """
+    Pick the format of client audio
+
+    Args:
+        encoding: Encoding declared by the client (query parameter)
+        sample_rate: Sample rate declared by the client (query parameter)
+
+    Returns:
+        Tuple of one of INPUT_ENCODINGS and one of INPUT_SAMPLE_RATES, PCM16 24 kHz by default
+    """
+    chosen_encoding = INPUT_ENCODING_PCM16
+    if encoding and encoding.lower() in INPUT_ENCODINGS:
+        chosen_encoding = encoding.lower()
+    elif encoding:
+        logger.warning(f"Unknown input encoding requested: {encoding}, falling back to {INPUT_ENCODING_PCM16}")
+
+    chosen_rate = REALTIME_SAMPLE_RATE
+    rate = parse_int_param(sample_rate)
+    if rate in INPUT_SAMPLE_RATES:
+        chosen_rate = rate
+    elif sample_rate:
+        logger.warning(f"Unsupported input sample rate requested: {sample_rate}, falling back to {REALTIME_SAMPLE_RATE}")
+    return chosen_encoding, chosen_rate
+
+
+def negotiate_vad(requested: Optional[str]) -> bool:
+    """
+    Decide whether client audio goes through the server-side VAD gate
+
+    Args:
+        requested: Value of the vad query parameter ("on"/"off", "1"/"0")
+
+    Returns:
+        bool: True if silence should be held back before forwarding
+    """
+    if not requested:
+        return settings.AUDIO_VAD_ENABLED
+    value = requested.lower()
+    if value in ("1", "on", "true"):
+        return True
+    if value in ("0", "off", "false"):
+        return False
+    logger.warning(f"Unknown vad mode requested: {requested}, using default")
+    return settings.AUDIO_VAD_ENABLED
+
+
+def negotiate_barge_in(requested: Optional[str]) -> bool:
+    """
+    Decide whether the caller can interrupt the assistant's audio
+
+    Args:
+        requested: Value of the barge_in query parameter ("on"/"off", "1"/"0")
+
+    Returns:
+        bool: True if speech of the caller stops and truncates playback
+    """
+    if not requested:
+        return settings.BARGE_IN_ENABLED
+    value = requested.lower()
+    if value in ("1", "on", "true"):
+        return True
+    if value in ("0", "off", "false"):
+        return False
+    logger.warning(f"Unknown barge_in mode requested: {requested}, using default")
+    return settings.BARGE_IN_ENABLED
+
+
+class AudioAckTracker:
+    """
+    Decides when incoming audio has to be acknowledged.
+
+    In cumulative and offset modes one ack covers every chunk received since
+    the previous one. The window is checked when audio arrives, so an idle
+    stream does not produce acks.
+    """
+
+    def __init__(self, mode: str = ACK_MODE_CHUNK, interval_ms: int = None, interval_bytes: int = None):
+        """
+        Initialize the tracker
+
+        Args:
+            mode: One of ACK_MODES
+            interval_ms: Maximum time between cumulative acks (default: settings.WS_ACK_INTERVAL_MS)
+            interval_bytes: Maximum bytes between cumulative acks (default: settings.WS_ACK_INTERVAL_BYTES)
+        """
+        self.mode = mode
+        self.interval = (interval_ms or settings.WS_ACK_INTERVAL_MS) / 1000
+        self.interval_bytes = interval_bytes or settings.WS_ACK_INTERVAL_BYTES
+        self.total_bytes = 0
+        self._window_bytes = 0
+        self._window_chunks = 0
+        self._window_started = time.monotonic()
+        self._last_event_id = None
+
+    def on_audio(self, size: int, event_id: Optional[str] = None, binary: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Register a received audio chunk
+
+        Args:
+            size: Decoded size of the chunk in bytes
+            event_id: Client event ID, if any
+            binary: Whether the chunk came in a binary frame
+
+        Returns:
+            Ack message to send to the client or None
+        """
+        self.total_bytes += size
+
+        if self.mode == ACK_MODE_CHUNK:
+            if binary:
+                return {"type": "binary.ack"}
+            return {"type": "input_audio_buffer.append.ack", "event_id": event_id}
+
+        if self.mode == ACK_MODE_NONE:
+            return None
+
+        self._window_bytes += size
+        self._window_chunks += 1
+        if event_id is not None:
+            self._last_event_id = event_id
+
+        if (self._window_bytes >= self.interval_bytes
+                or time.monotonic() - self._window_started >= self.interval):
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        """
+        Acknowledge everything received in the current window
+
+        Returns:
+            Ack message or None if there is nothing to acknowledge
+        """
+        if self.mode not in (ACK_MODE_CUMULATIVE, ACK_MODE_OFFSET) or not self._window_chunks:
+            return None
+
+        ack = {
+            "type": "input_audio_buffer.ack",
+            "chunks": self._window_chunks,
+            "bytes": self._window_bytes,
+            "event_id": self._last_event_id
+        }
+        if self.mode == ACK_MODE_OFFSET:
+            ack["offset"] = self.total_bytes
+
+        self._window_bytes = 0
+        self._window_chunks = 0
+        self._window_started = time.monotonic()
+        self._last_event_id = None
+        return ack
+
+
+class PCMFrameAssembler:
+    """
+    Splits an incoming PCM16 byte stream into fixed-size frames.
+
+    Frames are assembled in a single preallocated buffer. Yielded memoryviews
+    are only valid until the next iteration, so consumers must encode or copy
+    them before asking for the next frame.
+    """
+
+    def __init__(self, frame_ms: int = None, sample_rate: int = REALTIME_SAMPLE_RATE):
+        """
+        Initialize the assembler
+
+        Args:
+            frame_ms: Frame duration in milliseconds (default: settings.WS_AUDIO_FRAME_MS)
+            sample_rate: Sample rate of the PCM16 stream in Hz
+        """
+        frame_ms = frame_ms or settings.WS_AUDIO_FRAME_MS
+        self.frame_bytes = max(PCM16_SAMPLE_WIDTH, sample_rate * frame_ms // 1000 * PCM16_SAMPLE_WIDTH)
+        self._buffer = bytearray(self.frame_bytes)
+        self._view = memoryview(self._buffer)
+        self._filled = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of bytes waiting for a complete frame"""
+        return self._filled
+
+    def feed(self, data: BytesLike) -> Iterator[memoryview]:
+        """
+        Add data to the stream and yield every complete frame
+
+        Args:
+            data: Raw PCM16 bytes from the client
+
+        Yields:
+            Complete frames as memoryviews
+        """
+        incoming = memoryview(data).cast("B")
+        offset = 0
+        size = len(incoming)
+
+        # Дополняем незавершённый фрейм
+        if self._filled:
+            take = min(self.frame_bytes - self._filled, size)
+            self._view[self._filled:self._filled + take] = incoming[:take]
+            self._filled += take
+            offset = take
+            if self._filled < self.frame_bytes:
+                return
+            self._filled = 0
+            yield self._view
+
+        # Целые фреймы отдаём прямо из входного буфера, без копирования
+        while size - offset >= self.frame_bytes:
+            yield incoming[offset:offset + self.frame_bytes]
+            offset += self.frame_bytes
+
+        # Остаток сохраняем до следующего вызова
+        rest = size - offset
+        if rest:
+            self._view[:rest] = incoming[offset:]
+            self._filled = rest
+
+    def flush(self) -> Optional[memoryview]:
+        """
+        Return the incomplete tail frame, truncated to whole samples
+
+        Returns:
+            Remaining audio or None if nothing is buffered
+        """
+        usable = self._filled - (self._filled % PCM16_SAMPLE_WIDTH)
+        self._filled = 0
+        if not usable:
+            return None
+        return self._view[:usable]
+
+    def reset(self) -> None:
+        """Drop any buffered audio"""
+        self._filled = 0
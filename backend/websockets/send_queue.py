@@ -0,0 +1,295 @@
+"""
+Bounded outbound send queues for realtime WebSocket connections.
+Decouples reading from one peer and writing to the other, so a slow
+browser does not stall the OpenAI stream and vice versa.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Политики при переполнении очереди
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # выбрасываем самое старое аудио
+OVERFLOW_COALESCE = "coalesce"        # склеиваем дельты транскрипции, затем отключаем
+OVERFLOW_DISCONNECT = "disconnect"    # закрываем соединение
+
+# Дельты, которые можно склеить в одно событие, пока они ещё не отправлены
+COALESCABLE_DELTAS = {
+    "response.audio_transcript.delta",
+    "response.text.delta",
+    "response.function_call_arguments.delta",
+    "conversation.item.input_audio_transcription.delta",
+}
+
+# Все живые очереди процесса: для метрик
+active_pipelines: Dict[str, "OutboundPipeline"] = {}
+
+
+class OutboundPipeline:
+    """
+    Ordered outbound queue with separate bounds for audio and control items
+    and a single writer task.
+
+    Items keep their relative order. When the audio bound is hit the oldest
+    queued audio item is dropped; when the control bound is hit the pipeline
+    either coalesces deltas or disconnects, depending on the policy.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        send: Callable[[Any], Awaitable[None]],
+        audio_maxsize: int = None,
+        control_maxsize: int = None,
+        control_policy: str = OVERFLOW_DISCONNECT,
+        on_overflow: Optional[Callable[[], Awaitable[None]]] = None,
+        on_error: Optional[Callable[[Exception], bool]] = None,
+        on_sent: Optional[Callable[[bool, float], None]] = None
+    ):
+        """
+        Initialize the pipeline
+
+        Args:
+            name: Unique name used in metrics (e.g. "<client_id>:client")
+            send: Coroutine that writes one payload to the peer
+            audio_maxsize: Max queued audio items (default: settings.WS_SEND_QUEUE_AUDIO_MAX)
+            control_maxsize: Max queued control items (default: settings.WS_SEND_QUEUE_CONTROL_MAX)
+            control_policy: OVERFLOW_COALESCE or OVERFLOW_DISCONNECT
+            on_overflow: Coroutine called once when the pipeline gives up on a slow peer
+            on_error: Called on send errors, returns True to keep the writer running
+            on_sent: Called after each send with (is_audio, seconds the item spent queued)
+        """
+        self.name = name
+        self._send = send
+        self.audio_maxsize = audio_maxsize or settings.WS_SEND_QUEUE_AUDIO_MAX
+        self.control_maxsize = control_maxsize or settings.WS_SEND_QUEUE_CONTROL_MAX
+        self.control_policy = control_policy
+        self._on_overflow = on_overflow
+        self._on_error = on_error
+        self._on_sent = on_sent
+
+        # Элементы очереди: [payload, is_audio, alive, enqueued_at]
+        self._items: Deque[List[Any]] = deque()
+        self._audio_refs: Deque[List[Any]] = deque()
+        self._audio_depth = 0
+        self._control_depth = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._overflowed = False
+
+        self.metrics = {
+            "sent": 0,
+            "dropped_audio": 0,
+            "flushed_audio": 0,
+            "coalesced": 0,
+            "send_errors": 0,
+            "overflow_disconnects": 0,
+            "max_audio_depth": 0,
+            "max_control_depth": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        """Whether the writer task accepts new items"""
+        return self._task is not None and not self._task.done() and not self._closing and not self._overflowed
+
+    def start(self) -> "OutboundPipeline":
+        """Start the writer task and register the pipeline for metrics"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            active_pipelines[self.name] = self
+        return self
+
+    def put(self, payload: Any, audio: bool = False) -> bool:
+        """
+        Queue a payload without waiting for the peer
+
+        Args:
+            payload: dict, str or bytes to send
+            audio: Whether the payload is audio (droppable when stale)
+
+        Returns:
+            bool: False if the pipeline no longer accepts items
+        """
+        if not self.running:
+            return False
+
+        if audio:
+            if self._audio_depth >= self.audio_maxsize:
+                self._drop_oldest_audio()
+            entry = [payload, True, True, time.monotonic() if self._on_sent else 0.0]
+            self._items.append(entry)
+            self._audio_refs.append(entry)
+            self._audio_depth += 1
+            if self._audio_depth > self.metrics["max_audio_depth"]:
+                self.metrics["max_audio_depth"] = self._audio_depth
+        else:
+            if self._coalesce(payload):
+                return True
+            if self._control_depth >= self.control_maxsize:
+                logger.warning(f"Send queue {self.name} overflowed ({self._control_depth} control items), disconnecting")
+                self.metrics["overflow_disconnects"] += 1
+                self._overflowed = True
+                self._wakeup.set()
+                return False
+            self._items.append([payload, False, True, time.monotonic() if self._on_sent else 0.0])
+            self._control_depth += 1
+            if self._control_depth > self.metrics["max_control_depth"]:
+                self.metrics["max_control_depth"] = self._control_depth
+
+        self._wakeup.set()
+        return True
+
+    def _drop_oldest_audio(self) -> None:
+        """Mark the oldest queued audio item as dropped"""
+        while self._audio_refs:
+            entry = self._audio_refs.popleft()
+            if entry[2]:
+                entry[2] = False
+                self._audio_depth -= 1
+                self.metrics["dropped_audio"] += 1
+                return
+
+    def drop_audio(self) -> List[Any]:
+        """
+        Remove every queued audio item, keeping control items in place
+
+        Returns:
+            List of the removed audio payloads, oldest first
+        """
+        dropped = []
+        while self._audio_refs:
+            entry = self._audio_refs.popleft()
+            if entry[2]:
+                entry[2] = False
+                dropped.append(entry[0])
+        self._audio_depth = 0
+        self.metrics["flushed_audio"] += len(dropped)
+        return dropped
+
+    def _coalesce(self, payload: Any) -> bool:
+        """
+        Merge a transcript delta into the last queued delta of the same item
+
+        Returns:
+            bool: True if the payload was merged
+        """
+        if self.control_policy != OVERFLOW_COALESCE or not self._items or not isinstance(payload, dict):
+            return False
+        if payload.get("type") not in COALESCABLE_DELTAS:
+            return False
+
+        tail = self._items[-1]
+        previous = tail[0]
+        if (not tail[2] or tail[1] or not isinstance(previous, dict)
+                or previous.get("type") != payload.get("type")
+                or previous.get("item_id") != payload.get("item_id")
+                or previous.get("response_id") != payload.get("response_id")
+                or previous.get("content_index") != payload.get("content_index")):
+            return False
+
+        previous["delta"] = (previous.get("delta") or "") + (payload.get("delta") or "")
+        self.metrics["coalesced"] += 1
+        return True
+
+    async def _run(self) -> None:
+        """Writer loop: sends queued items in order"""
+        try:
+            while True:
+                if self._overflowed:
+                    await self._handle_overflow()
+                    return
+
+                if not self._items:
+                    if self._closing:
+                        return
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                payload, is_audio, alive, enqueued_at = self._items.popleft()
+                if not alive:
+                    continue
+                if is_audio:
+                    self._audio_depth -= 1
+                    if self._audio_refs:
+                        self._audio_refs.popleft()
+                else:
+                    self._control_depth -= 1
+
+                try:
+                    await self._send(payload)
+                    self.metrics["sent"] += 1
+                    if self._on_sent:
+                        self._on_sent(is_audio, time.monotonic() - enqueued_at)
+                except Exception as e:
+                    self.metrics["send_errors"] += 1
+                    if self._on_error is None or not self._on_error(e):
+                        logger.info(f"Send queue {self.name} stopped: {e}")
+                        return
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._items.clear()
+            self._audio_refs.clear()
+            self._audio_depth = 0
+            self._control_depth = 0
+
+    async def _handle_overflow(self) -> None:
+        """Give up on a peer that cannot keep up"""
+        if self._on_overflow:
+            try:
+                await self._on_overflow()
+            except Exception as e:
+                logger.error(f"Error handling send queue overflow for {self.name}: {e}")
+
+    async def close(self, timeout: float = 1.0) -> None:
+        """
+        Stop accepting items, flush what is queued and stop the writer
+
+        Args:
+            timeout: Max seconds to wait for the queue to drain
+        """
+        self._closing = True
+        self._wakeup.set()
+        active_pipelines.pop(self.name, None)
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        except Exception as e:
+            logger.error(f"Error closing send queue {self.name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get current queue depth and counters
+
+        Returns:
+            Dict with depth and metrics of the pipeline
+        """
+        return {
+            "audio_depth": self._audio_depth,
+            "control_depth": self._control_depth,
+            "audio_maxsize": self.audio_maxsize,
+            "control_maxsize": self.control_maxsize,
+            **self.metrics
+        }
+
+
+def get_queue_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Get queue stats for every live pipeline of this worker
+
+    Returns:
+        Dict of pipeline name -> stats
+    """
+    return {name: pipeline.stats() for name, pipeline in list(active_pipelines.items())}
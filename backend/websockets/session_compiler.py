@@ -0,0 +1,182 @@
+"""
+Precompiled per-assistant realtime session artifacts.
+The session.update frame, tool list, webhook URL and Pinecone namespace are
+derived once per assistant version instead of on every connect.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_VOICE = "alloy"
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful voice assistant."
+
+# Параметры серверного VAD для всех сессий
+TURN_DETECTION = {
+    "type": "server_vad",
+    "threshold": 0.25,
+    "prefix_padding_ms": 200,
+    "silence_duration_ms": 300,
+    "create_response": True,
+}
+
+
+def build_tools(functions: Any) -> List[Dict[str, Any]]:
+    """
+    Build the tools list for session.update from assistant functions.
+
+    Args:
+        functions: List of functions or dictionary with enabled_functions key
+
+    Returns:
+        List: Tool definitions for the Realtime API
+    """
+    # Импорт здесь, чтобы избежать циклического импорта с openai_client
+    from backend.websockets.openai_client import normalize_functions
+
+    return [
+        {
+            "type": "function",
+            "name": func_def["name"],
+            "description": func_def["description"],
+            "parameters": func_def["parameters"]
+        }
+        for func_def in normalize_functions(functions)
+    ]
+
+
+def build_session_payload(voice: str, system_message: str, tools: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a session.update event
+
+    Args:
+        voice: Voice ID to use for speech synthesis
+        system_message: System instructions for the assistant
+        tools: Tool definitions
+
+    Returns:
+        session.update event dict
+    """
+    return {
+        "type": "session.update",
+        "session": {
+            "turn_detection": TURN_DETECTION,
+            "input_audio_format": "pcm16",
+            "output_audio_format": "pcm16",
+            "voice": voice,
+            "instructions": system_message,
+            "modalities": ["text", "audio"],
+            "temperature": 0.7,
+            "max_response_output_tokens": 500,
+            "tools": tools,
+            "tool_choice": "auto" if tools else "none",
+            # Включение транскрипции аудио в соответствии с документацией OpenAI
+            "input_audio_transcription": {"model": "whisper-1"}
+        }
+    }
+
+
+class CompiledSession:
+    """Ready-to-send session configuration of one assistant version"""
+
+    __slots__ = (
+        "voice", "tools", "tool_choice", "enabled_functions", "webhook_url",
+        "pinecone_namespace", "payload", "fingerprint",
+    )
+
+    def __init__(self, assistant_config: Any):
+        # Импорт здесь, чтобы избежать циклического импорта с openai_client
+        from backend.functions import normalize_function_name
+        from backend.functions.search_pinecone import extract_namespace_from_prompt
+        from backend.websockets.openai_client import extract_webhook_url_from_prompt
+
+        self.voice = getattr(assistant_config, "voice", None) or DEFAULT_VOICE
+        system_message = getattr(assistant_config, "system_prompt", None) or DEFAULT_SYSTEM_MESSAGE
+        functions = getattr(assistant_config, "functions", None)
+
+        self.tools = build_tools(functions)
+        self.tool_choice = "auto" if self.tools else "none"
+        self.enabled_functions = [normalize_function_name(tool["name"]) for tool in self.tools]
+
+        # URL вебхука ищем только если send_webhook включена в настройках ассистента
+        configured = []
+        if isinstance(functions, list):
+            configured = [normalize_function_name(f.get("name")) for f in functions if f.get("name")]
+        elif isinstance(functions, dict) and "enabled_functions" in functions:
+            configured = [normalize_function_name(name) for name in functions.get("enabled_functions", [])]
+        self.webhook_url = extract_webhook_url_from_prompt(system_message) if "send_webhook" in configured else None
+        self.pinecone_namespace = extract_namespace_from_prompt(getattr(assistant_config, "system_prompt", None))
+
+        # Текстовый кадр целиком: websockets кодирует str в UTF-8 без повторной сериализации
+        self.payload = json.dumps(build_session_payload(self.voice, system_message, self.tools), ensure_ascii=False)
+        self.fingerprint = hashlib.sha1(self.payload.encode("utf-8")).hexdigest()
+
+
+# Скомпилированные сессии по (assistant_id, updated_at); заполняются и из потоков исполнителя БД
+_compiled: "OrderedDict[Hashable, CompiledSession]" = OrderedDict()
+_latest: Dict[str, Hashable] = {}
+_lock = threading.Lock()
+_metrics = {"hits": 0, "compiles": 0}
+
+
+def _version_key(assistant_config: Any) -> Optional[Tuple[str, Any]]:
+    assistant_id = getattr(assistant_config, "id", None)
+    updated_at = getattr(assistant_config, "updated_at", None)
+    if assistant_id is None or updated_at is None:
+        return None
+    return str(assistant_id), updated_at
+
+
+def get_compiled_session(assistant_config: Any) -> CompiledSession:
+    """
+    Get the compiled session of an assistant, compiling it when the row changed
+
+    Args:
+        assistant_config: AssistantConfig or a compatible object
+
+    Returns:
+        CompiledSession for the assistant's current version
+    """
+    key = _version_key(assistant_config)
+    if key is not None:
+        with _lock:
+            compiled = _compiled.get(key)
+            if compiled is not None:
+                _compiled.move_to_end(key)
+                _metrics["hits"] += 1
+                return compiled
+
+    compiled = CompiledSession(assistant_config)
+    _metrics["compiles"] += 1
+    if key is not None:
+        with _lock:
+            # Предыдущая версия ассистента больше не понадобится
+            previous = _latest.get(key[0])
+            if previous is not None and previous != key:
+                _compiled.pop(previous, None)
+            _latest[key[0]] = key
+            _compiled[key] = compiled
+            _compiled.move_to_end(key)
+            while len(_compiled) > settings.ASSISTANT_CACHE_MAX_SIZE:
+                evicted, _ = _compiled.popitem(last=False)
+                if _latest.get(evicted[0]) == evicted:
+                    del _latest[evicted[0]]
+        logger.info(f"Compiled realtime session for assistant {key[0]} ({len(compiled.payload)} chars, {len(compiled.tools)} tools)")
+    return compiled
+
+
+def compiled_session_stats() -> Dict[str, Any]:
+    """
+    Get compiled session cache size and counters
+
+    Returns:
+        Dict with cache metrics
+    """
+    return {"size": len(_compiled), **_metrics}
@@ -0,0 +1,274 @@
+"""
+Pool of pre-warmed OpenAI Realtime sessions.
+Keeps authenticated, already configured sessions for hot assistants,
+so a new caller skips the TLS handshake and session.update round trip.
+"""
+
+import asyncio
+import hashlib
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, Optional, Set
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.websockets.session_compiler import get_compiled_session
+
+logger = get_logger(__name__)
+
+
+def api_key_id(api_key: str) -> str:
+    """
+    Short non-reversible identifier of an API key for metrics and logs
+
+    Args:
+        api_key: OpenAI API key
+
+    Returns:
+        First 12 hex chars of the key's SHA-256
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def snapshot_assistant_config(assistant_config: Any) -> SimpleNamespace:
+    """
+    Copy the fields needed to configure a session, detached from the DB session
+
+    Args:
+        assistant_config: AssistantConfig or a compatible object
+
+    Returns:
+        Plain object with id, voice, system_prompt, functions and updated_at
+    """
+    return SimpleNamespace(
+        id=getattr(assistant_config, "id", None),
+        updated_at=getattr(assistant_config, "updated_at", None),
+        voice=getattr(assistant_config, "voice", None),
+        system_prompt=getattr(assistant_config, "system_prompt", None),
+        functions=getattr(assistant_config, "functions", None),
+    )
+
+
+def session_fingerprint(assistant_config: Any) -> str:
+    """
+    Hash of everything that goes into session.update for an assistant
+
+    Args:
+        assistant_config: AssistantConfig or a compatible object
+
+    Returns:
+        Hex digest identifying the session configuration
+    """
+    # Хэш считается один раз при компиляции сессии, а не на каждый звонок
+    return get_compiled_session(assistant_config).fingerprint
+
+
+class PooledSession:
+    """Idle configured realtime WebSocket waiting for a caller"""
+
+    __slots__ = ("ws", "created_at", "key_id")
+
+    def __init__(self, ws: Any, key_id: str):
+        self.ws = ws
+        self.created_at = time.monotonic()
+        self.key_id = key_id
+
+
+class RealtimeSessionPool:
+    """
+    Warm pool of realtime sessions keyed by API key and assistant configuration.
+
+    Sessions are single use: a caller takes one and the pool warms a
+    replacement in the background. Idle sessions expire after the TTL,
+    and the number of idle or warming sessions per API key is capped.
+    """
+
+    def __init__(self, ttl: int = None, max_per_key: int = None, size_per_assistant: int = None):
+        """
+        Initialize the pool
+
+        Args:
+            ttl: Idle session lifetime in seconds (default: settings.REALTIME_POOL_TTL_SECONDS)
+            max_per_key: Max idle and warming sessions per API key (default: settings.REALTIME_POOL_MAX_PER_KEY)
+            size_per_assistant: Idle sessions kept per assistant (default: settings.REALTIME_POOL_SIZE_PER_ASSISTANT)
+        """
+        self.ttl = ttl or settings.REALTIME_POOL_TTL_SECONDS
+        self.max_per_key = max_per_key or settings.REALTIME_POOL_MAX_PER_KEY
+        self.size_per_assistant = size_per_assistant or settings.REALTIME_POOL_SIZE_PER_ASSISTANT
+        self._idle: Dict[str, Deque[PooledSession]] = {}
+        self._per_key: Dict[str, int] = {}
+        self._warming: Set[str] = set()
+        self._reaper: Optional[asyncio.Task] = None
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "warmed": 0,
+            "warm_failures": 0,
+            "evicted": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        """Whether pooling is switched on in settings"""
+        return settings.REALTIME_POOL_ENABLED
+
+    def _pool_key(self, key_id: str, assistant_config: Any) -> str:
+        return f"{key_id}:{session_fingerprint(assistant_config)}"
+
+    async def acquire(self, api_key: str, assistant_config: Any) -> Optional[Any]:
+        """
+        Take a ready session for the assistant, if one is pooled
+
+        Args:
+            api_key: OpenAI API key of the assistant owner
+            assistant_config: Assistant configuration
+
+        Returns:
+            Connected WebSocket with session.update already applied, or None
+        """
+        if not self.enabled or not api_key:
+            return None
+
+        self._ensure_reaper()
+        key_id = api_key_id(api_key)
+        pool_key = self._pool_key(key_id, assistant_config)
+
+        ws = None
+        sessions = self._idle.get(pool_key)
+        while sessions:
+            session = sessions.popleft()
+            self._release_slot(key_id)
+            if self._is_expired(session) or not getattr(session.ws, "open", False):
+                self._evict(session)
+                continue
+            ws = session.ws
+            break
+
+        if ws is not None:
+            self.metrics["hits"] += 1
+            logger.info(f"Realtime session pool hit for key {key_id}")
+        else:
+            self.metrics["misses"] += 1
+
+        # Ассистент «горячий» — готовим сессию для следующего звонка
+        self._schedule_warm(pool_key, key_id, api_key, snapshot_assistant_config(assistant_config))
+        return ws
+
+    def _schedule_warm(self, pool_key: str, key_id: str, api_key: str, config: SimpleNamespace) -> None:
+        if pool_key in self._warming:
+            return
+        if len(self._idle.get(pool_key, ())) >= self.size_per_assistant:
+            return
+        if self._per_key.get(key_id, 0) >= self.max_per_key:
+            return
+
+        # Резервируем слот заранее, чтобы не превысить лимит параллельными прогревами
+        self._per_key[key_id] = self._per_key.get(key_id, 0) + 1
+        self._warming.add(pool_key)
+        asyncio.create_task(self._warm(pool_key, key_id, api_key, config))
+
+    async def _warm(self, pool_key: str, key_id: str, api_key: str, config: SimpleNamespace) -> None:
+        # Импорт здесь, чтобы избежать циклического импорта с openai_client
+        from backend.websockets.openai_client import OpenAIRealtimeClient
+
+        try:
+            client = OpenAIRealtimeClient(api_key, config, f"pool-{uuid.uuid4().hex[:8]}")
+            if await client.connect(use_pool=False):
+                self._idle.setdefault(pool_key, deque()).append(PooledSession(client.ws, key_id))
+                self.metrics["warmed"] += 1
+                return
+            self.metrics["warm_failures"] += 1
+        except Exception as e:
+            self.metrics["warm_failures"] += 1
+            logger.error(f"Error warming realtime session: {e}")
+        finally:
+            self._warming.discard(pool_key)
+        self._release_slot(key_id)
+
+    def _release_slot(self, key_id: str) -> None:
+        count = self._per_key.get(key_id, 0) - 1
+        if count > 0:
+            self._per_key[key_id] = count
+        else:
+            self._per_key.pop(key_id, None)
+
+    def _is_expired(self, session: PooledSession) -> bool:
+        return time.monotonic() - session.created_at >= self.ttl
+
+    def _evict(self, session: PooledSession) -> None:
+        self.metrics["evicted"] += 1
+        asyncio.create_task(self._close_ws(session.ws))
+
+    @staticmethod
+    async def _close_ws(ws: Any) -> None:
+        try:
+            await ws.close()
+        except Exception:
+            pass
+
+    def evict_expired(self) -> int:
+        """
+        Close idle sessions that outlived the TTL
+
+        Returns:
+            Number of evicted sessions
+        """
+        evicted = 0
+        for pool_key, sessions in list(self._idle.items()):
+            while sessions and (self._is_expired(sessions[0]) or not getattr(sessions[0].ws, "open", False)):
+                session = sessions.popleft()
+                self._release_slot(session.key_id)
+                self._evict(session)
+                evicted += 1
+            if not sessions:
+                self._idle.pop(pool_key, None)
+        return evicted
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self) -> None:
+        interval = max(1, self.ttl // 4)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                evicted = self.evict_expired()
+                if evicted:
+                    logger.info(f"Evicted {evicted} expired realtime sessions from pool")
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pool size and hit/miss counters
+
+        Returns:
+            Dict with pool metrics
+        """
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            "enabled": self.enabled,
+            "idle": sum(len(sessions) for sessions in self._idle.values()),
+            "warming": len(self._warming),
+            "per_key": dict(self._per_key),
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0,
+            **self.metrics
+        }
+
+    async def close(self) -> None:
+        """Close every pooled session and stop the reaper"""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        for sessions in self._idle.values():
+            for session in sessions:
+                await self._close_ws(session.ws)
+        self._idle.clear()
+        self._per_key.clear()
+
+
+# Пул на процесс
+session_pool = RealtimeSessionPool()
@@ -0,0 +1,389 @@
+"""
+Registry of live realtime calls.
+Tracks calls per assistant and per user, enforces concurrent-call limits
+of the subscription plan and reports occupancy, either in process or
+through a store shared by all workers.
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+from backend.db.executor import run_in_session
+
+logger = get_logger(__name__)
+
+# Идентификатор воркера: чьи аренды обновлять и чьи звонки считать локальными
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_call_limit(db: Session, user: Any) -> int:
+    """
+    Concurrent-call limit of a user by subscription plan (0 means unlimited)
+
+    Args:
+        db: Database session
+        user: User owning the assistant
+
+    Returns:
+        Max simultaneous calls across all of the user's assistants
+    """
+    from backend.models.subscription import SubscriptionPlan
+
+    if user is None:
+        return settings.CONCURRENT_CALLS_FREE
+    if user.is_admin:
+        return settings.CONCURRENT_CALLS_ADMIN
+
+    end_date = user.subscription_end_date
+    if end_date and end_date.tzinfo is None:
+        end_date = end_date.replace(tzinfo=timezone.utc)
+    has_active_subscription = (
+        user.subscription_plan_id is not None and
+        end_date is not None and
+        end_date > datetime.now(timezone.utc)
+    )
+    if has_active_subscription:
+        plan = db.query(SubscriptionPlan).get(user.subscription_plan_id)
+        if plan and plan.code != "free":
+            return settings.CONCURRENT_CALLS_PAID
+    return settings.CONCURRENT_CALLS_FREE
+
+
+class CallInfo:
+    """Live call as seen by the registry"""
+
+    __slots__ = ("call_id", "assistant_id", "user_id", "started_at")
+
+    def __init__(self, call_id: str, assistant_id: Optional[str], user_id: Optional[str]):
+        self.call_id = call_id
+        self.assistant_id = assistant_id
+        self.user_id = user_id
+        self.started_at = time.time()
+
+
+class InMemoryRegistryBackend:
+    """Registry backend for a single worker; also the local stand-in for shared stores"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._calls: Dict[str, CallInfo] = {}
+        self._by_assistant: Dict[str, Set[str]] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+
+    async def acquire(self, call: CallInfo, limit: int) -> bool:
+        """
+        Register a call unless the user is at the limit
+
+        Args:
+            call: Call to register
+            limit: Max concurrent calls of the user (0 - unlimited)
+
+        Returns:
+            bool: True if the call was registered
+        """
+        if limit and call.user_id and len(self._by_user.get(call.user_id, ())) >= limit:
+            return False
+        self._calls[call.call_id] = call
+        if call.assistant_id:
+            self._by_assistant.setdefault(call.assistant_id, set()).add(call.call_id)
+        if call.user_id:
+            self._by_user.setdefault(call.user_id, set()).add(call.call_id)
+        return True
+
+    async def release(self, call_id: str) -> None:
+        """
+        Remove a call
+
+        Args:
+            call_id: Call ID
+        """
+        call = self._calls.pop(call_id, None)
+        if call is None:
+            return
+        for index, key in ((self._by_assistant, call.assistant_id), (self._by_user, call.user_id)):
+            calls = index.get(key)
+            if calls is not None:
+                calls.discard(call_id)
+                if not calls:
+                    del index[key]
+
+    async def heartbeat(self, call_ids: List[str]) -> None:
+        """Renew leases of local calls (nothing to renew in process)"""
+
+    async def counts(self) -> Dict[str, Any]:
+        """
+        Get live call counts
+
+        Returns:
+            Dict with total and per assistant / per user counts
+        """
+        return {
+            "total": len(self._calls),
+            "assistants": {key: len(calls) for key, calls in self._by_assistant.items()},
+            "users": {key: len(calls) for key, calls in self._by_user.items()},
+        }
+
+    async def close(self) -> None:
+        """Release backend resources"""
+
+
+def _as_uuid(value: Optional[str]) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(value) if value else None
+    except ValueError:
+        return None
+
+
+def _pg_acquire(db: Session, call: CallInfo, limit: int, ttl: int) -> bool:
+    from sqlalchemy import func, text
+    from backend.models.active_call import ActiveCall
+
+    if limit and call.user_id:
+        # Сериализуем проверку лимита одного пользователя между всеми воркерами
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"calls:{call.user_id}"})
+        active = db.query(func.count(ActiveCall.call_id)).filter(
+            ActiveCall.user_id == _as_uuid(call.user_id),
+            ActiveCall.heartbeat_at > func.now() - timedelta(seconds=ttl)
+        ).scalar()
+        if active >= limit:
+            db.rollback()
+            return False
+
+    db.add(ActiveCall(
+        call_id=call.call_id,
+        assistant_id=_as_uuid(call.assistant_id),
+        user_id=_as_uuid(call.user_id),
+        worker_id=WORKER_ID
+    ))
+    db.commit()
+    return True
+
+
+def _pg_release(db: Session, call_id: str) -> None:
+    from backend.models.active_call import ActiveCall
+
+    db.query(ActiveCall).filter(ActiveCall.call_id == call_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def _pg_heartbeat(db: Session, call_ids: List[str], ttl: int) -> None:
+    from sqlalchemy import func
+    from backend.models.active_call import ActiveCall
+
+    if call_ids:
+        db.query(ActiveCall).filter(ActiveCall.call_id.in_(call_ids)).update(
+            {ActiveCall.heartbeat_at: func.now()}, synchronize_session=False
+        )
+    # Аренды упавших воркеров истекают сами; здесь только подчищаем таблицу
+    db.query(ActiveCall).filter(
+        ActiveCall.heartbeat_at < func.now() - timedelta(seconds=ttl * 2)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def _pg_counts(db: Session, ttl: int) -> Dict[str, Any]:
+    from sqlalchemy import func
+    from backend.models.active_call import ActiveCall
+
+    rows = db.query(ActiveCall.assistant_id, ActiveCall.user_id, func.count(ActiveCall.call_id)).filter(
+        ActiveCall.heartbeat_at > func.now() - timedelta(seconds=ttl)
+    ).group_by(ActiveCall.assistant_id, ActiveCall.user_id).all()
+
+    counts = {"total": 0, "assistants": {}, "users": {}}
+    for assistant_id, user_id, count in rows:
+        counts["total"] += count
+        if assistant_id:
+            key = str(assistant_id)
+            counts["assistants"][key] = counts["assistants"].get(key, 0) + count
+        if user_id:
+            key = str(user_id)
+            counts["users"][key] = counts["users"].get(key, 0) + count
+    return counts
+
+
+class PostgresRegistryBackend(InMemoryRegistryBackend):
+    """
+    Registry backend shared by all workers and nodes through the active_calls table.
+    Each row is a lease: calls of a worker that died stop counting after the TTL.
+    """
+
+    name = "postgres"
+
+    def __init__(self, ttl: int = None):
+        super().__init__()
+        self.ttl = ttl or settings.SESSION_REGISTRY_TTL_SECONDS
+
+    async def acquire(self, call: CallInfo, limit: int) -> bool:
+        return await run_in_session(_pg_acquire, call, limit, self.ttl)
+
+    async def release(self, call_id: str) -> None:
+        await run_in_session(_pg_release, call_id)
+
+    async def heartbeat(self, call_ids: List[str]) -> None:
+        await run_in_session(_pg_heartbeat, call_ids, self.ttl)
+
+    async def counts(self) -> Dict[str, Any]:
+        return await run_in_session(_pg_counts, self.ttl)
+
+
+def create_registry_backend(kind: str = None) -> InMemoryRegistryBackend:
+    """
+    Create the registry backend selected in settings
+
+    Args:
+        kind: "memory" or "postgres" (default: settings.SESSION_REGISTRY_BACKEND)
+
+    Returns:
+        Registry backend instance
+    """
+    kind = kind or settings.SESSION_REGISTRY_BACKEND
+    if kind == "postgres":
+        return PostgresRegistryBackend()
+    if kind != "memory":
+        logger.warning(f"Unknown session registry backend '{kind}', using memory")
+    return InMemoryRegistryBackend()
+
+
+class SessionRegistry:
+    """
+    Live call registry with per-user concurrent-call limits.
+
+    Local calls are also tracked in process, so this worker's occupancy is
+    known without a round trip and shared leases can be renewed. If the
+    backend is unavailable calls are admitted (fail open) rather than dropped.
+    """
+
+    def __init__(self, backend: InMemoryRegistryBackend = None):
+        """
+        Initialize the registry
+
+        Args:
+            backend: Registry backend (default: created from settings)
+        """
+        self.backend = backend or create_registry_backend()
+        self._local: Dict[str, CallInfo] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "admitted": 0,
+            "rejected": 0,
+            "backend_errors": 0,
+        }
+
+    @property
+    def local_calls(self) -> int:
+        """Number of calls served by this worker"""
+        return len(self._local)
+
+    async def acquire(self, call_id: str, assistant_id: Any, user_id: Any, limit: int = 0) -> bool:
+        """
+        Register a call if the owner has a free call slot
+
+        Args:
+            call_id: Unique call ID (client_id of the WebSocket)
+            assistant_id: Assistant ID
+            user_id: ID of the assistant owner
+            limit: Max concurrent calls of the owner (0 - unlimited)
+
+        Returns:
+            bool: True if the call may proceed
+        """
+        call = CallInfo(
+            call_id,
+            str(assistant_id) if assistant_id else None,
+            str(user_id) if user_id else None
+        )
+        try:
+            admitted = await self.backend.acquire(call, limit)
+        except Exception as e:
+            self.metrics["backend_errors"] += 1
+            logger.error(f"Session registry unavailable, admitting call {call_id}: {e}")
+            admitted = True
+
+        if not admitted:
+            self.metrics["rejected"] += 1
+            logger.info(f"Concurrent call limit {limit} reached for user {call.user_id}, rejecting call {call_id}")
+            return False
+
+        self.metrics["admitted"] += 1
+        self._local[call_id] = call
+        self._ensure_heartbeat()
+        return True
+
+    async def release(self, call_id: str) -> None:
+        """
+        Remove a finished call
+
+        Args:
+            call_id: Call ID
+        """
+        if self._local.pop(call_id, None) is None:
+            return
+        try:
+            await self.backend.release(call_id)
+        except Exception as e:
+            self.metrics["backend_errors"] += 1
+            logger.error(f"Error releasing call {call_id} in session registry: {e}")
+
+    async def counts(self) -> Dict[str, Any]:
+        """
+        Get live call counts across the fleet (or this worker for the memory backend)
+
+        Returns:
+            Dict with total, per assistant and per user counts
+        """
+        counts = await self.backend.counts()
+        counts["backend"] = self.backend.name
+        counts["worker_id"] = WORKER_ID
+        counts["local_calls"] = self.local_calls
+        return counts
+
+    def _ensure_heartbeat(self) -> None:
+        if self.backend.name == "memory":
+            return
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self) -> None:
+        interval = max(1, settings.SESSION_REGISTRY_TTL_SECONDS // 3)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.backend.heartbeat(list(self._local))
+                except Exception as e:
+                    self.metrics["backend_errors"] += 1
+                    logger.error(f"Error renewing call leases: {e}")
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self) -> None:
+        """Release every local call and stop the heartbeat"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for call_id in list(self._local):
+            await self.release(call_id)
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get registry counters of this worker
+
+        Returns:
+            Dict with registry metrics
+        """
+        return {"backend": self.backend.name, "local_calls": self.local_calls, **self.metrics}
+
+
+# Реестр на процесс
+session_registry = SessionRegistry()
@@ -0,0 +1,111 @@
+"""
+Session resumption for the realtime voice pipeline.
+Keeps the text of finished turns so that a new OpenAI session opened after a
+network failure can be seeded with the conversation so far.
+"""
+
+import json
+import random
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from backend.core.config import settings
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Префикс event_id событий, которыми восстанавливается контекст новой сессии
+RESUME_EVENT_PREFIX = "resume_"
+
+# Роли реплик в истории
+ROLE_USER = "user"
+ROLE_ASSISTANT = "assistant"
+
+
+def reconnect_delays(
+    attempts: Optional[int] = None,
+    base_ms: Optional[int] = None,
+    max_ms: Optional[int] = None
+) -> Iterator[float]:
+    """
+    Delays before reconnect attempts: the first attempt is immediate, the next
+    ones use exponential backoff with full jitter, capped at max_ms
+
+    Args:
+        attempts: Number of attempts (default: settings.MAX_RECONNECT_ATTEMPTS)
+        base_ms: Backoff base (default: settings.REALTIME_RECONNECT_BASE_MS)
+        max_ms: Backoff cap (default: settings.REALTIME_RECONNECT_MAX_MS)
+
+    Yields:
+        Delay in seconds before each attempt
+    """
+    attempts = attempts or settings.MAX_RECONNECT_ATTEMPTS
+    base_ms = base_ms or settings.REALTIME_RECONNECT_BASE_MS
+    max_ms = max_ms or settings.REALTIME_RECONNECT_MAX_MS
+    for attempt in range(attempts):
+        if attempt == 0:
+            # Короткий сбой сети: пробуем сразу
+            yield 0.0
+        else:
+            yield random.uniform(0, min(max_ms, base_ms * 2 ** (attempt - 1))) / 1000
+
+
+class ConversationHistory:
+    """
+    Text of the finished turns of a call, newest last.
+
+    Only text is kept: the model gets the transcript of what was said, not
+    the audio, which is enough to continue the conversation where it stopped.
+    """
+
+    def __init__(self, max_items: Optional[int] = None, max_chars: Optional[int] = None):
+        """
+        Initialize the history
+
+        Args:
+            max_items: Messages kept for replay (default: settings.REALTIME_RESUME_MAX_ITEMS)
+            max_chars: Length limit of one message (default: settings.REALTIME_RESUME_MAX_CHARS)
+        """
+        self.max_chars = max_chars or settings.REALTIME_RESUME_MAX_CHARS
+        self._items: Deque[Tuple[str, str]] = deque(maxlen=max_items or settings.REALTIME_RESUME_MAX_ITEMS)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add_turn(self, user_text: str, assistant_text: str) -> None:
+        """
+        Remember a finished turn
+
+        Args:
+            user_text: What the caller said
+            assistant_text: What the assistant answered
+        """
+        if user_text:
+            self._items.append((ROLE_USER, user_text[:self.max_chars]))
+        if assistant_text:
+            self._items.append((ROLE_ASSISTANT, assistant_text[:self.max_chars]))
+
+    def replay_events(self) -> List[str]:
+        """
+        Build conversation.item.create events that restore the history in a new session;
+        items without previous_item_id are appended, so the order is kept
+
+        Returns:
+            Serialized events, oldest message first
+        """
+        events = []
+        for index, (role, text) in enumerate(self._items):
+            # Ассистент в истории — текстовый ответ, собеседник — введённый текст
+            content_type = "text" if role == ROLE_ASSISTANT else "input_text"
+            event: Dict[str, Any] = {
+                "type": "conversation.item.create",
+                "event_id": f"{RESUME_EVENT_PREFIX}item_{index}",
+                "item": {
+                    "id": f"{RESUME_EVENT_PREFIX}{index}",
+                    "type": "message",
+                    "role": role,
+                    "content": [{"type": content_type, "text": text}]
+                }
+            }
+            events.append(json.dumps(event, ensure_ascii=False))
+        return events
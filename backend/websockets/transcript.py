@@ -0,0 +1,264 @@
+"""
+Per-call transcript accumulation for the realtime voice pipeline.
+Transcript deltas are appended as fragments and joined once per turn;
+finished turns are handed over in order for persistence.
+"""
+
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from backend.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Сколько незавершённых реплик ждут поздней транскрипции, пока не закроем старые
+_MAX_OPEN_TURNS = 2
+
+# Сколько ID закрытых реплик помним, чтобы не открывать их заново по запоздавшим событиям
+_CLOSED_HISTORY = 16
+
+
+class TranscriptTurn:
+    """
+    One exchange: what the caller said and everything the assistant answered,
+    including responses generated after function calls.
+    """
+
+    __slots__ = (
+        "index", "user_item_id", "started_at", "_started_monotonic", "duration",
+        "_user", "_assistant", "user_done", "response_done", "function_result",
+    )
+
+    def __init__(self, index: int, user_item_id: Optional[str] = None):
+        self.index = index
+        self.user_item_id = user_item_id
+        self.started_at = datetime.now(timezone.utc)
+        self._started_monotonic = time.monotonic()
+        self.duration: Optional[float] = None
+        self._user: List[str] = []
+        # Фрагменты ассистента по ответам: после вызова функции в реплике бывает несколько ответов
+        self._assistant: "OrderedDict[str, List[str]]" = OrderedDict()
+        # Реплика без аудио собеседника (например, приветствие) не ждёт транскрипции
+        self.user_done = user_item_id is None
+        self.response_done = False
+        self.function_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def user_text(self) -> str:
+        """Caller's transcript of the turn"""
+        return "".join(self._user).strip()
+
+    @property
+    def assistant_text(self) -> str:
+        """Assistant's transcript of the turn"""
+        return " ".join(filter(None, ("".join(parts).strip() for parts in self._assistant.values())))
+
+    @property
+    def finished(self) -> bool:
+        """Whether both sides of the turn are final"""
+        return self.user_done and self.response_done
+
+    def close(self) -> None:
+        """Fix the duration of the turn"""
+        if self.duration is None:
+            self.duration = round(time.monotonic() - self._started_monotonic, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the turn as a dict
+
+        Returns:
+            Dict with index, user and assistant messages, start time and duration
+        """
+        return {
+            "index": self.index,
+            "user_message": self.user_text,
+            "assistant_message": self.assistant_text,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration,
+        }
+
+
+class TranscriptBuffer:
+    """
+    Transcript of one call, split into turns.
+
+    A turn starts when the caller's audio is committed (or with the first
+    assistant output if nothing was said) and finishes once the user
+    transcription and a non-function-call response are both complete.
+    Finished turns are returned from the event methods exactly once.
+    """
+
+    def __init__(self):
+        self.turns_started = 0
+        self.turns_finished = 0
+        self._open: "OrderedDict[int, TranscriptTurn]" = OrderedDict()
+        self._by_item: Dict[str, TranscriptTurn] = {}
+        self._by_response: Dict[str, TranscriptTurn] = {}
+        self._closed_items: Deque[str] = deque(maxlen=_CLOSED_HISTORY)
+        self._current: Optional[TranscriptTurn] = None
+
+    @property
+    def current(self) -> Optional[TranscriptTurn]:
+        """The latest started turn, if it is still open"""
+        return self._current
+
+    def start_turn(self, user_item_id: Optional[str] = None) -> List[TranscriptTurn]:
+        """
+        Start a turn for a committed user audio item
+
+        Args:
+            user_item_id: ID of the user's conversation item
+
+        Returns:
+            Older turns closed because too many were waiting
+        """
+        if user_item_id and (user_item_id in self._by_item or user_item_id in self._closed_items):
+            return []
+        self.turns_started += 1
+        turn = TranscriptTurn(self.turns_started, user_item_id)
+        self._open[turn.index] = turn
+        if user_item_id:
+            self._by_item[user_item_id] = turn
+        self._current = turn
+
+        # Поздняя транскрипция ждётся только у последних реплик
+        waiting = [t for t in self._open.values() if t is not turn]
+        return self._finish(waiting[:max(0, len(waiting) - (_MAX_OPEN_TURNS - 1))])
+
+    def _user_turn(self, item_id: Optional[str]) -> Optional[TranscriptTurn]:
+        if not item_id:
+            return self._current
+        if item_id in self._closed_items:
+            return None
+        if item_id not in self._by_item:
+            self.start_turn(item_id)
+        return self._by_item.get(item_id)
+
+    def add_user_delta(self, item_id: Optional[str], delta: str) -> None:
+        """
+        Append a fragment of the caller's transcript
+
+        Args:
+            item_id: ID of the user's conversation item
+            delta: Transcript fragment
+        """
+        turn = self._user_turn(item_id)
+        if turn is not None and delta:
+            turn._user.append(delta)
+
+    def set_user_transcript(self, item_id: Optional[str], transcript: Optional[str]) -> List[TranscriptTurn]:
+        """
+        Replace the caller's fragments with the final transcript
+
+        Args:
+            item_id: ID of the user's conversation item
+            transcript: Final transcript, None if transcription failed
+
+        Returns:
+            Turns finished by this event
+        """
+        turn = self._user_turn(item_id)
+        if turn is None:
+            return []
+        if transcript:
+            turn._user = [transcript]
+        turn.user_done = True
+        return self._finish([turn] if turn.finished else [])
+
+    def _assistant_turn(self, response_id: Optional[str] = None) -> TranscriptTurn:
+        turn = self._by_response.get(response_id) if response_id else None
+        if turn is not None:
+            return turn
+        if self._current is None:
+            self.start_turn()
+        turn = self._current
+        if response_id:
+            self._by_response[response_id] = turn
+        return turn
+
+    def on_response_created(self, response_id: Optional[str]) -> None:
+        """
+        Bind a new response to the current turn, so a response interrupted by
+        the next turn still finishes its own one
+
+        Args:
+            response_id: ID of the response
+        """
+        self._assistant_turn(response_id)
+
+    def add_assistant_delta(self, response_id: Optional[str], delta: str) -> None:
+        """
+        Append a fragment of the assistant's transcript
+
+        Args:
+            response_id: ID of the response
+            delta: Transcript fragment
+        """
+        if delta:
+            self._assistant_turn(response_id)._assistant.setdefault(response_id or "", []).append(delta)
+
+    def set_assistant_transcript(self, response_id: Optional[str], transcript: str) -> None:
+        """
+        Replace the fragments of one response with its final transcript
+
+        Args:
+            response_id: ID of the response
+            transcript: Final transcript of the response's audio
+        """
+        if transcript:
+            self._assistant_turn(response_id)._assistant[response_id or ""] = [transcript]
+
+    def note_function_result(self, result: Dict[str, Any]) -> None:
+        """
+        Attach a function result to the current turn
+
+        Args:
+            result: Result returned by the function
+        """
+        self._assistant_turn().function_result = result
+
+    def on_response_done(self, response: Dict[str, Any]) -> List[TranscriptTurn]:
+        """
+        Handle response.done: a response that only calls functions keeps the turn open
+
+        Args:
+            response: The "response" object of the event
+
+        Returns:
+            Turns finished by this event
+        """
+        response_id = response.get("id")
+        turn = self._by_response.pop(response_id, None) if response_id else None
+        if turn is None:
+            turn = self._current
+        if turn is None or turn.index not in self._open:
+            return []
+        if any(item.get("type") == "function_call" for item in response.get("output") or []):
+            return []
+        turn.response_done = True
+        return self._finish([turn] if turn.finished else [])
+
+    def finish_all(self) -> List[TranscriptTurn]:
+        """
+        Close every open turn (the call has ended)
+
+        Returns:
+            Turns that have any text, in order
+        """
+        self._by_response.clear()
+        return [turn for turn in self._finish(list(self._open.values())) if turn.user_text or turn.assistant_text]
+
+    def _finish(self, turns: List[TranscriptTurn]) -> List[TranscriptTurn]:
+        for turn in turns:
+            turn.close()
+            self._open.pop(turn.index, None)
+            if turn.user_item_id:
+                self._by_item.pop(turn.user_item_id, None)
+                self._closed_items.append(turn.user_item_id)
+            if turn is self._current:
+                self._current = None
+            self.turns_finished += 1
+        return turns
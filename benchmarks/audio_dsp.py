@@ -0,0 +1,116 @@
+"""
+Micro-benchmarks for the PCM16 helpers in backend.utils.audio_utils.
+
+Each operation runs on 20 ms (one realtime frame), 1 s and 60 s buffers of
+24 kHz mono audio. The previous allocating implementations run next to the
+reusable-buffer versions for comparison.
+
+Usage:
+    python -m benchmarks.audio_dsp --repeat 200
+"""
+
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from backend.utils.audio_utils import (  # noqa: E402
+    WorkBuffers,
+    apply_gain,
+    create_wav_from_pcm,
+    float32_to_int16,
+    int16_to_float32,
+    measure_levels,
+    pcm16_view,
+)
+
+SAMPLE_RATE = 24000
+DURATIONS = (("20ms", 0.02), ("1s", 1.0), ("60s", 60.0))
+
+
+def legacy_create_wav(pcm_data: bytes) -> bytes:
+    """Header built with extend() calls, then concatenated with the payload"""
+    header = bytearray()
+    header.extend(b"RIFF")
+    header.extend(struct.pack("<I", 36 + len(pcm_data)))
+    header.extend(b"WAVE")
+    header.extend(b"fmt ")
+    header.extend(struct.pack("<I", 16))
+    header.extend(struct.pack("<H", 1))
+    header.extend(struct.pack("<H", 1))
+    header.extend(struct.pack("<I", SAMPLE_RATE))
+    header.extend(struct.pack("<I", SAMPLE_RATE * 2))
+    header.extend(struct.pack("<H", 2))
+    header.extend(struct.pack("<H", 16))
+    header.extend(b"data")
+    header.extend(struct.pack("<I", len(pcm_data)))
+    return header + pcm_data
+
+
+def legacy_float32_to_int16(samples: np.ndarray) -> np.ndarray:
+    return (np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+def legacy_int16_to_float32(samples: np.ndarray) -> np.ndarray:
+    return np.asarray(samples, dtype=np.int16).astype(np.float32) / 32767.0
+
+
+def legacy_levels(pcm: bytes) -> tuple:
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float64)
+    return np.sqrt(np.mean(samples ** 2)), np.max(np.abs(samples)), np.sum(np.abs(samples) >= 32767)
+
+
+def timeit(func, repeat: int) -> float:
+    """Best-of-three mean time per call in microseconds"""
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, (time.perf_counter() - started) / repeat)
+    return best * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="calls per measurement (divided for 60 s buffers)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for label, seconds in DURATIONS:
+        count = int(SAMPLE_RATE * seconds)
+        repeat = max(3, int(args.repeat / max(1.0, seconds)))
+        floats = (rng.standard_normal(count) * 0.2).astype(np.float32)
+        pcm = legacy_float32_to_int16(floats).tobytes()
+        samples = pcm16_view(pcm)
+
+        work = WorkBuffers()
+        out16 = np.empty(count, dtype=np.int16)
+        out32 = np.empty(count, dtype=np.float32)
+        scratch = np.empty(count, dtype=np.float32)
+
+        cases = (
+            ("wav", lambda: legacy_create_wav(pcm), lambda: create_wav_from_pcm(pcm)),
+            ("float32_to_int16", lambda: legacy_float32_to_int16(floats),
+             lambda: float32_to_int16(floats, out=out16, work=scratch)),
+            ("int16_to_float32", lambda: legacy_int16_to_float32(samples),
+             lambda: int16_to_float32(samples, out=out32)),
+            ("levels", lambda: legacy_levels(pcm), lambda: measure_levels(pcm, work=work)),
+            ("gain", lambda: float32_to_int16(legacy_int16_to_float32(samples) * 1.5),
+             lambda: apply_gain(pcm, 1.5, out=out16, work=work)),
+        )
+        for name, legacy, current in cases:
+            before = timeit(legacy, repeat)
+            after = timeit(current, repeat)
+            print(
+                f"buffer={label} op={name} legacy_us={before:.1f} "
+                f"current_us={after:.1f} speedup={before / after:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
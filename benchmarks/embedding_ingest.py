@@ -0,0 +1,228 @@
+"""
+Knowledge base ingestion benchmark against a local fake embedding server.
+
+Starts an OpenAI-compatible /v1/embeddings endpoint in a background thread
+with per-request and per-input latency and a requests-per-second limit that
+answers 429 with retry-after-ms, then ingests the same text twice:
+
+    legacy    one input per request through a new synchronous client, one
+              upsert per 10 chunks and a 1 s sleep between them (the old
+              PineconeService.create_or_update_knowledge_base loop)
+    pipeline  EmbeddingService.ingest: multi-input requests, adaptive
+              concurrency, upserts overlapped with embedding
+
+Upserts are modelled as a blocking sleep in a thread. Reported: wall time,
+embedding requests, 429 responses and event-loop lag during ingestion.
+With --edits, also reports how many chunks an update re-embeds and deletes
+after that many paragraphs are edited (content-hash diff against the manifest).
+
+Usage:
+    python -m benchmarks.embedding_ingest --chars 100000
+    python -m benchmarks.embedding_ingest --chars 500000 --rps 20 --skip-legacy
+    python -m benchmarks.embedding_ingest --chars 500000 --skip-legacy --edits 5
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import random
+import struct
+import threading
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import openai  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from backend.core.config import settings  # noqa: E402
+from backend.services.embedding_cache import EmbeddingCache  # noqa: E402
+from backend.services.embedding_service import EmbeddingService  # noqa: E402
+from backend.services.pinecone_service import PineconeService  # noqa: E402
+
+API_KEY = "sk-bench"
+
+
+class FakeEmbeddingServer:
+    """OpenAI-compatible embeddings endpoint with latency and a rate limit"""
+
+    def __init__(self, port: int, dimensions: int, request_ms: float, input_ms: float, rps: float):
+        self.port = port
+        self.dimensions = dimensions
+        self.request_ms = request_ms
+        self.input_ms = input_ms
+        self.rps = rps
+        self.requests = 0
+        self.rate_limited = 0
+        self._window_started = time.monotonic()
+        self._window_requests = 0
+        self._ready = threading.Event()
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        if now - self._window_started >= 1.0:
+            self._window_started, self._window_requests = now, 0
+        if self.rps and self._window_requests >= self.rps:
+            self.rate_limited += 1
+            retry_ms = int((1.0 - (now - self._window_started)) * 1000) + 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after-ms": str(retry_ms)}
+            )
+        self._window_requests += 1
+        self.requests += 1
+
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep((self.request_ms + self.input_ms * len(inputs)) / 1000)
+        vector = struct.pack(f"<{self.dimensions}f", *([0.01] * self.dimensions))
+        data = []
+        for index in range(len(inputs)):
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector).decode("ascii")
+            else:
+                embedding = [0.01] * self.dimensions
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        return web.json_response({
+            "object": "list", "data": data, "model": body.get("model"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _serve(self) -> None:
+        async def main():
+            app = web.Application(client_max_size=64 * 1024 * 1024)
+            app.router.add_post("/v1/embeddings", self.embeddings)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", self.port).start()
+            self._ready.set()
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
+
+    def start(self) -> "FakeEmbeddingServer":
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.rate_limited = 0
+
+
+def make_content(chars: int) -> str:
+    """Paragraphs of pseudo text, shaped like an uploaded document"""
+    rng = random.Random(42)
+    words = ["клиент", "заказ", "доставка", "оплата", "скидка", "адрес", "время", "курьер", "товар", "возврат"]
+    paragraphs, size = [], 0
+    while size < chars:
+        paragraph = " ".join(rng.choice(words) for _ in range(rng.randint(20, 80)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+async def monitor_loop_lag(samples: list, stop: asyncio.Event, interval: float = 0.01) -> None:
+    """Measure how late the loop wakes up compared to the requested sleep"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+def edit_diff(content: str, edits: int, seed: int = 7) -> dict:
+    """Chunks an update has to embed and delete after editing random paragraphs"""
+    rng = random.Random(seed)
+    paragraphs = content.split("\n\n")
+    for _ in range(edits):
+        index = rng.randrange(len(paragraphs))
+        paragraphs[index] = paragraphs[index] + " изменено"
+    manifest, _ = PineconeService.build_manifest(content)
+    chunk_ids, _ = PineconeService.build_manifest("\n\n".join(paragraphs))
+    added, removed = PineconeService.diff_chunks(chunk_ids, manifest)
+    return {"edits": edits, "chunks": len(chunk_ids), "reembedded": len(added), "deleted": len(removed)}
+
+
+def blocking_upsert(latency: float) -> None:
+    """Stand-in for the synchronous Pinecone index.upsert"""
+    time.sleep(latency)
+
+
+async def legacy_ingest(chunks: list, base_url: str, upsert_latency: float) -> None:
+    for start in range(0, len(chunks), 10):
+        vectors = []
+        for chunk in chunks[start:start + 10]:
+            client = openai.OpenAI(api_key=API_KEY, base_url=base_url)
+            response = client.embeddings.create(model=settings.EMBEDDING_MODEL, input=chunk)
+            vectors.append(response.data[0].embedding)
+        blocking_upsert(upsert_latency)
+        await asyncio.sleep(1)
+
+
+async def pipeline_ingest(chunks: list, upsert_latency: float) -> None:
+    # Свежий кэш без таблицы: каждый прогон честно считает эмбеддинги
+    service = EmbeddingService(cache=EmbeddingCache(persistent=False))
+
+    async def upsert(vectors: list) -> None:
+        await asyncio.to_thread(blocking_upsert, upsert_latency)
+
+    try:
+        await service.ingest(chunks, API_KEY, lambda ids, vectors: [{"id": i} for i in ids], upsert)
+    finally:
+        await service.close()
+
+
+async def run(mode: str, chunks: list, base_url: str, upsert_latency: float) -> dict:
+    samples: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(samples, stop))
+    started = time.perf_counter()
+    if mode == "legacy":
+        await legacy_ingest(chunks, base_url, upsert_latency)
+    else:
+        await pipeline_ingest(chunks, upsert_latency)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    samples.sort()
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 2),
+        "lag_p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 1) if samples else 0.0,
+        "lag_max_ms": round(samples[-1] * 1000, 1) if samples else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=100000, help="knowledge base size")
+    parser.add_argument("--port", type=int, default=8791)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--request-ms", type=float, default=150, help="fake server latency per request")
+    parser.add_argument("--input-ms", type=float, default=2, help="fake server latency per input")
+    parser.add_argument("--rps", type=float, default=10, help="fake server requests per second before 429")
+    parser.add_argument("--upsert-ms", type=float, default=80, help="modelled Pinecone upsert latency")
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--edits", type=int, default=0, help="paragraphs to edit for the update diff report")
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(args.port, args.dimensions, args.request_ms, args.input_ms, args.rps).start()
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    settings.EMBEDDING_API_BASE = base_url
+
+    content = make_content(args.chars)
+    chunks = PineconeService._process_text_into_chunks(content)
+    print(f"chars={args.chars} chunks={len(chunks)} batch_size={settings.EMBEDDING_BATCH_SIZE} "
+          f"max_concurrency={settings.EMBEDDING_MAX_CONCURRENCY} server_rps={args.rps}")
+    for mode in (("pipeline",) if args.skip_legacy else ("legacy", "pipeline")):
+        server.reset()
+        result = asyncio.run(run(mode, chunks, base_url, args.upsert_ms / 1000))
+        result.update(requests=server.requests, rate_limited=server.rate_limited)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+    if args.edits:
+        print(" ".join(f"{key}={value}" for key, value in edit_diff(content, args.edits).items()))
+
+
+if __name__ == "__main__":
+    main()
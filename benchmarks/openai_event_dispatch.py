@@ -0,0 +1,156 @@
+"""
+Throughput benchmark for routing OpenAI Realtime events to the browser.
+
+Replays an event stream through OpenAIEventRouter exactly as
+handle_openai_messages does (json.loads + dispatch) with the client send
+queue replaced by a sink, and reports events per second of CPU time on one
+core. The stream is either a recorded JSONL file (one raw server event per
+line) or a synthetic call of several turns.
+
+Usage:
+    python -m benchmarks.openai_event_dispatch --turns 20 --repeat 20
+    python -m benchmarks.openai_event_dispatch --events recorded_call.jsonl
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from backend.websockets.latency import CallLatencyRecorder, LatencyStats  # noqa: E402
+from backend.websockets.openai_events import OpenAIEventRouter, logger as router_logger  # noqa: E402
+from backend.websockets.protocol import AUDIO_TRANSPORT_BINARY, AUDIO_TRANSPORT_JSON  # noqa: E402
+from backend.websockets.session_resume import ConversationHistory  # noqa: E402
+
+# Размер дельты аудио: 100 мс PCM16 24 kHz
+DELTA_BYTES = 4800
+
+
+class SinkPipeline:
+    """Stand-in for OutboundPipeline that only counts what would be sent"""
+
+    def __init__(self):
+        self.items = 0
+
+    def put(self, payload: Any, audio: bool = False) -> bool:
+        self.items += 1
+        return True
+
+    def drop_audio(self) -> List[Any]:
+        return []
+
+
+def synthetic_call(turns: int, deltas_per_turn: int) -> List[str]:
+    """Raw server events of a call, shaped like a real gpt-4o-realtime session"""
+    audio = base64.b64encode(bytes(DELTA_BYTES)).decode("ascii")
+    events = [{"type": "session.created", "session": {"id": "sess_bench"}},
+              {"type": "session.updated", "session": {"id": "sess_bench"}}]
+    for turn in range(turns):
+        user_item, item, response = f"item_u{turn}", f"item_a{turn}", f"resp_{turn}"
+        events += [
+            {"type": "input_audio_buffer.speech_started", "audio_start_ms": turn * 5000, "item_id": user_item},
+            {"type": "input_audio_buffer.speech_stopped", "audio_end_ms": turn * 5000 + 1500, "item_id": user_item},
+            {"type": "input_audio_buffer.committed", "previous_item_id": None, "item_id": user_item},
+            {"type": "conversation.item.created", "item": {"id": user_item, "role": "user",
+                                                          "content": [{"type": "input_audio", "transcript": None}]}},
+            {"type": "response.created", "response": {"id": response, "status": "in_progress", "output": []}},
+            {"type": "response.output_item.added", "response_id": response, "item": {"id": item, "role": "assistant"}},
+            {"type": "conversation.item.created", "item": {"id": item, "role": "assistant", "content": []}},
+            {"type": "response.content_part.added", "response_id": response, "item_id": item,
+             "part": {"type": "audio", "transcript": ""}},
+        ]
+        for index in range(deltas_per_turn):
+            events.append({"type": "response.audio.delta", "response_id": response, "item_id": item,
+                           "output_index": 0, "content_index": 0, "delta": audio})
+            if index % 4 == 0:
+                events.append({"type": "response.audio_transcript.delta", "response_id": response, "item_id": item,
+                               "output_index": 0, "content_index": 0, "delta": "слово "})
+        events += [
+            {"type": "conversation.item.input_audio_transcription.completed", "item_id": user_item,
+             "content_index": 0, "transcript": "Какая сегодня погода?"},
+            {"type": "response.audio.done", "response_id": response, "item_id": item},
+            {"type": "response.audio_transcript.done", "response_id": response, "item_id": item,
+             "transcript": "слово " * (deltas_per_turn // 4)},
+            {"type": "response.content_part.done", "response_id": response, "item_id": item},
+            {"type": "response.output_item.done", "response_id": response, "item": {"id": item}},
+            {"type": "response.done", "response": {"id": response, "status": "completed",
+                                                   "output": [{"type": "message", "id": item}]}},
+            {"type": "rate_limits.updated", "rate_limits": []},
+        ]
+    return [json.dumps(event, ensure_ascii=False) for event in events]
+
+
+async def request_response() -> bool:
+    return True
+
+
+def make_router(audio_transport: str) -> OpenAIEventRouter:
+    openai_client = SimpleNamespace(
+        client_id="bench",
+        latency=CallLatencyRecorder("bench", "bench", stats=LatencyStats(size=256)),
+        enabled_functions=[],
+        assistant_config=None,
+        db_session=None,
+        conversation_record_id=None,
+        session_id="bench",
+        last_function_name=None,
+        history=ConversationHistory(),
+        create_response_after_function=request_response,
+    )
+    # Воспроизведение при повторе не идёт в реальном времени — перебивание сработало бы в каждой реплике
+    return OpenAIEventRouter(openai_client, SinkPipeline(), audio_transport, barge_in=False)
+
+
+async def replay(raw_events: List[str], audio_transport: str, repeat: int) -> float:
+    """
+    Replay the stream `repeat` times
+
+    Returns:
+        Events per second of process CPU time
+    """
+    started = time.process_time()
+    for _ in range(repeat):
+        router = make_router(audio_transport)
+        for raw in raw_events:
+            await router.dispatch(json.loads(raw))
+    return len(raw_events) * repeat / (time.process_time() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", help="JSONL file with recorded server events (one per line)")
+    parser.add_argument("--turns", type=int, default=20, help="turns of the synthetic call")
+    parser.add_argument("--deltas-per-turn", type=int, default=60, help="100 ms audio deltas per answer")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.events:
+        with open(args.events, encoding="utf-8") as stream:
+            raw_events = [line.strip() for line in stream if line.strip()]
+    else:
+        raw_events = synthetic_call(args.turns, args.deltas_per_turn)
+    audio_share = sum('"response.audio.delta"' in raw for raw in raw_events) / len(raw_events)
+    print(f"events={len(raw_events)} audio_delta_share={audio_share:.2f}")
+
+    # Вывод логов не измеряем: важна стоимость форматирования
+    router_logger.propagate = False
+    router_logger.addHandler(logging.NullHandler())
+    for level in (logging.INFO, logging.DEBUG):
+        router_logger.setLevel(level)
+        for transport in (AUDIO_TRANSPORT_JSON, AUDIO_TRANSPORT_BINARY):
+            rate = asyncio.run(replay(raw_events, transport, args.repeat))
+            print(
+                f"log_level={logging.getLevelName(level)} transport={transport} "
+                f"events_per_cpu_s={rate:,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Event-loop lag benchmark for conversation persistence in the realtime path.
+
+Simulates N concurrent calls that each persist a conversation update on every
+response.done. The DB round trip is modelled as a blocking sleep, executed
+either inline on the event loop (old behaviour) or through backend.db.executor.
+
+Usage:
+    python -m benchmarks.realtime_db_loop_lag --calls 500 --db-latency-ms 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from backend.db.executor import run_blocking, shutdown_db_executor  # noqa: E402
+
+
+def blocking_db_write(latency: float) -> None:
+    """Stand-in for query(...).get() + commit() against Postgres"""
+    time.sleep(latency)
+
+
+async def monitor_loop_lag(samples: list, stop: asyncio.Event, interval: float = 0.01) -> None:
+    """Measure how late the loop wakes up compared to the requested sleep"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def simulate_call(mode: str, turns: int, turn_gap: float, latency: float) -> None:
+    for _ in range(turns):
+        await asyncio.sleep(turn_gap)
+        if mode == "inline":
+            blocking_db_write(latency)
+        else:
+            await run_blocking(blocking_db_write, latency)
+
+
+async def run(mode: str, calls: int, turns: int, turn_gap: float, latency: float) -> dict:
+    samples: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(samples, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_call(mode, turns, turn_gap, latency) for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+
+    samples.sort()
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 2),
+        "lag_p50_ms": round(statistics.median(samples) * 1000, 2),
+        "lag_p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 2),
+        "lag_max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--turn-gap-ms", type=float, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    for mode in ("inline", "executor"):
+        result = asyncio.run(run(
+            mode, args.calls, args.turns, args.turn_gap_ms / 1000, args.db_latency_ms / 1000
+        ))
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+    shutdown_db_executor()
+
+
+if __name__ == "__main__":
+    main()
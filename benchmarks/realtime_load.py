@@ -0,0 +1,363 @@
+"""
+Load generator for the realtime widget endpoint.
+
+Opens N concurrent connections to /ws/{assistant_id}, each behaving like a
+browser widget: it streams PCM16 in real time (a spoken burst followed by
+silence), waits for the assistant to answer and starts the next turn. Run it
+against an app whose REALTIME_WS_URL points at benchmarks.realtime_stub_server
+to size workers without OpenAI costs, or against a staging app for end-to-end
+numbers.
+
+Reported per run:
+    connect_ms     time from opening the socket to connection_status
+    ttfa_ms        end of caller speech to the first assistant audio chunk
+    ping_rtt_ms    ping -> pong round trip during the call; the pong is queued
+                   by the same event loop that relays audio, so it tracks the
+                   server's event-loop lag under load
+    gen_lag_ms     event-loop lag of the generator itself (if high, the
+                   generator and not the server is the bottleneck)
+    server_cpu_pct / server_rss_mb and their per-connection share, sampled
+                   from /proc for --server-pid and its children
+
+Usage:
+    python -m benchmarks.realtime_stub_server --port 8765 &
+    REALTIME_WS_URL=ws://127.0.0.1:8765/v1/realtime uvicorn app:app --port 8000 &
+    python -m benchmarks.realtime_load --url ws://127.0.0.1:8000/ws/<assistant_id> \\
+        --connections 200 --ramp 20 --duration 120 --transport binary --server-pid <uvicorn pid>
+"""
+
+import argparse
+import array
+import asyncio
+import base64
+import json
+import math
+import os
+import statistics
+import time
+import wave
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlparse
+
+import websockets
+
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of a list of samples"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+    return {
+        "p50": round(statistics.median(ordered), 1),
+        "p95": round(pick(0.95), 1),
+        "p99": round(pick(0.99), 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+def tone(duration_ms: int, sample_rate: int, amplitude: int = 6000, frequency: float = 220.0) -> bytes:
+    """PCM16 sine burst standing in for a spoken phrase"""
+    count = sample_rate * duration_ms // 1000
+    step = 2 * math.pi * frequency / sample_rate
+    return array.array("h", (int(amplitude * math.sin(step * i)) for i in range(count))).tobytes()
+
+
+def load_speech(path: Optional[str], speech_ms: int) -> Tuple[bytes, int]:
+    """
+    Get the caller phrase
+
+    Args:
+        path: Mono 16-bit WAV file, or None for a synthetic tone
+        speech_ms: Duration of the synthetic tone
+
+    Returns:
+        PCM16 bytes and their sample rate
+    """
+    if not path:
+        return tone(speech_ms, SAMPLE_RATE), SAMPLE_RATE
+    with wave.open(path, "rb") as source:
+        if source.getnchannels() != 1 or source.getsampwidth() != SAMPLE_WIDTH:
+            raise SystemExit(f"{path}: expected mono 16-bit PCM")
+        return source.readframes(source.getnframes()), source.getframerate()
+
+
+class ProcessSampler:
+    """CPU time and RSS of a server process tree, read from /proc"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def _tree(self) -> List[int]:
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as children:
+                        pending += [int(child) for child in children.read().split()]
+            except OSError:
+                continue
+        return pids
+
+    def sample(self) -> Tuple[float, float]:
+        """
+        Returns:
+            CPU seconds consumed so far and resident memory in MB, summed over the tree
+        """
+        cpu, rss = 0.0, 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as stat:
+                    # Имя процесса может содержать пробелы — считаем поля после ")"
+                    fields = stat.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{pid}/statm") as statm:
+                    rss += int(statm.read().split()[1])
+            except (OSError, IndexError):
+                continue
+            cpu += (int(fields[11]) + int(fields[12])) / self.ticks
+        return cpu, rss * self.page_size / 1024 / 1024
+
+
+class LoadStats:
+    """Samples collected from all connections"""
+
+    def __init__(self):
+        self.connect_ms: List[float] = []
+        self.ttfa_ms: List[float] = []
+        self.ping_rtt_ms: List[float] = []
+        self.gen_lag_ms: List[float] = []
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.turns = 0
+        self.errors: Dict[str, int] = {}
+
+    def error(self, code: str) -> None:
+        self.errors[code] = self.errors.get(code, 0) + 1
+
+
+class WidgetConnection:
+    """One simulated widget"""
+
+    def __init__(self, args: argparse.Namespace, url: str, speech: bytes, sample_rate: int, stats: LoadStats):
+        self.args = args
+        self.url = url
+        self.speech = speech
+        self.frame_bytes = sample_rate * SAMPLE_WIDTH * args.frame_ms // 1000
+        self.silence = bytes(self.frame_bytes)
+        self.stats = stats
+        self.binary = args.transport == "binary"
+        self.speech_ended_at: Optional[float] = None
+        self.awaiting_audio = False
+        self.response_done = asyncio.Event()
+        self.pings: Deque[float] = deque()
+
+    async def run(self, stop_at: float) -> None:
+        started = time.perf_counter()
+        try:
+            ws = await asyncio.wait_for(
+                websockets.connect(self.url, max_size=None, ping_interval=None), self.args.connect_timeout
+            )
+        except Exception as e:
+            self.stats.failed += 1
+            self.stats.error(type(e).__name__)
+            return
+        try:
+            status = json.loads(await asyncio.wait_for(ws.recv(), self.args.connect_timeout))
+            if status.get("type") != "connection_status":
+                self.stats.failed += 1
+                self.stats.error((status.get("error") or {}).get("code", status.get("type", "unknown")))
+                return
+            self.stats.connect_ms.append((time.perf_counter() - started) * 1000)
+            self.stats.connected += 1
+
+            tasks = [asyncio.create_task(self.receive(ws)), asyncio.create_task(self.ping(ws, stop_at))]
+            try:
+                await self.talk(ws, stop_at)
+            finally:
+                for task in tasks:
+                    task.cancel()
+        except websockets.ConnectionClosed:
+            self.stats.dropped += 1
+        except asyncio.TimeoutError:
+            self.stats.failed += 1
+            self.stats.error("connection_status_timeout")
+        finally:
+            await ws.close()
+
+    async def send_audio(self, ws, chunk: bytes) -> None:
+        if self.binary:
+            await ws.send(chunk)
+        else:
+            await ws.send(json.dumps({"type": "input_audio_buffer.append",
+                                      "audio": base64.b64encode(chunk).decode("ascii")}))
+
+    async def stream(self, ws, pcm: bytes, stop_at: float, until: Optional[asyncio.Event] = None) -> None:
+        """Send PCM in frame_ms frames paced to real time"""
+        frame_time = self.args.frame_ms / 1000
+        next_at = time.perf_counter()
+        offset = 0
+        while time.perf_counter() < stop_at:
+            if until is None:
+                if offset >= len(pcm):
+                    return
+                chunk = pcm[offset:offset + self.frame_bytes]
+                offset += self.frame_bytes
+            elif until.is_set():
+                return
+            else:
+                chunk = self.silence
+            await self.send_audio(ws, chunk)
+            next_at += frame_time
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def talk(self, ws, stop_at: float) -> None:
+        while time.perf_counter() < stop_at:
+            self.response_done.clear()
+            await self.stream(ws, self.speech, stop_at)
+            self.speech_ended_at = time.perf_counter()
+            self.awaiting_audio = True
+            if self.args.commit:
+                await ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
+            # Как настоящий виджет, продолжаем слать тишину, пока ассистент отвечает
+            try:
+                await asyncio.wait_for(self.stream(ws, b"", stop_at, until=self.response_done), self.args.turn_timeout)
+            except asyncio.TimeoutError:
+                self.awaiting_audio = False
+                self.stats.error("turn_timeout")
+                continue
+            if self.response_done.is_set():
+                self.stats.turns += 1
+            await self.stream(ws, self.silence * (self.args.pause_ms // self.args.frame_ms), stop_at)
+
+    def on_first_audio(self) -> None:
+        if self.awaiting_audio:
+            self.awaiting_audio = False
+            self.stats.ttfa_ms.append((time.perf_counter() - self.speech_ended_at) * 1000)
+
+    async def receive(self, ws) -> None:
+        async for message in ws:
+            if isinstance(message, bytes):
+                self.on_first_audio()
+                continue
+            event = json.loads(message)
+            msg_type = event.get("type")
+            if msg_type == "response.audio.delta":
+                self.on_first_audio()
+            elif msg_type == "response.done":
+                if not any(item.get("type") == "function_call"
+                           for item in (event.get("response") or {}).get("output") or []):
+                    self.response_done.set()
+            elif msg_type == "pong":
+                # Сервер не возвращает event_id в pong — понги приходят по порядку
+                if self.pings:
+                    self.stats.ping_rtt_ms.append((time.perf_counter() - self.pings.popleft()) * 1000)
+            elif msg_type == "error":
+                self.stats.error((event.get("error") or {}).get("code", "error"))
+
+    async def ping(self, ws, stop_at: float) -> None:
+        while time.perf_counter() < stop_at:
+            await asyncio.sleep(self.args.ping_interval)
+            self.pings.append(time.perf_counter())
+            await ws.send(json.dumps({"type": "ping"}))
+
+
+async def monitor_loop_lag(samples: list, stop: asyncio.Event, interval: float = 0.01) -> None:
+    """Measure how late the loop wakes up compared to the requested sleep"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+
+def build_url(args: argparse.Namespace, sample_rate: int) -> str:
+    params = {"audio": args.transport, "ack": "none"}
+    if sample_rate != SAMPLE_RATE:
+        params["sample_rate"] = sample_rate
+    for pair in args.param:
+        key, _, value = pair.partition("=")
+        params[key] = value
+    separator = "&" if urlparse(args.url).query else "?"
+    return f"{args.url}{separator}{urlencode(params)}"
+
+
+async def run(args: argparse.Namespace) -> None:
+    speech, sample_rate = load_speech(args.wav, args.speech_ms)
+    url = build_url(args, sample_rate)
+    stats = LoadStats()
+    sampler = ProcessSampler(args.server_pid) if args.server_pid else None
+    baseline = sampler.sample() if sampler else None
+
+    stop = asyncio.Event()
+    lag_monitor = asyncio.create_task(monitor_loop_lag(stats.gen_lag_ms, stop))
+    started = time.perf_counter()
+    stop_at = started + args.ramp + args.duration
+    connections = []
+    for _ in range(args.connections):
+        widget = WidgetConnection(args, url, speech, sample_rate, stats)
+        connections.append(asyncio.create_task(widget.run(stop_at)))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.connections)
+
+    # Нагрузку на сервер меряем только после разгона, когда все соединения активны
+    steady = sampler.sample() if sampler else None
+    steady_at = time.perf_counter()
+    await asyncio.gather(*connections, return_exceptions=True)
+    if sampler:
+        # Пик памяти — в конце окна, пока звонки ещё не закрыты
+        cpu_end, rss_end = sampler.sample()
+    stop.set()
+    await lag_monitor
+
+    print(f"url={url} connections={args.connections} transport={args.transport} "
+          f"connected={stats.connected} failed={stats.failed} dropped={stats.dropped} turns={stats.turns} "
+          f"elapsed_s={time.perf_counter() - started:.1f}")
+    for name in ("connect_ms", "ttfa_ms", "ping_rtt_ms", "gen_lag_ms"):
+        values = percentiles(getattr(stats, name))
+        print(f"{name} n={len(getattr(stats, name))} " + " ".join(f"{key}={value}" for key, value in values.items()))
+    if sampler:
+        cpu_pct = (cpu_end - steady[0]) / (time.perf_counter() - steady_at) * 100
+        rss_delta = rss_end - baseline[1]
+        active = max(1, stats.connected)
+        print(f"server_cpu_pct={cpu_pct:.1f} cpu_pct_per_conn={cpu_pct / active:.3f} "
+              f"server_rss_mb={rss_end:.1f} rss_mb_per_conn={rss_delta / active:.2f}")
+    if stats.errors:
+        print("errors " + " ".join(f"{code}={count}" for code, count in sorted(stats.errors.items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="ws://host:port/ws/<assistant_id>")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds to open all connections")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of steady load after the ramp")
+    parser.add_argument("--transport", choices=("json", "binary"), default="binary")
+    parser.add_argument("--wav", help="mono 16-bit WAV used as the caller phrase")
+    parser.add_argument("--speech-ms", type=int, default=1500, help="synthetic phrase duration")
+    parser.add_argument("--pause-ms", type=int, default=1000, help="silence between turns")
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--commit", action="store_true", help="send input_audio_buffer.commit after each phrase")
+    parser.add_argument("--param", action="append", default=[], help="extra query parameter, e.g. vad=off")
+    parser.add_argument("--ping-interval", type=float, default=1.0)
+    parser.add_argument("--connect-timeout", type=float, default=15.0)
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--server-pid", type=int, help="app process to sample CPU and RSS from")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+Local stand-in for the OpenAI Realtime server, for load tests without paid sessions.
+
+Accepts the same WebSocket protocol as wss://api.openai.com/v1/realtime:
+answers session.update, runs a simple energy-based server VAD over appended
+PCM16 audio and, on every committed turn or response.create, replays the next
+response of a script with its original timing (session.created, transcripts,
+audio deltas, function calls, response.done).
+
+The script is either synthetic or a captured call. A capture is a JSONL file
+with one {"t": seconds, "event": {...}} object per server event; it can be
+recorded by running the stand-in as a proxy in front of the real API with
+--record. Point the app at the stand-in with
+
+    REALTIME_WS_URL=ws://127.0.0.1:8765/v1/realtime
+
+Usage:
+    python -m benchmarks.realtime_stub_server --port 8765
+    python -m benchmarks.realtime_stub_server --events captured_call.jsonl --speed 1.0
+    python -m benchmarks.realtime_stub_server --record captured_call.jsonl \\
+        --upstream "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
+"""
+
+import argparse
+import array
+import asyncio
+import base64
+import binascii
+import copy
+import itertools
+import json
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import websockets
+
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+# Поля событий с идентификаторами, которые переписываются при каждом повторе ответа
+ID_FIELDS = ("id", "response_id", "item_id", "call_id", "previous_item_id")
+# События, которые стенд генерирует сам в ответ на аудио и запросы клиента
+CLIENT_DRIVEN_PREFIXES = (
+    "session.", "input_audio_buffer.", "conversation.item.input_audio_transcription.",
+    "conversation.item.truncated", "conversation.item.deleted", "rate_limits.",
+)
+
+# (смещение в секундах от начала ответа, событие)
+ScriptedResponse = List[Tuple[float, Dict[str, Any]]]
+
+
+def synthetic_responses(
+    answer_ms: int,
+    first_audio_ms: int,
+    audio_speed: float,
+    function_every: int,
+    function_name: str,
+    function_arguments: str
+) -> Iterator[ScriptedResponse]:
+    """
+    Endless script of generated responses
+
+    Args:
+        answer_ms: Duration of each spoken answer
+        first_audio_ms: Delay between the start of a response and its first audio delta
+        audio_speed: How many times faster than real time audio is generated
+        function_every: Every Nth user turn first answers with a function call (0 = never)
+        function_name: Name of the called function
+        function_arguments: JSON arguments of the call
+
+    Yields:
+        Scripted responses
+    """
+    delta_ms = 100
+    audio = base64.b64encode(bytes(SAMPLE_RATE * SAMPLE_WIDTH * delta_ms // 1000)).decode("ascii")
+    for turn in itertools.count(1):
+        if function_every and turn % function_every == 0:
+            yield [
+                (0.0, {"type": "response.created", "response": {"id": "resp_fn", "status": "in_progress", "output": []}}),
+                (0.05, {"type": "response.output_item.added", "response_id": "resp_fn",
+                        "item": {"id": "item_fn", "type": "function_call", "name": function_name, "call_id": "call_fn"}}),
+                (first_audio_ms / 1000, {"type": "response.function_call_arguments.delta", "response_id": "resp_fn",
+                                         "item_id": "item_fn", "call_id": "call_fn", "delta": function_arguments}),
+                (first_audio_ms / 1000, {"type": "response.function_call_arguments.done", "response_id": "resp_fn",
+                                         "item_id": "item_fn", "call_id": "call_fn", "name": function_name,
+                                         "arguments": function_arguments}),
+                (first_audio_ms / 1000, {"type": "response.done", "response": {
+                    "id": "resp_fn", "status": "completed",
+                    "output": [{"id": "item_fn", "type": "function_call", "name": function_name, "call_id": "call_fn"}]}}),
+            ]
+
+        events: ScriptedResponse = [
+            (0.0, {"type": "response.created", "response": {"id": "resp", "status": "in_progress", "output": []}}),
+            (0.05, {"type": "response.output_item.added", "response_id": "resp",
+                    "item": {"id": "item", "type": "message", "role": "assistant"}}),
+            (0.05, {"type": "conversation.item.created", "item": {"id": "item", "type": "message", "role": "assistant"}}),
+            (0.05, {"type": "response.content_part.added", "response_id": "resp", "item_id": "item",
+                    "part": {"type": "audio", "transcript": ""}}),
+        ]
+        offset = first_audio_ms / 1000
+        for index in range(max(1, answer_ms // delta_ms)):
+            events.append((offset, {"type": "response.audio.delta", "response_id": "resp", "item_id": "item",
+                                    "output_index": 0, "content_index": 0, "delta": audio}))
+            if index % 4 == 0:
+                events.append((offset, {"type": "response.audio_transcript.delta", "response_id": "resp",
+                                        "item_id": "item", "output_index": 0, "content_index": 0,
+                                        "delta": f"word{index} "}))
+            offset += delta_ms / 1000 / audio_speed
+        events += [
+            (offset, {"type": "response.audio.done", "response_id": "resp", "item_id": "item"}),
+            (offset, {"type": "response.audio_transcript.done", "response_id": "resp", "item_id": "item",
+                      "transcript": f"stub answer {turn}"}),
+            (offset, {"type": "response.content_part.done", "response_id": "resp", "item_id": "item"}),
+            (offset, {"type": "response.output_item.done", "response_id": "resp",
+                      "item": {"id": "item", "type": "message", "role": "assistant"}}),
+            (offset, {"type": "response.done", "response": {
+                "id": "resp", "status": "completed", "output": [{"id": "item", "type": "message"}],
+                "usage": {"total_tokens": 0}}}),
+        ]
+        yield events
+
+
+def is_client_item(event: Dict[str, Any]) -> bool:
+    """Whether the event echoes an item added by the caller's audio or by the client"""
+    if event.get("type") != "conversation.item.created":
+        return False
+    item = event.get("item") or {}
+    return item.get("role") == "user" or item.get("type") == "function_call_output"
+
+
+def load_captured_responses(path: str) -> List[ScriptedResponse]:
+    """
+    Split a captured call into responses with timing relative to their trigger
+
+    Offsets are measured from the commit (or speech_stopped) that triggered the
+    response, so the recorded model latency is replayed as well. Events the
+    stand-in produces itself (VAD, transcription) are skipped.
+
+    Args:
+        path: JSONL capture, {"t": seconds, "event": {...}} per line
+
+    Returns:
+        Responses in recorded order
+    """
+    responses: List[ScriptedResponse] = []
+    current: Optional[ScriptedResponse] = None
+    anchor: Optional[float] = None
+    with open(path, encoding="utf-8") as capture:
+        for line in capture:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            t, event = float(entry.get("t", 0.0)), entry.get("event", entry)
+            msg_type = event.get("type", "")
+            if msg_type == "session.created":
+                # Начало следующей записанной сессии: время снова отсчитывается от нуля
+                current = None
+            if msg_type in ("session.created", "input_audio_buffer.committed", "input_audio_buffer.speech_stopped"):
+                anchor = t
+            if msg_type.startswith(CLIENT_DRIVEN_PREFIXES) or is_client_item(event):
+                continue
+            if msg_type == "response.created" or current is None:
+                current = []
+                responses.append(current)
+                if anchor is None:
+                    anchor = t
+            current.append((max(0.0, t - anchor), event))
+            if msg_type == "response.done":
+                current = None
+                anchor = t
+    return [response for response in responses if response]
+
+
+def rewrite_ids(event: Any, mapping: Dict[str, str], suffix: str) -> Any:
+    """Give every replayed response fresh IDs, consistent within the response"""
+    if isinstance(event, dict):
+        result = {}
+        for key, value in event.items():
+            if key in ID_FIELDS and isinstance(value, str):
+                result[key] = mapping.setdefault(value, f"{value}_{suffix}")
+            else:
+                result[key] = rewrite_ids(value, mapping, suffix)
+        return result
+    if isinstance(event, list):
+        return [rewrite_ids(value, mapping, suffix) for value in event]
+    return event
+
+
+def chunk_level(pcm: bytes) -> int:
+    """Mean absolute amplitude of a PCM16 chunk (every 8th sample)"""
+    samples = array.array("h")
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % SAMPLE_WIDTH])
+    sampled = samples[::8]
+    return sum(map(abs, sampled)) // len(sampled) if sampled else 0
+
+
+class StubSession:
+    """One client connection of the stand-in"""
+
+    def __init__(self, server: "StubRealtimeServer", ws):
+        self.server = server
+        self.ws = ws
+        self.session: Dict[str, Any] = {
+            "id": f"sess_{uuid.uuid4().hex[:16]}",
+            "object": "realtime.session",
+            "turn_detection": {"type": "server_vad", "silence_duration_ms": 300},
+        }
+        self.in_speech = False
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+        self.buffered_ms = 0.0
+        self.turns = 0
+        self.user_item: Optional[str] = None
+        self.response_id: Optional[str] = None
+        self.response_task: Optional[asyncio.Task] = None
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        event.setdefault("event_id", f"event_{uuid.uuid4().hex[:12]}")
+        async with self.send_lock:
+            await self.ws.send(json.dumps(event, ensure_ascii=False))
+
+    async def run(self) -> None:
+        await self.send({"type": "session.created", "session": self.session})
+        try:
+            async for raw in self.ws:
+                await self.on_client_event(json.loads(raw))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self.response_task:
+                self.response_task.cancel()
+
+    async def on_client_event(self, event: Dict[str, Any]) -> None:
+        msg_type = event.get("type")
+        if msg_type == "session.update":
+            self.session.update(event.get("session") or {})
+            await self.send({"type": "session.updated", "session": self.session})
+        elif msg_type == "input_audio_buffer.append":
+            await self.on_audio(binascii.a2b_base64(event.get("audio", "")))
+        elif msg_type == "input_audio_buffer.commit":
+            await self.commit()
+        elif msg_type == "input_audio_buffer.clear":
+            self.buffered_ms = self.speech_ms = self.silence_ms = 0.0
+            self.in_speech = False
+            await self.send({"type": "input_audio_buffer.cleared"})
+        elif msg_type == "response.create":
+            self.start_response()
+        elif msg_type == "response.cancel":
+            await self.cancel_response()
+        elif msg_type == "conversation.item.truncate":
+            await self.send({"type": "conversation.item.truncated", "item_id": event.get("item_id"),
+                             "content_index": event.get("content_index", 0),
+                             "audio_end_ms": event.get("audio_end_ms", 0)})
+        elif msg_type == "conversation.item.create":
+            item = dict(event.get("item") or {})
+            item.setdefault("id", f"item_{uuid.uuid4().hex[:12]}")
+            await self.send({"type": "conversation.item.created", "item": item})
+
+    async def on_audio(self, pcm: bytes) -> None:
+        duration_ms = len(pcm) / SAMPLE_WIDTH / SAMPLE_RATE * 1000
+        self.buffered_ms += duration_ms
+        if chunk_level(pcm) >= self.server.vad_level:
+            self.silence_ms = 0.0
+            self.speech_ms += duration_ms
+            if not self.in_speech and self.speech_ms >= self.server.min_speech_ms:
+                self.in_speech = True
+                await self.send({"type": "input_audio_buffer.speech_started",
+                                 "audio_start_ms": 0, "item_id": self.next_user_item()})
+            return
+        self.speech_ms = 0.0
+        if not self.in_speech:
+            return
+        self.silence_ms += duration_ms
+        silence_limit = (self.session.get("turn_detection") or {}).get("silence_duration_ms", 300)
+        if self.silence_ms >= silence_limit:
+            self.in_speech = False
+            await self.send({"type": "input_audio_buffer.speech_stopped",
+                             "audio_end_ms": int(self.buffered_ms), "item_id": self.user_item})
+            await self.commit()
+
+    def next_user_item(self) -> str:
+        self.user_item = f"item_user_{uuid.uuid4().hex[:12]}"
+        return self.user_item
+
+    async def commit(self) -> None:
+        item_id = self.user_item or self.next_user_item()
+        self.user_item = None
+        self.buffered_ms = 0.0
+        await self.send({"type": "input_audio_buffer.committed", "previous_item_id": None, "item_id": item_id})
+        await self.send({"type": "conversation.item.created", "item": {
+            "id": item_id, "type": "message", "role": "user",
+            "content": [{"type": "input_audio", "transcript": None}]}})
+        self.turns += 1
+        asyncio.get_running_loop().call_later(
+            self.server.transcription_delay, lambda: asyncio.ensure_future(self.send({
+                "type": "conversation.item.input_audio_transcription.completed",
+                "item_id": item_id, "content_index": 0, "transcript": f"stub caller turn {self.turns}"}))
+        )
+        self.start_response()
+
+    def start_response(self) -> None:
+        if self.response_task and not self.response_task.done():
+            self.response_task.cancel()
+        self.response_task = asyncio.create_task(self.play(self.server.next_response()))
+
+    async def play(self, response: ScriptedResponse) -> None:
+        suffix = uuid.uuid4().hex[:8]
+        mapping: Dict[str, str] = {}
+        started = time.monotonic()
+        try:
+            for offset, event in response:
+                delay = started + offset / self.server.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                event = rewrite_ids(copy.deepcopy(event), mapping, suffix)
+                event.pop("event_id", None)
+                if event.get("type") == "response.created":
+                    self.response_id = (event.get("response") or {}).get("id")
+                await self.send(event)
+            self.server.responses += 1
+        except asyncio.CancelledError:
+            pass
+
+    async def cancel_response(self) -> None:
+        if not self.response_task or self.response_task.done():
+            await self.send({"type": "error", "error": {
+                "type": "invalid_request_error", "code": "response_cancel_not_active",
+                "message": "Cancellation failed: no active response found"}})
+            return
+        self.response_task.cancel()
+        await self.send({"type": "response.done", "response": {
+            "id": self.response_id, "status": "cancelled", "output": []}})
+
+
+class StubRealtimeServer:
+    """Serves scripted realtime sessions to any number of connections"""
+
+    def __init__(
+        self,
+        responses: Iterator[ScriptedResponse],
+        speed: float = 1.0,
+        vad_level: int = 500,
+        min_speech_ms: int = 60,
+        transcription_delay: float = 0.3
+    ):
+        """
+        Initialize the server
+
+        Args:
+            responses: Script of responses, consumed round robin across connections
+            speed: Timing multiplier for replayed responses (2.0 = twice as fast)
+            vad_level: Mean absolute PCM16 amplitude counted as speech
+            min_speech_ms: Speech needed before speech_started
+            transcription_delay: Seconds between commit and the caller transcript
+        """
+        self._responses = responses
+        self.speed = speed
+        self.vad_level = vad_level
+        self.min_speech_ms = min_speech_ms
+        self.transcription_delay = transcription_delay
+        self.connections = 0
+        self.active = 0
+        self.responses = 0
+
+    def next_response(self) -> ScriptedResponse:
+        return next(self._responses)
+
+    async def handle(self, ws, path: str = None) -> None:
+        self.connections += 1
+        self.active += 1
+        try:
+            await StubSession(self, ws).run()
+        finally:
+            self.active -= 1
+
+
+async def record_proxy(ws, path: str, upstream: str, record_path: str) -> None:
+    """Forward a session to the real API and append its server events to a capture"""
+    headers = [(name, value) for name, value in ws.request_headers.raw_items()
+               if name.lower() in ("authorization", "openai-beta")]
+    started = time.monotonic()
+    async with websockets.connect(upstream, extra_headers=headers, max_size=None) as upstream_ws:
+        async def client_to_upstream():
+            async for message in ws:
+                await upstream_ws.send(message)
+
+        async def upstream_to_client():
+            async for message in upstream_ws:
+                lines.append(json.dumps({"t": round(time.monotonic() - started, 4),
+                                         "event": json.loads(message)}, ensure_ascii=False))
+                await ws.send(message)
+
+        # Сессия пишется целиком при закрытии, чтобы параллельные звонки не перемешивались
+        lines: List[str] = []
+        tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            with open(record_path, "a", encoding="utf-8") as capture:
+                capture.writelines(line + "\n" for line in lines)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    if args.record:
+        async def handler(ws, path=None):
+            await record_proxy(ws, path, args.upstream, args.record)
+        print(f"Recording sessions from {args.upstream} to {args.record}")
+    else:
+        if args.events:
+            captured = load_captured_responses(args.events)
+            if not captured:
+                raise SystemExit(f"No responses found in {args.events}")
+            responses = itertools.cycle(captured)
+            print(f"Replaying {len(captured)} captured responses from {args.events}")
+        else:
+            responses = synthetic_responses(
+                args.answer_ms, args.first_audio_ms, args.audio_speed,
+                args.function_every, args.function_name, args.function_arguments
+            )
+        stub = StubRealtimeServer(responses, args.speed, args.vad_level, args.min_speech_ms)
+        handler = stub.handle
+
+    async with websockets.serve(handler, args.host, args.port, max_size=None, ping_interval=None):
+        print(f"Realtime stand-in listening on ws://{args.host}:{args.port}/v1/realtime")
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            if not args.record:
+                print(f"connections={stub.connections} active={stub.active} responses={stub.responses}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--events", help="captured call to replay (JSONL)")
+    parser.add_argument("--speed", type=float, default=1.0, help="timing multiplier for replayed responses")
+    parser.add_argument("--answer-ms", type=int, default=3000, help="synthetic answer duration")
+    parser.add_argument("--first-audio-ms", type=int, default=450, help="synthetic model latency to first audio")
+    parser.add_argument("--audio-speed", type=float, default=3.0, help="synthetic generation speed vs real time")
+    parser.add_argument("--function-every", type=int, default=0, help="every Nth turn calls a function first")
+    parser.add_argument("--function-name", default="search_pinecone")
+    parser.add_argument("--function-arguments", default='{"query": "opening hours"}')
+    parser.add_argument("--vad-level", type=int, default=500, help="mean abs PCM16 amplitude counted as speech")
+    parser.add_argument("--min-speech-ms", type=int, default=60)
+    parser.add_argument("--record", help="proxy to --upstream and append server events to this capture")
+    parser.add_argument("--upstream", default="wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
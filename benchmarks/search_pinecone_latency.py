@@ -0,0 +1,175 @@
+"""
+Knowledge base search latency and event-loop blocking benchmark.
+
+Starts a fake OpenAI embeddings endpoint and a fake Pinecone /query endpoint
+with fixed latency, then runs concurrent searches (one per simulated call)
+twice:
+
+    legacy  two blocking requests.post calls inside the coroutine (the old
+            PineconeSearchFunction.execute)
+    async   PineconeSearchFunction.execute: embedding through the shared
+            async client and its cache, query over the pooled aiohttp session
+
+Reported: wall time, search latency p50/p99 and event-loop lag while the
+searches run. Lag is what every other call on the worker waits for.
+
+Usage:
+    python -m benchmarks.search_pinecone_latency --calls 20
+    python -m benchmarks.search_pinecone_latency --calls 50 --query-ms 80 --skip-legacy
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("PINECONE_API_KEY", "pc-bench")
+
+import requests  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from backend.core.config import settings  # noqa: E402
+from backend.functions.search_pinecone import PineconeSearchFunction  # noqa: E402
+from backend.services.embedding_cache import EmbeddingCache  # noqa: E402
+from backend.services.embedding_service import embedding_service  # noqa: E402
+from backend.services.pinecone_query import pinecone_query  # noqa: E402
+from benchmarks.embedding_ingest import API_KEY, FakeEmbeddingServer, monitor_loop_lag  # noqa: E402
+
+
+class FakePineconeServer:
+    """Pinecone data plane /query endpoint with fixed latency"""
+
+    def __init__(self, port: int, query_ms: float, top_k: int = 3):
+        self.port = port
+        self.query_ms = query_ms
+        self.top_k = top_k
+        self.requests = 0
+        self._ready = threading.Event()
+
+    async def query(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        await asyncio.sleep(self.query_ms / 1000)
+        matches = [
+            {"id": f"{body['namespace']}-{i}", "score": 0.9 - i / 10, "metadata": {"text": "фрагмент"}}
+            for i in range(body.get("topK", self.top_k))
+        ]
+        return web.json_response({"matches": matches, "namespace": body["namespace"]})
+
+    def _serve(self) -> None:
+        async def main():
+            app = web.Application()
+            app.router.add_post("/query", self.query)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", self.port).start()
+            self._ready.set()
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
+
+    def start(self) -> "FakePineconeServer":
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+        return self
+
+
+async def legacy_search(query: str, embeddings_url: str, pinecone_url: str) -> dict:
+    embed_response = requests.post(
+        embeddings_url,
+        headers={"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"},
+        json={"input": query, "model": settings.EMBEDDING_MODEL}
+    )
+    embedding = embed_response.json()["data"][0]["embedding"]
+    response = requests.post(
+        pinecone_url,
+        headers={"Api-Key": "pc-bench", "Content-Type": "application/json"},
+        json={"vector": embedding, "namespace": "bench", "topK": 3, "includeMetadata": True}
+    )
+    return response.json()
+
+
+async def async_search(query: str) -> dict:
+    result = await PineconeSearchFunction.execute({"namespace": "bench", "query": query})
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+
+async def run(mode: str, calls: int, repeat: float, embeddings_url: str, pinecone_url: str) -> dict:
+    # Доля повторных вопросов: они берутся из кэша эмбеддингов
+    distinct = max(1, int(calls * (1 - repeat)))
+    queries = [f"вопрос номер {i % distinct}" for i in range(calls)]
+    latencies: list = []
+
+    async def one(query: str) -> None:
+        started = time.perf_counter()
+        if mode == "legacy":
+            await legacy_search(query, embeddings_url, pinecone_url)
+        else:
+            await async_search(query)
+        latencies.append(time.perf_counter() - started)
+
+    if mode == "async":
+        # Как при старте приложения: пул соединений создаётся до звонков
+        embedding_service.http_client()
+
+    samples: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    if mode == "async":
+        # Сессии привязаны к циклу событий прогона
+        await pinecone_query.close()
+        await embedding_service.close()
+
+    latencies.sort()
+    samples.sort()
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 2),
+        "search_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "search_p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000, 1),
+        "lag_p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 1) if samples else 0.0,
+        "lag_max_ms": round(samples[-1] * 1000, 1) if samples else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="concurrent searches")
+    parser.add_argument("--repeat", type=float, default=0.5, help="share of repeated questions")
+    parser.add_argument("--embedding-port", type=int, default=8792)
+    parser.add_argument("--pinecone-port", type=int, default=8793)
+    parser.add_argument("--embedding-ms", type=float, default=150, help="fake embedding latency per request")
+    parser.add_argument("--query-ms", type=float, default=60, help="fake Pinecone query latency")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    FakeEmbeddingServer(args.embedding_port, 1536, args.embedding_ms, 0, 0).start()
+    FakePineconeServer(args.pinecone_port, args.query_ms).start()
+    embeddings_url = f"http://127.0.0.1:{args.embedding_port}/v1"
+    pinecone_url = f"http://127.0.0.1:{args.pinecone_port}"
+    settings.EMBEDDING_API_BASE = embeddings_url
+    pinecone_query.host = pinecone_url
+    os.environ["OPENAI_API_KEY"] = API_KEY
+    # Кэш только в памяти процесса: бенчмарку не нужна таблица embedding_cache
+    embedding_service.cache = EmbeddingCache(persistent=False)
+
+    print(f"calls={args.calls} repeat={args.repeat} embedding_ms={args.embedding_ms} query_ms={args.query_ms}")
+    for mode in (("async",) if args.skip_legacy else ("legacy", "async")):
+        result = asyncio.run(run(
+            mode, args.calls, args.repeat, f"{embeddings_url}/embeddings", f"{pinecone_url}/query"
+        ))
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()